@@ -0,0 +1,322 @@
+import itertools
+from contextlib import closing
+from array import array
+from typing import NamedTuple
+from constants import *
+from utils import *
+from exposure import *
+from record_io import *
+import numpy as np
+
+# Code of the null label of every key
+NULL_CODE = 0
+
+def get_time_bucket(time, bucket_minutes=AGGREGATE_TIME_BUCKET_MINUTES):
+    """Return the time of day bucket number of a time cell (ie: "14:30" with 60 minute buckets -> 14). None if the
+    time is null or invalid
+
+    Args:
+        time (str): start_time or end_time cell of an exposure
+        bucket_minutes (int, optional): length of a bucket. Defaults to AGGREGATE_TIME_BUCKET_MINUTES.
+    """
+    minutes = parse_time(time)
+    return None if minutes is None else minutes // bucket_minutes
+
+def get_time_bucket_label(bucket, bucket_minutes=AGGREGATE_TIME_BUCKET_MINUTES):
+    """Return the label of a time of day bucket (ie: 14 with 60 minute buckets -> "14:00-15:00")"""
+    start = bucket*bucket_minutes
+    end = start + bucket_minutes
+    return f"{start//60:02d}:{start%60:02d}-{end//60:02d}:{end%60:02d}"
+
+class Vocabulary:
+    """Assigns a small integer code to every distinct label of a column. Code NULL_CODE is always "null" """
+
+    def __init__(self):
+        self.labels = ["null"]
+        self.codes = {"null": NULL_CODE}
+
+    def __len__(self):
+        return len(self.labels)
+
+    def code(self, label):
+        """Return the code of a label, adding it if it has not been seen yet. None is null"""
+        if label is None:
+            return NULL_CODE
+        code = self.codes.get(label)
+        if code is None:
+            code = len(self.labels)
+            self.codes[label] = code
+            self.labels.append(label)
+        return code
+
+class ExposureColumns(NamedTuple):
+    """Exposures stored column by column as integer codes (see read_exposure_columns)"""
+    building: np.ndarray      # building code vocabulary code of each exposure
+    class_name: np.ndarray    # class name vocabulary code of each exposure
+    weekday_mask: np.ndarray  # weekdays of each exposure (see get_weekday_mask)
+    time: np.ndarray          # start time bucket + 1 of each exposure, NULL_CODE if unknown
+    date: np.ndarray          # snapshot date vocabulary code of each exposure
+    labels: dict              # key -> list of labels indexed by code
+    bucket_minutes: int       # length of the time of day buckets
+
+def get_column_labels(buildings, classes, dates, time_col, bucket_minutes):
+    """Return the labels of every key of an ExposureColumns from its vocabularies and time bucket codes"""
+    max_bucket = int(time_col.max(initial=NULL_CODE))
+    return {
+        "building": buildings.labels,
+        "class": classes.labels,
+        "weekday": ["null", *WEEKDAYS],
+        "time": ["null", *(get_time_bucket_label(b, bucket_minutes) for b in range(max_bucket))],
+        "date": dates.labels,
+    }
+
+def get_time_bucket_code(time, bucket_minutes=AGGREGATE_TIME_BUCKET_MINUTES):
+    """Return the time column code of a time cell (bucket + 1, NULL_CODE if the time is null or invalid)"""
+    bucket = get_time_bucket(time, bucket_minutes)
+    return NULL_CODE if bucket is None else bucket + 1
+
+def find_exposure_files(paths):
+    """Return every record file (csv, ndjson, parquet, ...) in the given files and folders (folders are not 
+    searched recursively)"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(p for p in Path(path).iterdir() if p.is_file() and get_record_format(p) is not None))
+        else:
+            files.append(Path(path))
+    return files
+
+def read_exposure_columns(paths, bucket_minutes=AGGREGATE_TIME_BUCKET_MINUTES, delim=","):
+    """Stream every parser output file into columnar arrays. Files are read one row at a time so memory only
+    grows with the number of exposures, not with the size of the files. Rows that are too short are skipped.
+
+    Args:
+        paths (list): parser output files in any format of record_io.py (with or without building information)
+        bucket_minutes (int, optional): length of the time of day buckets. Defaults to AGGREGATE_TIME_BUCKET_MINUTES.
+        delim (str, optional): Delimiter for csv. Defaults to ",".
+
+    Returns:
+        [ExposureColumns]: the exposures of every file
+    """
+    buildings, classes, dates = Vocabulary(), Vocabulary(), Vocabulary()
+    weekday_masks = {}
+    time_buckets = {}
+    building_col, class_col, weekday_col, time_col, date_col = (array("i") for _ in range(5))
+
+    for path in paths:
+        date_code = dates.code(get_snapshot_date(path))
+        # Columnar files only decode the exposure columns, the building columns are never read
+        with closing(iter_records(path, EXPOSURE_HEADER, delim)) as records:
+            rows = records
+            columns = {name: i for i, name in enumerate(EXPOSURE_HEADER)}
+            header = next(rows, None)
+            if header is None:
+                continue
+            if tuple(header[:len(EXPOSURE_HEADER)]) == EXPOSURE_HEADER:
+                columns = {name: i for i, name in enumerate(header)}
+            else:
+                # File without a header, the first line is an exposure
+                rows = itertools.chain([header], rows)
+
+            location_i, class_i = columns["location"], columns["class_name"]
+            weekday_i, time_i = columns["weekday"], columns["start_time"]
+            min_len = max(location_i, class_i, weekday_i, time_i) + 1
+            for row in rows:
+                if len(row) < min_len:
+                    continue
+
+                # Cells missing from a record (None, ie: an ndjson record without the key) are null
+                location = row[location_i] or "null"
+                class_name = row[class_i] or "null"
+                building_col.append(buildings.code(get_building_code(location)))
+                class_col.append(classes.code(class_name if class_name.lower() != "null" else None))
+
+                weekday = row[weekday_i] or "null"
+                mask = weekday_masks.get(weekday)
+                if mask is None:
+                    mask = weekday_masks[weekday] = get_weekday_mask(weekday)
+                weekday_col.append(mask)
+
+                time = row[time_i] or "null"
+                bucket = time_buckets.get(time)
+                if bucket is None:
+                    bucket = time_buckets[time] = get_time_bucket_code(time, bucket_minutes)
+                time_col.append(bucket)
+
+                date_col.append(date_code)
+
+    as_array = lambda column: np.frombuffer(column, dtype=np.int32) if len(column) > 0 else np.zeros(0, np.int32)
+    building_col, class_col, weekday_col, time_col, date_col = map(as_array, (building_col, class_col, 
+                                                                              weekday_col, time_col, date_col))
+    labels = get_column_labels(buildings, classes, dates, time_col, bucket_minutes)
+    return ExposureColumns(building_col, class_col, weekday_col, time_col, date_col, labels, bucket_minutes)
+
+def encode_unique(values, function):
+    """Return function(value) for every value of a bytes array, calling function once per distinct value
+
+    Args:
+        values (np.ndarray): utf8 bytes array
+        function (callable): str -> int
+    """
+    uniques, inverse = np.unique(values, return_inverse=True)
+    codes = np.array([function(u.decode("utf8")) for u in uniques.tolist()], dtype=np.int32)
+    return codes[inverse.reshape(-1)] if len(values) > 0 else np.zeros(0, np.int32)
+
+def read_history_columns(store, start=None, end=None, buildings=None, bucket_minutes=AGGREGATE_TIME_BUCKET_MINUTES):
+    """Read the exposures of a history store into columnar arrays. Chunks are memory mapped and every distinct
+    value is only decoded once, nothing is parsed row by row.
+
+    Args:
+        store (HistoryStore): exposure history store
+        start (str, optional): first snapshot date (YYYY-MM-DD). Defaults to the first snapshot.
+        end (str, optional): last snapshot date (YYYY-MM-DD). Defaults to the last snapshot.
+        buildings (list, optional): building codes to read (ie: ["JFF"]). Defaults to every building.
+        bucket_minutes (int, optional): length of the time of day buckets. Defaults to AGGREGATE_TIME_BUCKET_MINUTES.
+
+    Returns:
+        [ExposureColumns]: the exposures of every matching snapshot
+    """
+    building_vocab, class_vocab, date_vocab = Vocabulary(), Vocabulary(), Vocabulary()
+    parts = {key: [] for key in ("building", "class", "weekday", "time", "date")}
+    for chunk, arrays in store.iter_chunks(start, end, buildings, ("class_name", "weekday", "start_time")):
+        # Rows of a chunk are sorted by building code, so the codes come straight from the index (in the order
+        # iter_chunks read them)
+        ranges = store.get_building_ranges(chunk, buildings)
+        lengths = [e - s for _, s, e in ranges]
+        codes = [building_vocab.code(code if code != "null" else None) for code, _, _ in ranges]
+        parts["building"].append(np.repeat(np.array(codes, dtype=np.int32), lengths))
+        parts["class"].append(encode_unique(arrays["class_name"], 
+                                            lambda c: class_vocab.code(c if c.lower() != "null" else None)))
+        parts["weekday"].append(encode_unique(arrays["weekday"], get_weekday_mask))
+        parts["time"].append(encode_unique(arrays["start_time"], lambda t: get_time_bucket_code(t, bucket_minutes)))
+        parts["date"].append(np.full(sum(lengths), date_vocab.code(chunk["date"]), dtype=np.int32))
+
+    building_col, class_col, weekday_col, time_col, date_col = (
+        np.concatenate(p) if len(p) > 0 else np.zeros(0, np.int32) for p in parts.values())
+    labels = get_column_labels(building_vocab, class_vocab, date_vocab, time_col, bucket_minutes)
+    return ExposureColumns(building_col, class_col, weekday_col, time_col, date_col, labels, bucket_minutes)
+
+class AggregateTable(NamedTuple):
+    """Number of exposures of every group (see aggregate)"""
+    by: tuple          # keys the exposures were grouped by
+    codes: np.ndarray  # (groups x keys) label code of each group
+    counts: np.ndarray # number of exposures in each group
+    labels: dict       # key -> list of labels indexed by code
+
+def get_key_codes(columns, by):
+    """Return the code array of each key and the row each entry comes from. Exposures on several weekdays are
+    repeated once per weekday when grouping by weekday.
+
+    Args:
+        columns (ExposureColumns): exposures
+        by (tuple): keys to group by
+
+    Returns:
+        tuple: (list of code arrays in the order of by, array of row numbers)
+    """
+    rows = np.arange(len(columns.building))
+    weekday_codes = None
+    if "weekday" in by:
+        bits = (columns.weekday_mask[:, None] >> np.arange(len(WEEKDAYS))) & 1
+        day_rows, day_nums = np.nonzero(bits)
+        # Exposures without a weekday are kept once as null
+        null_rows = np.flatnonzero(columns.weekday_mask == 0)
+        rows = np.concatenate([day_rows, null_rows])
+        weekday_codes = np.concatenate([day_nums + 1, np.full(len(null_rows), NULL_CODE)]).astype(np.int32)
+
+    key_arrays = {
+        "building": columns.building,
+        "class": columns.class_name,
+        "time": columns.time,
+        "date": columns.date,
+    }
+    codes = [weekday_codes if key == "weekday" else key_arrays[key][rows] for key in by]
+    return codes, rows
+
+def aggregate(columns, by=("building",), drop_null=True):
+    """Count the exposures of every combination of the given keys
+
+    Args:
+        columns (ExposureColumns): exposures (see read_exposure_columns)
+        by (tuple, optional): keys to group by (see AGGREGATE_KEYS). Defaults to ("building",).
+        drop_null (bool, optional): do not count exposures with a null value for any of the keys. Defaults to True.
+
+    Returns:
+        [AggregateTable]: count of every group, largest first
+    """
+    by = tuple(by)
+    for key in by:
+        if key not in AGGREGATE_KEYS:
+            raise ValueError(f"Unknown aggregate key \"{key}\" (expected one of {', '.join(AGGREGATE_KEYS)})")
+    if len(by) == 0:
+        raise ValueError("At least one aggregate key is needed")
+
+    codes, _ = get_key_codes(columns, by)
+    codes = np.stack(codes, axis=1) if len(codes[0]) > 0 else np.zeros((0, len(by)), np.int64)
+    if drop_null:
+        codes = codes[np.all(codes != NULL_CODE, axis=1)]
+
+    # Combine the codes into a single integer per row so groups can be counted in one pass
+    dims = tuple(len(columns.labels[key]) for key in by)
+    if len(codes) > 0 and np.prod(dims, dtype=np.float64) < 2**62:
+        flat = np.ravel_multi_index(tuple(codes.T), dims)
+        groups, counts = np.unique(flat, return_counts=True)
+        group_codes = np.stack(np.unravel_index(groups, dims), axis=1)
+    else:
+        group_codes, counts = np.unique(codes, axis=0, return_counts=True)
+
+    # Largest groups first, ties in code order
+    order = np.lexsort((*group_codes.T[::-1], -counts))
+    return AggregateTable(by, group_codes[order], counts[order], columns.labels)
+
+def top_n(table, n, per=()):
+    """Return the n largest groups of the table, or the n largest groups within each combination of the per keys
+    (ie: the 5 buildings with the most exposures on each snapshot date with by=("date", "building"), per=("date",))
+
+    Args:
+        table (AggregateTable): aggregated counts
+        n (int): number of groups to keep
+        per (tuple, optional): keys of the table to rank within. Defaults to ranking the whole table.
+
+    Returns:
+        [AggregateTable]: largest groups first (grouped by the per keys if given)
+    """
+    per_cols = [table.by.index(key) for key in per]
+    if len(per_cols) == 0:
+        return table._replace(codes=table.codes[:n], counts=table.counts[:n])
+
+    # Sort by the per keys and then by count, the rank of a group is its position within its per keys
+    per_codes = [table.codes[:, col] for col in per_cols]
+    order = np.lexsort((np.arange(len(table.counts)), -table.counts, *per_codes[::-1]))
+    sorted_per = np.stack([c[order] for c in per_codes], axis=1)
+    new_group = np.ones(len(order), dtype=bool)
+    new_group[1:] = np.any(sorted_per[1:] != sorted_per[:-1], axis=1)
+    group_starts = np.flatnonzero(new_group)
+    ranks = np.arange(len(order)) - np.repeat(group_starts, np.diff(np.append(group_starts, len(order))))
+    keep = order[ranks < n]
+    return table._replace(codes=table.codes[keep], counts=table.counts[keep])
+
+def table_rows(table, header=True):
+    """Yield every group of the table as a row of labels followed by its count
+
+    Args:
+        table (AggregateTable): aggregated counts
+        header (bool, optional): yield the key names first. Defaults to True.
+    """
+    if header:
+        yield (*table.by, "count")
+    key_labels = [table.labels[key] for key in table.by]
+    for codes, count in zip(table.codes.tolist(), table.counts.tolist()):
+        yield (*(labels[code] for labels, code in zip(key_labels, codes)), count)
+
+def write_table(table, f, header=True, delim=",", newline="\n"):
+    """Write the table as csv to the file object f (see table_rows)
+
+    Args:
+        table (AggregateTable): aggregated counts
+        f (file): writable text file opened with newline=""
+        header (bool, optional): write the key names first. Defaults to True.
+        delim (str, optional): Delimiter for csv. Defaults to ",".
+        newline (str, optional): Newline for csv. Defaults to "\\n".
+    """
+    write_rows(table_rows(table, header), f, delim, newline)
@@ -0,0 +1,470 @@
+import argparse
+import json
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from constants import *
+from exposure import *
+import numpy as np
+
+# Default sizes of every suite (number of exposure lines, directory rows, outline features, geojson names or
+# command starts)
+SUITE_SIZES = {
+    "records": [10000, 100000],
+    "cases": [10000, 100000],
+    "directory": [1000, 10000],
+    "outlines": [1000, 5000],
+    "similarity": [1000, 5000],
+    "startup": [5],
+}
+
+# Longest a light command may take to start on top of the interpreter itself (seconds)
+STARTUP_BUDGET = 0.1
+
+# cli.py arguments timed by the startup suite, and whether they are light enough to be held to STARTUP_BUDGET
+STARTUP_COMMANDS = [
+    (["--help"], True),
+    (["parse", "--help"], True),
+    (["geocode", "--help"], True),
+    (["sum", "--help"], True),
+    (["map-outlines", "--help"], True),
+    (["similarity", "--help"], True),
+    (["heatmap", "--help"], True),
+]
+
+# Number of buildings in the generated building code maps
+BENCHMARK_BUILDINGS = 300
+
+NAME_WORDS = ["Hall", "Center", "Building", "Library", "House", "Annex", "Tower", "Engineering", "Science", "Music",
+              "Arts", "Ronald", "Tutor", "Waite", "Phillips", "Doheny", "Memorial", "Research", "Student", "Union"]
+
+def generate_splits(n, seed=0):
+    """Generate n synthetic parsed exposure lines (the output of parse_page_strong_text). Roughly one in ten
+    lines is malformed in one of the ways validate_rows rejects.
+
+    Args:
+        n (int): number of lines
+        seed (int, optional): random seed. Defaults to 0.
+    """
+    rng = random.Random(seed)
+    departments = ["BUAD", "CSCI", "WRIT", "MATH", "AME", "AMST", "PHYS", "ECON"]
+    buildings = ["JFF", "SGM", "THH", "VKC", "WPH", "GFS", "MHP", "ZHS"]
+    weekdays = ["MW", "TH", "F", "MWF", "T", "H"]
+    splits = []
+    for _ in range(n):
+        hour = rng.randint(8, 20)
+        line = [
+            f"{rng.choice(departments)}-{rng.randint(100, 599)}",
+            str(rng.randint(10000, 99999)),
+            rng.choice(weekdays),
+            f"{hour:02d}:00",
+            f"{hour+1:02d}:50",
+            f"{rng.choice(buildings)}{rng.randint(100, 399)}",
+        ]
+        if rng.random() < 0.1:
+            error = rng.randrange(4)
+            if error == 0:
+                line[1] = line[1] + "a"            # rejected: class code not numeric
+            elif error == 1:
+                line[0] = line[0].replace("-", "") # rejected: invalid class field
+            elif error == 2:
+                line[5] = line[5] + "é"            # rejected: location is not ascii
+            else:
+                line = line[:3]                    # filled with nulls, rejected: invalid length
+        splits.append(line)
+    return splits
+
+def generate_cases_page(n, seed=0):
+    """Generate a covid notification page with n exposure <strong> lines (see generate_splits) along with the
+    headings and other <strong> elements real pages have.
+
+    Args:
+        n (int): number of exposure lines
+        seed (int, optional): random seed. Defaults to 0.
+
+    Returns:
+        str: html page
+    """
+    parts = ["<html><body><h1>COVID-19 Notifications</h1>"]
+    for i, split in enumerate(generate_splits(n, seed)):
+        if i % 200 == 0:
+            parts.append(f"<h2>Week {i//200 + 1}</h2><p><strong>Note:</strong> Classes with a reported case</p>")
+        parts.append(f"<div><strong>{split[0]} {split[1]} {' || '.join(split[2:])}</strong></div>")
+    parts.append("</body></html>")
+    return "\n".join(parts)
+
+def generate_building_rows(n, seed=0):
+    """Generate n building code map rows (code, name, address, lat, lon). About one in twenty buildings has no
+    location (null lat/lon).
+
+    Args:
+        n (int): number of buildings
+        seed (int, optional): random seed. Defaults to 0.
+    """
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        code = "".join(chr(ord("A") + (i // 26**p) % 26) for p in (2, 1, 0))
+        name = " ".join(rng.sample(NAME_WORDS, rng.randint(2, 4)))
+        address = f"{rng.randint(100, 3999)} {rng.choice(['Trousdale', 'Figueroa', 'Jefferson', 'Exposition'])} St."
+        if rng.random() < 0.05:
+            lat, lon = "null", "null"
+        else:
+            lat, lon = str(34.02 + rng.uniform(-0.01, 0.01)), str(-118.285 + rng.uniform(-0.01, 0.01))
+        rows.append((code, name, address, lat, lon))
+    return rows
+
+def generate_building_map(n, seed=0):
+    """Generate a building code map csv with n buildings (see generate_building_rows)"""
+    lines = ["building_code,building_name,building_address,lat,lon"]
+    lines.extend(",".join(row) for row in generate_building_rows(n, seed))
+    return "\n".join(lines) + "\n"
+
+def generate_building_directory(n, seed=0):
+    """Generate a building directory page (like the USC one) with n buildings
+
+    Args:
+        n (int): number of buildings
+        seed (int, optional): random seed. Defaults to 0.
+
+    Returns:
+        str: html page
+    """
+    parts = ["<html><body><table>"]
+    for code, name, address, _, _ in generate_building_rows(n, seed):
+        parts.append(f"<tr>\n<th>{code}</th>\n<td>{name}, {address}</td>\n</tr>")
+    parts.append("</table></body></html>")
+    return "\n".join(parts)
+
+def generate_outlines(n, building_map_csv, seed=0):
+    """Generate an OSM style building outline geojson with n polygons. Most buildings of the building map get an
+    outline close to them, half of which carry the building's name. The rest are scattered around campus with
+    made up names, some without a name or with tags that are not buildings.
+
+    Args:
+        n (int): number of polygons
+        building_map_csv (str): building code map csv (see generate_building_map)
+        seed (int, optional): random seed. Defaults to 0.
+
+    Returns:
+        dict: geojson FeatureCollection
+    """
+    rng = random.Random(seed)
+    buildings = [row for row in read_csv_rows(building_map_csv)[1:] if len(row) > 4]
+    features = []
+    for i in range(n):
+        if i < len(buildings) and buildings[i][3] != "null" and rng.random() < 0.8:
+            lat = float(buildings[i][3]) + rng.uniform(-0.0005, 0.0005)
+            lon = float(buildings[i][4]) + rng.uniform(-0.0005, 0.0005)
+            name = buildings[i][1] if rng.random() < 0.5 else " ".join(rng.sample(NAME_WORDS, 3))
+        else:
+            lat, lon = 34.02 + rng.uniform(-0.03, 0.03), -118.285 + rng.uniform(-0.03, 0.03)
+            name = " ".join(rng.sample(NAME_WORDS, 3))
+        ring = [[lon + 0.0003*rng.uniform(-1, 1), lat + 0.0003*rng.uniform(-1, 1)] for _ in range(rng.randint(4, 12))]
+        ring.append(ring[0])
+        properties = {
+            "name": name if rng.random() < 0.9 else None,
+            "building": rng.choice(["university", "yes", "yes", None]),
+            "amenity": rng.choice([None, None, None, "cafe"]),
+        }
+        features.append({"type": "Feature", "properties": properties,
+                         "geometry": {"type": "Polygon", "coordinates": [ring]}})
+    return {"type": "FeatureCollection", "features": features}
+
+def time_call(function, *args):
+    """Return (seconds, result) of calling function with args"""
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+def make_result(suite, stage, size, seconds):
+    """Return the result entry of one timed stage"""
+    return {"suite": suite, "stage": stage, "size": size, "seconds": seconds, "us_per_item": 1e6*seconds/size}
+
+def benchmark_record_pipeline(sizes, building_map):
+    """Time every stage of the record pipeline for each number of rows in sizes
+
+    Args:
+        sizes (list): number of rows to benchmark
+        building_map (BuildingMap): building code map used for the enrichment stage
+
+    Returns:
+        list: one result dict per stage and size
+    """
+    results = []
+    for n in sizes:
+        splits = generate_splits(n)
+        create_time, rows = time_call(create_rows, splits)
+        validate_time, exposures = time_call(validate_rows, rows, True)
+        enrich_time, exposures = time_call(add_building_information, exposures, building_map)
+        write_time, csv_str = time_call(exposures_to_csv, exposures, building_map.header)
+
+        results.append(make_result("records", "create_rows", n, create_time))
+        results.append(make_result("records", "validate_rows", n, validate_time))
+        results.append(make_result("records", "add_building_information", n, enrich_time))
+        results.append(make_result("records", "exposures_to_csv", n, write_time))
+        total = create_time + validate_time + enrich_time + write_time
+        results.append(make_result("records", "total", n, total))
+    return results
+
+def benchmark_cases(sizes, building_map_csv, folder):
+    """Time parsing a notification page and the csv string functions of parser.py for each page size
+
+    Args:
+        sizes (list): number of exposure lines of each page
+        building_map_csv (str): building code map csv for the enrichment stage
+        folder (str): folder to write the generated pages to
+    """
+    import parser
+    results = []
+    for n in sizes:
+        path = Path(folder) / f"cases-{n}.html"
+        with open(path, "w", encoding="utf8") as page_writer:
+            page_writer.write(generate_cases_page(n))
+
+        parse_time, soup = time_call(parser.parse_cases_html_file, path)
+        strong_time, splits = time_call(parser.parse_page_strong_text, soup.find_all("strong"))
+        del soup
+        stream_time, _ = time_call(lambda: parser.parse_page_strong_text(parser.iter_strong_text(path)))
+        create_time, csv_str = time_call(parser.create_csv, splits)
+        validate_time, csv_str = time_call(parser.validate_csv, csv_str, ",", "\n", True)
+        enrich_time, _ = time_call(parser.add_building_code_name_and_location, csv_str, building_map_csv)
+
+        results.append(make_result("cases", "parse_cases_html_file", n, parse_time))
+        results.append(make_result("cases", "parse_page_strong_text", n, strong_time))
+        results.append(make_result("cases", "iter_strong_text", n, stream_time))
+        results.append(make_result("cases", "create_csv", n, create_time))
+        results.append(make_result("cases", "validate_csv", n, validate_time))
+        results.append(make_result("cases", "add_building_code_name_and_location", n, enrich_time))
+    return results
+
+def benchmark_directory(sizes, folder):
+    """Time parsing a building directory page for each number of buildings
+
+    Args:
+        sizes (list): number of buildings of each page
+        folder (str): folder to write the generated pages to
+    """
+    import parse_building_directory as directory
+    from outlines import OutlineSet, geocode_from_outlines
+    results = []
+    for n in sizes:
+        path = Path(folder) / f"directory-{n}.html"
+        with open(path, "w", encoding="utf8") as page_writer:
+            page_writer.write(generate_building_directory(n))
+
+        parse_time, soup = time_call(directory.parse_page_direcory_html_file, path)
+        buildings_time, buildings = time_call(directory.get_directory_buildings, soup)
+        results.append(make_result("directory", "parse_page_direcory_html_file", n, parse_time))
+        results.append(make_result("directory", "get_directory_buildings", n, buildings_time))
+
+        outlines = OutlineSet(generate_outlines(n, generate_building_map(n)))
+        offline_time, _ = time_call(geocode_from_outlines, [b[1] for b in buildings], outlines)
+        results.append(make_result("directory", "geocode_from_outlines", n, offline_time))
+    return results
+
+def benchmark_outlines(sizes, building_map_csv, jobs=None):
+    """Time matching the building code map to outline geojsons of each number of polygons (without the name
+    similarity cache)
+
+    Args:
+        sizes (list): number of polygons of each geojson
+        building_map_csv (str): building code map csv
+        jobs (int, optional): number of worker processes of the parallel run, which is skipped on a single core.
+        Defaults to the cpu count.
+    """
+    import map_building_code_to_outline as mapper
+    jobs = jobs or os.cpu_count() or 1
+    results = []
+    for n in sizes:
+        outlines = generate_outlines(n, building_map_csv)
+        match_time, _ = time_call(lambda: mapper.create_output_geojson(outlines, building_map_csv,
+                                                                       similarity_cache_folder=None, jobs=1))
+        results.append(make_result("outlines", "create_output_geojson", n, match_time))
+        if jobs > 1:
+            parallel_time, _ = time_call(lambda: mapper.create_output_geojson(outlines, building_map_csv,
+                                                                              similarity_cache_folder=None, 
+                                                                              jobs=jobs))
+            results.append(make_result("outlines", "create_output_geojson_parallel", n, parallel_time))
+    return results
+
+def benchmark_similarity(sizes, building_map_csv, folder, jobs=None):
+    """Time writing the similarity csv of the building code map names against each number of geojson names
+
+    Args:
+        sizes (list): number of geojson names
+        building_map_csv (str): building code map csv
+        folder (str): folder to write the csv files to
+        jobs (int, optional): number of worker processes. Defaults to the number of cpu cores.
+    """
+    import similar_tester as tester
+    csv_names = tester.get_csv_building_names(building_map_csv)
+    results = []
+    for n in sizes:
+        geojson_names = tester.get_geojson_building_names(generate_outlines(n, building_map_csv))
+        output_path = Path(folder) / f"similarity-{n}.csv"
+        similarity_time, _ = time_call(tester.create_similarity_csv, geojson_names, csv_names, output_path, jobs)
+        results.append(make_result("similarity", "create_similarity_csv", len(geojson_names), similarity_time))
+    return results
+
+def benchmark_startup(sizes):
+    """Time starting cli.py (in a new interpreter) with each of STARTUP_COMMANDS. The "python" stage is the
+    interpreter starting on its own, the other stages are the time spent on top of it.
+
+    Args:
+        sizes (list): number of times each command is started
+    """
+    cli_path = Path(__file__).parent / "cli.py"
+    def start(args, n):
+        start_time = time.perf_counter()
+        for _ in range(n):
+            subprocess.run([sys.executable, *args], stdout=subprocess.DEVNULL, check=True)
+        return time.perf_counter() - start_time
+
+    results = []
+    for n in sizes:
+        baseline = start(["-c", "pass"], n)
+        results.append(make_result("startup", "python", n, baseline))
+        for args, _ in STARTUP_COMMANDS:
+            seconds = max(start([str(cli_path), *args], n) - baseline, 0.0)
+            results.append(make_result("startup", " ".join(["cli.py", *args]), n, seconds))
+    return results
+
+def check_startup(results, budget=STARTUP_BUDGET):
+    """Print the light commands of STARTUP_COMMANDS that take longer than budget to start
+
+    Args:
+        results (list): benchmark results (only the startup suite is checked)
+        budget (float, optional): seconds a light command may take on top of the interpreter. Defaults to
+        STARTUP_BUDGET.
+
+    Returns:
+        list: (stage, seconds per start) of every command over budget
+    """
+    light = {" ".join(["cli.py", *args]) for args, is_light in STARTUP_COMMANDS if is_light}
+    slow = []
+    for result in results:
+        if result["suite"] == "startup" and result["stage"] in light:
+            seconds = result["seconds"]/result["size"]
+            if seconds > budget:
+                print(f"SLOW START: {result['stage']} takes {seconds*1000:.0f} ms (budget: {budget*1000:.0f} ms)")
+                slow.append((result["stage"], seconds))
+    return slow
+
+def get_benchmark_meta():
+    """Return what the results were measured on (commit, python/numpy versions and machine)"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=PROJECT_ROOT_PATH, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "created": datetime.utcnow().strftime('%m-%d-%Y %H:%M:%S [UTC]'),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def run_benchmarks(suites, sizes=None, repeat=1, jobs=None):
+    """Run the given benchmark suites on synthetic data
+
+    Args:
+        suites (list): suite names (see SUITE_SIZES)
+        sizes (list, optional): sizes to run every suite at. Defaults to the SUITE_SIZES of each suite.
+        repeat (int, optional): number of runs, the fastest time of each stage is kept. Defaults to 1.
+        jobs (int, optional): number of worker processes for the similarity and outlines suites. Defaults to the 
+        cpu count.
+
+    Returns:
+        dict: {"meta": ..., "results": [...]} ready to be written as json
+    """
+    building_map_csv = generate_building_map(BENCHMARK_BUILDINGS)
+    building_map = read_building_map(building_map_csv)
+
+    best = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for _ in range(repeat):
+            for suite in suites:
+                suite_sizes = sizes or SUITE_SIZES[suite]
+                print(f"Running {suite} ({', '.join(str(s) for s in suite_sizes)})...")
+                if suite == "records":
+                    results = benchmark_record_pipeline(suite_sizes, building_map)
+                elif suite == "cases":
+                    results = benchmark_cases(suite_sizes, building_map_csv, folder)
+                elif suite == "directory":
+                    results = benchmark_directory(suite_sizes, folder)
+                elif suite == "outlines":
+                    results = benchmark_outlines(suite_sizes, building_map_csv, jobs)
+                elif suite == "similarity":
+                    results = benchmark_similarity(suite_sizes, building_map_csv, folder, jobs)
+                elif suite == "startup":
+                    results = benchmark_startup(suite_sizes)
+                else:
+                    raise ValueError(f"Unknown benchmark suite \"{suite}\" (expected one of {', '.join(SUITE_SIZES)})")
+
+                for result in results:
+                    key = (result["suite"], result["stage"], result["size"])
+                    if key not in best or result["seconds"] < best[key]["seconds"]:
+                        best[key] = result
+
+    for result in best.values():
+        print(f"{result['suite']:>10} {result['stage']:<36} {result['size']:>9}: {result['seconds']:8.3f}s "
+              f"({result['us_per_item']:.2f} us/item)")
+    return {"meta": get_benchmark_meta(), "results": list(best.values())}
+
+def compare_results(baseline, current, threshold=1.2):
+    """Print how every stage changed between two benchmark runs
+
+    Args:
+        baseline (dict): benchmark json of the reference commit
+        current (dict): benchmark json of this run
+        threshold (float, optional): slowdown ratio reported as a regression. Defaults to 1.2.
+
+    Returns:
+        list: (suite, stage, size, ratio) of every regression
+    """
+    baseline_results = {(r["suite"], r["stage"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    print(f"Compared to {baseline['meta'].get('commit')}:")
+    for result in current["results"]:
+        key = (result["suite"], result["stage"], result["size"])
+        if key not in baseline_results:
+            continue
+        ratio = result["seconds"] / max(baseline_results[key]["seconds"], 1e-9)
+        flag = "REGRESSION" if ratio > threshold else ""
+        print(f"{key[0]:>10} {key[1]:<36} {key[2]:>9}: {ratio:6.2f}x {flag}")
+        if ratio > threshold:
+            regressions.append((*key, ratio))
+    return regressions
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on synthetic data")
+    arg_parser.add_argument("--suites", default=",".join(SUITE_SIZES),
+                            help=f"comma separated suites to run ({', '.join(SUITE_SIZES)})")
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=None,
+                            help="sizes to run every suite at (default: per suite, see SUITE_SIZES)")
+    arg_parser.add_argument("--repeat", type=int, default=1, help="runs per stage, the fastest one is kept")
+    arg_parser.add_argument("--jobs", type=int, default=None, help="worker processes for the similarity and outlines suites")
+    arg_parser.add_argument("--output", default=None, help="write the results to this json file")
+    arg_parser.add_argument("--compare", default=None, help="benchmark json of a previous run to compare against")
+    arg_parser.add_argument("--threshold", type=float, default=1.2, help="slowdown ratio reported as a regression")
+    args = arg_parser.parse_args()
+
+    suites = [s.strip() for s in args.suites.split(",") if s.strip()]
+    benchmark = run_benchmarks(suites, args.sizes, args.repeat, args.jobs)
+    if args.output is not None:
+        with open(args.output, "w") as json_writer:
+            json.dump(benchmark, json_writer, indent=2)
+
+    failed = len(check_startup(benchmark["results"])) > 0
+    if args.compare is not None:
+        with open(args.compare, "r") as json_reader:
+            regressions = compare_results(json.load(json_reader), benchmark, args.threshold)
+        failed = failed or len(regressions) > 0
+    if failed:
+        sys.exit(1)
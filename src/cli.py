@@ -0,0 +1,49 @@
+import sys
+import importlib
+
+# Every subcommand: name -> (module implementing it, description). A module (and everything it imports) is only
+# loaded once its subcommand is run, so `cli.py --help` never pays for bs4, geopy or numpy
+COMMANDS = {
+    "parse": ("parser", "parse USC covid data pages into csv files (`parse batch` for every page at once)"),
+    "geocode": ("parse_building_directory", "create the building code map from the building directory page"),
+    "map-outlines": ("map_building_code_to_outline", "match the building code map to building outlines"),
+    "similarity": ("similar_tester", "compare building code map names against geojson names"),
+    "sum": ("sum_covid_data", "count exposures by building, class, weekday, time and date"),
+    "heatmap": ("heatmap", "render a heatmap of the exposures on campus, one frame per day or week"),
+}
+
+def print_help(prog="cli.py"):
+    """Print the usage and every subcommand"""
+    print(f"usage: {prog} <command> [options]\n")
+    print("USC covid data tools. Run `<command> --help` for the options of a command.\n")
+    print("commands:")
+    for name, (_, description) in COMMANDS.items():
+        print(f"  {name:<14}{description}")
+
+def main(argv=None, prog="cli.py"):
+    """Run the subcommand named by the first argument with the remaining arguments
+
+    Args:
+        argv (list, optional): command line arguments. Defaults to sys.argv[1:].
+        prog (str, optional): program name shown in the help. Defaults to "cli.py".
+
+    Returns:
+        int: exit code
+    """
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if len(argv) == 0 or argv[0] in ("-h", "--help"):
+        print_help(prog)
+        return 0
+
+    command = argv[0]
+    if command not in COMMANDS:
+        print(f"{prog}: unknown command \"{command}\" (expected one of {', '.join(COMMANDS)})\n", file=sys.stderr)
+        print_help(prog)
+        return 2
+
+    module = importlib.import_module(COMMANDS[command][0])
+    module.main(argv[1:], prog=f"{prog} {command}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
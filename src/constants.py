@@ -3,22 +3,148 @@ from pathlib import Path
 # Folder Names
 DATA_FOLDER_NAME = "data"
 HTML_FOLDER_NAME = "html"
+BATCH_OUTPUT_FOLDER_NAME = "output"
+CACHE_FOLDER_NAME = "cache"
+HISTORY_FOLDER_NAME = "history"
+METRICS_FOLDER_NAME = "metrics"
+HEATMAP_FOLDER_NAME = "heatmaps"
 
 # Folder Paths
 PROJECT_ROOT_PATH = Path(__file__).parents[0] / Path("..")
 DATA_FOLDER_PATH = PROJECT_ROOT_PATH / DATA_FOLDER_NAME
 HTML_FOLDER_PATH = PROJECT_ROOT_PATH / HTML_FOLDER_NAME
+BATCH_OUTPUT_FOLDER_PATH = PROJECT_ROOT_PATH / BATCH_OUTPUT_FOLDER_NAME
+CACHE_FOLDER_PATH = PROJECT_ROOT_PATH / CACHE_FOLDER_NAME
+HISTORY_FOLDER_PATH = PROJECT_ROOT_PATH / HISTORY_FOLDER_NAME
+METRICS_FOLDER_PATH = PROJECT_ROOT_PATH / METRICS_FOLDER_NAME
+HEATMAP_FOLDER_PATH = PROJECT_ROOT_PATH / HEATMAP_FOLDER_NAME
+SNAPSHOT_CACHE_FOLDER_PATH = CACHE_FOLDER_PATH / "snapshots"
+GEOCODE_CACHE_PATH = CACHE_FOLDER_PATH / "geocode.sqlite"
+SIMILARITY_CACHE_FOLDER_PATH = CACHE_FOLDER_PATH / "similarity"
 
 # File Names
 COVID_PAGE_NAME = "page.html"
 OUTPUT_FILE_NAME = "output.csv"
 BUILDING_CODE_MAP_NAME = "building_code_map.csv"
 CLASS_DIR_PAGE_NAME = "building_directory.html"
+BATCH_MANIFEST_NAME = "manifest.json"
+SIMILARITY_CSV_NAME = "debug-str-tester.csv"
+SUMMED_DATA_FILE_NAME = "summed_covid_data.csv"
 
 # File Paths
 COVID_PAGE_PATH = HTML_FOLDER_PATH / COVID_PAGE_NAME
 OUTPUT_FILE_PATH = PROJECT_ROOT_PATH / OUTPUT_FILE_NAME
 BUILDING_CODE_MAP_PATH = DATA_FOLDER_PATH / BUILDING_CODE_MAP_NAME
 CLASS_DIR_PAGE_PATH = HTML_FOLDER_PATH / CLASS_DIR_PAGE_NAME
+SIMILARITY_CSV_PATH = PROJECT_ROOT_PATH / SIMILARITY_CSV_NAME
+SUMMED_DATA_FILE_PATH = PROJECT_ROOT_PATH / SUMMED_DATA_FILE_NAME
 
-VERBOSE = True
\ No newline at end of file
+VERBOSE = True
+
+# Print a progress line for every building/page processed. These lines cost real time on large inputs
+PRINT_PROGRESS = False
+
+# Record per stage timings and counters (see instrumentation.py) and write them to METRICS_FOLDER_PATH
+INSTRUMENTATION_ENABLED = False
+
+# Trace python allocations for the peak memory of each stage (slow). Otherwise the peak rss of the process is used
+INSTRUMENTATION_TRACE_MEMORY = False
+
+# Prefix of every metric name in the prometheus export
+METRICS_PREFIX = "usc_covid"
+
+# Bump whenever parsing/validation changes so cached pages are parsed again
+PARSER_VERSION = 6
+
+# Number of rejected rows kept as samples for each validation rule
+VALIDATION_SAMPLE_SIZE = 5
+
+# Read/write parsed pages from the snapshot cache (see snapshot_cache.py)
+USE_SNAPSHOT_CACHE = True
+
+# Append every parsed page to the exposure history store (see history_store.py)
+USE_HISTORY_STORE = True
+
+# Write weekdays in WEEKDAYS order and zero padded times (ie: "H" -> "TH", "9:30" -> "09:30") instead of the cells 
+# as they appear on the page
+NORMALIZE_CELLS = False
+
+# Size of the parsed page cache before the least recently used pages are evicted
+SNAPSHOT_CACHE_MAX_BYTES = 256*1024*1024
+
+# Seconds a cached geocode result stays valid (30 days)
+GEOCODE_CACHE_TTL = 30*24*60*60
+
+# Nominatim allows at most one request per second
+GEOCODE_MAX_WORKERS = 2
+GEOCODE_MIN_DELAY = 1.0
+
+# Lowest name similarity between a directory building and an outline for the building to be placed at the
+# outline's centroid instead of being geocoded (see outlines.geocode_from_outlines)
+OFFLINE_GEOCODE_MIN_SIMILARITY = 0.9
+
+# Largest distance (in degrees) between a building and an outline for them to be matched
+OUTLINE_MATCH_DISTANCE = 0.008
+
+# How create_output_geojson settles buildings matching the same outline ("global" or "blacklist")
+OUTLINE_MATCH_MODE = "global"
+
+# Worker processes scoring buildings against outlines in the global match mode. 1 scores them in the main process, 
+# None uses every cpu core (see outlines.get_candidate_pairs)
+OUTLINE_MATCH_JOBS = 1
+
+# Number of buildings scored per worker task
+OUTLINE_MATCH_BLOCK_ROWS = 64
+
+# Characters of a geojson file read at once when streaming its features (see geojson_stream.py)
+GEOJSON_CHUNK_SIZE = 1024*1024
+
+# Features written to a geojson between two checkpoints of its partial output (see geojson_stream.GeoJSONWriter)
+GEOJSON_CHECKPOINT_FEATURES = 500
+
+# Number of buildings whose distance to every outline vertex is computed at once
+OUTLINE_DISTANCE_CHUNK_SIZE = 256
+
+# Minimum character trigram similarity for two names to be compared at all (see name_index.py). None compares
+# every pair of names
+NAME_INDEX_THRESHOLD = 0.2
+
+# Number of rows of a similarity matrix computed per worker task
+SIMILARITY_BLOCK_ROWS = 64
+
+# Format of the files written by the parser (see record_io.py): "csv", "csv.gz", "ndjson", "ndjson.gz", "parquet" 
+# or "arrow" (the last two need pyarrow)
+RECORD_FORMAT = "csv"
+
+# Rows buffered by a record writer before they are written (the row group size of parquet files)
+RECORD_CHUNK_ROWS = 16384
+
+# gzip level of compressed csv/ndjson files (1 is fastest, 9 is smallest)
+RECORD_GZIP_LEVEL = 6
+
+# Compression codec of parquet files
+PARQUET_COMPRESSION = "snappy"
+
+# Read html pages incrementally instead of building the whole BeautifulSoup tree
+STREAM_HTML_PAGES = True
+
+# Keys exposures can be grouped by in aggregate.py
+AGGREGATE_KEYS = ("building", "class", "weekday", "time", "date")
+
+# Length (in minutes) of the time of day buckets exposures are grouped by in aggregate.py
+AGGREGATE_TIME_BUCKET_MINUTES = 60
+
+# Size (in degrees, about 20 m) of a heatmap grid cell
+HEATMAP_CELL_SIZE = 0.0002
+
+# Empty cells added around the buildings when the heatmap grid is fit to them
+HEATMAP_PADDING = 10
+
+# Standard deviation (in cells) of the gaussian blur of heatmap frames. 0 to dissable
+HEATMAP_SIGMA = 1.5
+
+# Time spans a heatmap frame can cover
+HEATMAP_PERIODS = ("day", "week")
+
+# Time span of a heatmap frame (one of HEATMAP_PERIODS)
+HEATMAP_PERIOD = "day"
@@ -0,0 +1,443 @@
+import csv
+import io
+import re
+import sys
+from typing import NamedTuple
+from constants import *
+from utils import *
+from validation import *
+from instrumentation import *
+from record_io import *
+
+EXPOSURE_HEADER = ("class_name", "code", "weekday", "start_time", "end_time", "location")
+
+# Day of week characters in the order they are numbered (TH or H is thursday, T alone is tuesday)
+WEEKDAYS = ("M", "T", "W", "TH", "F", "S")
+
+# Weekday cells seen so far -> bitmask (there are only a handful of distinct cells)
+_weekday_masks = {}
+
+def get_weekday_mask(weekday):
+    """Return the weekdays of a weekday cell as a bitmask (bit i set for WEEKDAYS[i]). 0 for null or unknown
+    characters (ie: "MW" -> 0b101, "TTH" -> 0b1010)
+
+    Args:
+        weekday (str): weekday cell of an exposure
+    """
+    mask = _weekday_masks.get(weekday)
+    if mask is None:
+        mask = _weekday_masks[weekday] = _compute_weekday_mask(weekday)
+    return mask
+
+def _compute_weekday_mask(weekday):
+    """Uncached get_weekday_mask"""
+    weekday = weekday.upper()
+    mask = 0
+    i = 0
+    while i < len(weekday):
+        if weekday.startswith("TH", i) or weekday[i] == "H":
+            mask |= 1 << WEEKDAYS.index("TH")
+            i += 2 if weekday[i] == "T" else 1
+            continue
+        if weekday[i] not in WEEKDAYS:
+            return 0
+        mask |= 1 << WEEKDAYS.index(weekday[i])
+        i += 1
+    return mask
+
+# Weekday cell of every bitmask
+_WEEKDAY_CELLS = tuple("".join(day for i, day in enumerate(WEEKDAYS) if mask >> i & 1) 
+                       for mask in range(1 << len(WEEKDAYS)))
+
+def format_weekday_mask(mask):
+    """Return the weekday cell of a weekday bitmask (ie: 0b1010 -> "TTH")"""
+    return _WEEKDAY_CELLS[mask]
+
+# 24h time cell, the hour and the minutes may have a single digit (ie: "9:30", "14:5")
+TIME_PATTERN = r"([01]?[0-9]|2[0-3]):[0-5]?[0-9]"
+
+_match_time = re.compile(TIME_PATTERN).fullmatch
+
+def is_time(cell):
+    """Check if a cell is a valid time (see TIME_PATTERN). Used by create_rows and parse_time so they agree with
+    the start_time/end_time rules of EXPOSURE_SCHEMA
+
+    Args:
+        cell (str): cell to check
+    """
+    return _match_time(cell) is not None
+
+# Time cells seen so far -> minutes since midnight. Exposures with the same time share the same int object
+_times = {}
+
+def parse_time(time):
+    """Return a time cell as minutes since midnight (ie: "14:30" -> 870). None if the time is null or invalid"""
+    if time in _times:
+        return _times[time]
+    minutes = None
+    if is_time(time):
+        hours, minutes = time.split(":")
+        minutes = int(hours)*60 + int(minutes)
+    _times[time] = minutes
+    return minutes
+
+def parse_code(code):
+    """Return a class code cell as an int (ie: "14725" -> 14725). Codes that would not survive the round trip 
+    (ie: leading zeros) are kept as str"""
+    if code.isascii() and code.isdigit() and str(int(code)) == code:
+        return int(code)
+    return code
+
+# Time cell of every minute of the day
+_TIME_CELLS = tuple(f"{m//60:02d}:{m%60:02d}" for m in range(24*60))
+
+def format_time(minutes):
+    """Return the time cell of a number of minutes since midnight (ie: 870 -> "14:30"). "null" for None"""
+    if minutes is None:
+        return "null"
+    if minutes < len(_TIME_CELLS):
+        return _TIME_CELLS[minutes]
+    return f"{minutes//60:02d}:{minutes%60:02d}"
+
+class Exposure:
+    """A single validated covid exposure (one row of the parser output csv).
+
+    Stored compactly: class names, locations and building codes are interned (shared between every exposure of
+    the same class/room), class codes are ints, weekdays are a bitmask (see get_weekday_mask), times are minutes 
+    since midnight and missing values are None instead of "null". The cells of a row that does not read back the 
+    same once normalized (ie: "H", "9:30", "mwf") are kept in raw_row so it can still be written as it was read.
+    """
+    __slots__ = ("class_name", "code", "weekday_mask", "start_minute", "end_minute", "location", "building_code", 
+                 "building", "raw_row")
+
+    def __init__(self, class_name, code, weekday_mask, start_minute, end_minute, location, building=()):
+        """
+        Args:
+            class_name (str): class name + code separated by hyphen (ie: "BUAD-304")
+            code (int): class code (ie: 14725, see parse_code)
+            weekday_mask (int): weekdays bitmask (see get_weekday_mask). None if unknown.
+            start_minute (int): start time in minutes since midnight. None if unknown.
+            end_minute (int): end time in minutes since midnight. None if unknown.
+            location (str): building location name and room number (ie: "JFFLL101"). None if unknown.
+            building (tuple, optional): building map columns appended by add_building_information. Defaults to ().
+        """
+        self.class_name = sys.intern(class_name)
+        self.code = code
+        self.weekday_mask = weekday_mask
+        self.start_minute = start_minute
+        self.end_minute = end_minute
+        self.location = sys.intern(location) if location is not None else None
+        building_code = get_building_code(location) if location is not None else None
+        self.building_code = sys.intern(building_code) if building_code is not None else None
+        self.building = building
+        self.raw_row = None
+
+    @classmethod
+    def from_row(cls, row, building=()):
+        """Return the Exposure of a valid csv row (see EXPOSURE_SCHEMA)
+
+        Args:
+            row (list): class_name, code, weekday, start_time, end_time, location cells
+            building (tuple, optional): building map columns. Defaults to ().
+        """
+        class_name, code, weekday, start_time, end_time, location = row
+        exposure = cls(class_name, parse_code(code), 
+                       get_weekday_mask(weekday) if weekday.lower() != "null" else None, 
+                       parse_time(start_time), parse_time(end_time), 
+                       location if location.lower() != "null" else None, building)
+        # Most rows are already normalized, only the others pay for a copy of their cells
+        row = tuple(row)
+        if exposure.to_row(normalize=True) != row:
+            exposure.raw_row = row
+        return exposure
+
+    @property
+    def department(self):
+        """Department of the class (ie: "BUAD-304" -> "BUAD")"""
+        return self.class_name.split("-")[0]
+
+    @property
+    def weekday(self):
+        return format_weekday_mask(self.weekday_mask) if self.weekday_mask is not None else "null"
+
+    @property
+    def start_time(self):
+        return format_time(self.start_minute)
+
+    @property
+    def end_time(self):
+        return format_time(self.end_minute)
+
+    def to_row(self, normalize=False):
+        """Return the exposure as a tuple of csv cells (in EXPOSURE_HEADER order)
+
+        Args:
+            normalize (bool, optional): write weekdays in WEEKDAYS order and zero padded times (ie: "H" -> "TH", 
+            "9:30" -> "09:30") instead of the cells as they were read. Defaults to False.
+        """
+        if self.raw_row is not None and not normalize:
+            return self.raw_row
+        return (self.class_name, str(self.code), self.weekday, self.start_time, self.end_time, 
+                self.location if self.location is not None else "null")
+
+    def with_building(self, building):
+        """Return a copy of the exposure with the given building map columns"""
+        return _restore_exposure(self.class_name, self.code, self.weekday_mask, self.start_minute, self.end_minute, 
+                                 self.location, self.building_code, building, self.raw_row)
+
+    def overlaps(self, other):
+        """Return if the two exposures share a weekday and their times overlap. False if either is unknown"""
+        if None in (self.weekday_mask, self.start_minute, self.end_minute, 
+                    other.weekday_mask, other.start_minute, other.end_minute):
+            return False
+        return (self.weekday_mask & other.weekday_mask) != 0 and \
+            self.start_minute < other.end_minute and other.start_minute < self.end_minute
+
+    def __reduce__(self):
+        # Much smaller/faster to pickle than the default __slots__ state dict (see snapshot_cache.py)
+        return (_restore_exposure, (self.class_name, self.code, self.weekday_mask, self.start_minute, 
+                                    self.end_minute, self.location, self.building_code, self.building, 
+                                    self.raw_row))
+
+    def _key(self):
+        return (self.class_name, self.code, self.weekday_mask, self.start_minute, self.end_minute, self.location, 
+                self.building)
+
+    def __eq__(self, other):
+        return isinstance(other, Exposure) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return f"Exposure({', '.join(repr(c) for c in self.to_row())}, building={self.building!r})"
+
+def _restore_exposure(*values):
+    """Rebuild a pickled Exposure (see Exposure.__reduce__)"""
+    exposure = Exposure.__new__(Exposure)
+    (exposure.class_name, exposure.code, exposure.weekday_mask, exposure.start_minute, exposure.end_minute, 
+     exposure.location, exposure.building_code, exposure.building, exposure.raw_row) = values
+    return exposure
+
+class BuildingMap(NamedTuple):
+    """Building code map loaded from the output of parse_building_directory.py"""
+    header: tuple    # building map columns appended to each exposure (every column but the building code)
+    buildings: dict  # building code -> tuple of the header columns
+
+def create_rows(splits):
+    """Turn every parsed line into a csv row. Attempts to make each row have the same number of elements filling
+    unknown cells with null. Same cells as the create_csv function, but without serializing anything.
+
+    Args:
+        splits (list): list of strings for every parsed line (see parse_page_strong_text)
+
+    Returns:
+        [list]: list of rows (list of str). Rows still need to be validated with validate_rows.
+    """
+    rows = []
+    for i in splits:
+        row = []
+        if len(i) >= 1:
+            row.append(i[0])
+        else:
+            row.extend(5*["null"])
+
+        if len(i) >= 2:
+            row.append(i[1])
+        else:
+            row.extend(4*["null"])
+
+        if len(i) >= 5:
+            has_weekdays = str_contains_only_day_of_week_characters(i[2])
+            has_first_time = is_time(i[3])
+            has_second_time = is_time(i[4])
+            if has_weekdays and has_first_time and has_second_time:
+                row.extend(i[2:5])
+            else:
+                row.extend(3*["null"])
+
+        if not is_time(i[-1]):
+            row.append(i[-1])
+        else:
+            row.append("null")
+        rows.append(row)
+    return rows
+
+# Declarative schema every exposure row is validated against (see validation.py)
+EXPOSURE_SCHEMA = (
+    ColumnRule("class_name", "Invalid class field", r"[^-]*-[^-]*"),  # name + code hyphen sep
+    ColumnRule("code", "Class ID not numeric", r"[0-9]+"),
+    ColumnRule("weekday", "Day of week field invalid", r"[mtwhfs]*", allow_null=True, flags=re.IGNORECASE),
+    ColumnRule("start_time", "Start time invalid", TIME_PATTERN, allow_null=True),
+    ColumnRule("end_time", "End time invalid", TIME_PATTERN, allow_null=True),
+    ColumnRule("location", "Location is not alphanumeric", r"[\x20-\x7e]*"),  # printable ascii only
+)
+
+EXPOSURE_VALIDATOR = RowValidator(EXPOSURE_SCHEMA)
+
+def get_row_error(row):
+    """Return the reason the given csv row is not a valid exposure, None if it is valid
+
+    Args:
+        row (list): list of str cells
+    """
+    return EXPOSURE_VALIDATOR.get_row_error(row)
+
+def validate_rows(rows, quiet_mode=False, first_line=1, report=None):
+    """Return an Exposure for every valid row. Prints how many rows each rule rejected (with a few sample rows)
+    unless quiet_mode is set.
+
+    Args:
+        rows (iterable): csv rows without the header (ie: from create_rows)
+        quiet_mode (bool, optional): Dissable printing invalid lines. Defaults to False.
+        first_line (int, optional): line number of the first row (for printing). Defaults to 1.
+        report (ValidationReport, optional): report to add the rejection counts of these rows to. Defaults to None.
+
+    Returns:
+        [list]: list of Exposure
+    """
+    with METRICS.stage("validate"):
+        valid_rows, rows_report = EXPOSURE_VALIDATOR.validate(rows, first_line)
+    if METRICS.enabled:
+        METRICS.count("rows_parsed", rows_report.total)
+        for error, count in rows_report.rejected.items():
+            if count > 0:
+                METRICS.count("rows_rejected", count, reason=error)
+    if report is not None:
+        report.merge(rows_report)
+    if not quiet_mode:
+        rows_report.print_summary()
+    return [Exposure.from_row(row) for row in valid_rows]
+
+def read_building_map(building_map_csv, delim=",", newline="\n"):
+    """Load the building code map csv
+
+    Args:
+        building_map_csv (str): string representation of building map csv: `building_code,building_name,...`
+        delim (str, optional): Delimiter for csv file. Defaults to ",".
+        newline (str, optional): newline indicator for csv file. Defaults to "\\n".
+
+    Returns:
+        [BuildingMap]: building map
+    """
+    rows = read_csv_rows(building_map_csv, delim, newline)
+    if len(rows) == 0:
+        return BuildingMap((), {})
+
+    buildings = {}
+    for row in rows[1:]:
+        if len(row[0]) > 1:
+            buildings[row[0]] = tuple(row[1:])
+    return BuildingMap(tuple(rows[0][1:]), buildings)
+
+def get_building_code(location):
+    """Return the 3 letter building code of the given location (ie: "JFFLL101" -> "JFF"). None if the location
+    does not have one.
+
+    Args:
+        location (str): location cell of an exposure
+    """
+    if len(location) >= 3 and location.lower() != "office" and location.lower() != "null":
+        return location[0:3].upper()
+    return None
+
+def get_building_fields(location, building_map):
+    """Return the building map columns for the given location. Every column is null if the building is unknown
+
+    Args:
+        location (str): location cell of an exposure
+        building_map (BuildingMap): building code map
+    """
+    fields = building_map.buildings.get(get_building_code(location))
+    if fields is None:
+        return len(building_map.header)*("null",)
+    return fields
+
+def add_building_information(exposures, building_map):
+    """Return a copy of every exposure with the matching building map columns attached
+
+    Args:
+        exposures (iterable): Exposure list
+        building_map (BuildingMap): building code map
+
+    Returns:
+        [list]: list of Exposure
+    """
+    # Every exposure of an unknown building shares the same tuple of nulls
+    null_fields = len(building_map.header)*("null",)
+    return [e.with_building(building_map.buildings.get(e.building_code, null_fields)) for e in exposures]
+
+def read_csv_rows(csv_str, delim=",", newline="\n"):
+    """Parse a csv string into a list of rows. Empty lines are skipped.
+
+    Args:
+        csv_str (str): csv string
+        delim (str, optional): Delimiter for csv. Defaults to ",".
+        newline (str, optional): Newline for csv. Defaults to "\\n".
+    """
+    lines = csv_str.split(newline) if newline != "\n" else io.StringIO(csv_str, newline="")
+    return [row for row in csv.reader(lines, delimiter=delim) if len(row) > 0]
+
+def write_rows(rows, f, delim=",", newline="\n"):
+    """Write the rows to the file object f. Cells that contain the delimiter or quotes are quoted.
+
+    Args:
+        rows (iterable): list of str cells for each row (header included)
+        f (file): writable text file opened with newline=""
+        delim (str, optional): Delimiter for csv. Defaults to ",".
+        newline (str, optional): Newline for csv. Defaults to "\\n".
+    """
+    csv.writer(f, delimiter=delim, lineterminator=newline).writerows(rows)
+
+def rows_to_csv(rows, delim=",", newline="\n"):
+    """Return the rows as a csv string (see write_rows)"""
+    output = io.StringIO(newline="")
+    write_rows(rows, output, delim, newline)
+    return output.getvalue()
+
+def exposure_rows(exposures, building_header=(), normalize=False):
+    """Yield the header and then every exposure as a row ready to be written
+
+    Args:
+        exposures (iterable): Exposure list
+        building_header (tuple, optional): building map header if building information was added. Defaults to ().
+        normalize (bool, optional): write the normalized cells instead of the cells as they were read (see 
+        Exposure.to_row). Defaults to False.
+    """
+    yield EXPOSURE_HEADER + tuple(building_header)
+    for e in exposures:
+        yield e.to_row(normalize) + e.building
+
+def write_exposures(exposures, f, building_header=(), delim=",", newline="\n", normalize=False):
+    """Write the exposures as csv to the file object f
+
+    Args:
+        exposures (iterable): Exposure list
+        f (file): writable text file opened with newline=""
+        building_header (tuple, optional): building map header if building information was added. Defaults to ().
+        delim (str, optional): Delimiter for csv. Defaults to ",".
+        newline (str, optional): Newline for csv. Defaults to "\\n".
+        normalize (bool, optional): write the normalized cells (see Exposure.to_row). Defaults to False.
+    """
+    write_rows(exposure_rows(exposures, building_header, normalize), f, delim, newline)
+
+def exposures_to_csv(exposures, building_header=(), delim=",", newline="\n", normalize=False):
+    """Return the exposures as a csv string (see write_exposures)"""
+    return rows_to_csv(exposure_rows(exposures, building_header, normalize), delim, newline)
+
+def write_exposure_records(exposures, path, building_header=(), record_format=None, normalize=False):
+    """Write the exposures to a record file in chunks (see record_io.py)
+
+    Args:
+        exposures (iterable): Exposure list
+        path (str): file to create
+        building_header (tuple, optional): building map header if building information was added. Defaults to ().
+        record_format (str, optional): one of RECORD_FORMATS. Defaults to the format of the path's extension.
+        normalize (bool, optional): write the normalized cells (see Exposure.to_row). Defaults to False.
+
+    Returns:
+        int: number of exposures written
+    """
+    with open_record_writer(path, EXPOSURE_HEADER + tuple(building_header), record_format) as writer:
+        writer.write_rows(e.to_row(normalize) + e.building for e in exposures)
+    return writer.rows
@@ -0,0 +1,180 @@
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from constants import *
+from utils import *
+from instrumentation import *
+
+def normalize_query(query):
+    """Return the cache key of a geocode query (lower case with collapsed whitespace)"""
+    return " ".join(query.lower().split())
+
+class GeocodeCache:
+    """SQLite backed cache of geocode results keyed by the normalized query. Addresses the geocoder could not find
+    are cached as well so a warm run never goes to the network (lookups that raised are not, see remote_geocode).
+    Entries older than ttl seconds are ignored (and replaced on the next lookup).
+    """
+
+    def __init__(self, path=GEOCODE_CACHE_PATH, ttl=GEOCODE_CACHE_TTL):
+        """
+        Args:
+            path (str, optional): sqlite database file. Defaults to GEOCODE_CACHE_PATH.
+            ttl (float, optional): seconds an entry stays valid. Defaults to GEOCODE_CACHE_TTL.
+        """
+        if str(path) != ":memory:":
+            os.makedirs(Path(path).parent, exist_ok=True)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(str(path))
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS geocode (query TEXT PRIMARY KEY, lat REAL, lon REAL, created REAL NOT NULL)")
+        self.connection.commit()
+
+    def get(self, query):
+        """Look up a query in the cache
+
+        Args:
+            query (str): geocode query
+
+        Returns:
+            tuple: (found, location) where location is a (lat, lon) tuple or None if the address was not found
+        """
+        row = self.connection.execute("SELECT lat, lon, created FROM geocode WHERE query = ?",
+                                      (normalize_query(query),)).fetchone()
+        if row is None or time.time() - row[2] > self.ttl:
+            self.misses += 1
+            METRICS.count("geocode_cache_lookups", result="miss")
+            return False, None
+
+        self.hits += 1
+        METRICS.count("geocode_cache_lookups", result="hit")
+        if row[0] is None or row[1] is None:
+            return True, None
+        return True, (row[0], row[1])
+
+    def put(self, query, location):
+        """Store the result of a geocode query
+
+        Args:
+            query (str): geocode query
+            location (tuple): (lat, lon) or None if the address was not found
+        """
+        lat, lon = location if location is not None else (None, None)
+        self.connection.execute("INSERT OR REPLACE INTO geocode (query, lat, lon, created) VALUES (?, ?, ?, ?)",
+                                (normalize_query(query), lat, lon, time.time()))
+        self.connection.commit()
+
+    def purge_expired(self):
+        """Remove every expired entry. Returns the number of entries removed"""
+        cursor = self.connection.execute("DELETE FROM geocode WHERE created < ?", (time.time() - self.ttl,))
+        self.connection.commit()
+        return cursor.rowcount
+
+    def close(self):
+        self.connection.close()
+
+class RateLimiter:
+    """Thread safe limiter that spaces calls at least min_delay seconds apart"""
+
+    def __init__(self, min_delay):
+        self.min_delay = min_delay
+        self._lock = threading.Lock()
+        self._next_call = 0.0
+
+    def wait(self):
+        """Block until the next call is allowed"""
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_call - now
+            self._next_call = max(now, self._next_call) + self.min_delay
+        if delay > 0:
+            time.sleep(delay)
+
+def remote_geocode(geocoder, query, limiter=None):
+    """Geocode a single query with the given geocoder. Any object with a geopy style `geocode(query)` method
+    returning an object with `latitude`/`longitude` (or None) can be used.
+
+    Args:
+        geocoder (object): geocoder (ie: geopy Nominatim)
+        query (str): address to look up
+        limiter (RateLimiter, optional): limiter to respect the geocoder's usage policy. Defaults to None.
+
+    Returns:
+        tuple: (answered, location) where location is (lat, lon) or None. answered is False if the geocoder raised
+        (timeout, rate limit, network down...), in which case the address may still exist and must not be cached
+    """
+    if limiter is not None:
+        limiter.wait()
+    try:
+        geo_location = geocoder.geocode(query)
+    except Exception as e:
+        print(f"ERROR:   geocoding \"{query}\" failed ({e})")
+        METRICS.count("geocode_requests", result="error")
+        return False, None
+    if geo_location is None:
+        METRICS.count("geocode_requests", result="not_found")
+        return True, None
+    METRICS.count("geocode_requests", result="found")
+    return True, (float(geo_location.latitude), float(geo_location.longitude))
+
+def geocode_queries(queries, geocoder, cache=None, max_workers=GEOCODE_MAX_WORKERS, min_delay=GEOCODE_MIN_DELAY):
+    """Geocode every query. Cached queries are answered from the cache and the remaining ones are sent to the
+    geocoder from a bounded thread pool, rate limited to one call every min_delay seconds. Only the answers of the
+    geocoder are cached, queries whose lookup raised are retried on the next run.
+
+    Args:
+        queries (list): addresses to look up
+        geocoder (object): geocoder with a `geocode(query)` method
+        cache (GeocodeCache, optional): geocode cache. Defaults to None.
+        max_workers (int, optional): maximum number of concurrent geocoder calls. Defaults to GEOCODE_MAX_WORKERS.
+        min_delay (float, optional): minimum seconds between geocoder calls. Defaults to GEOCODE_MIN_DELAY.
+
+    Returns:
+        dict: query -> (lat, lon) or None
+    """
+    results = {}
+    misses = []
+    for query in queries:
+        if query in results or query in misses:
+            continue
+        found, location = cache.get(query) if cache is not None else (False, None)
+        if found:
+            results[query] = location
+        else:
+            misses.append(query)
+
+    if len(misses) > 0:
+        limiter = RateLimiter(min_delay)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            answers = pool.map(lambda q: remote_geocode(geocoder, q, limiter), misses)
+            # Results are stored from this thread only, sqlite connections are not shared between threads
+            for query, (answered, location) in zip(misses, answers):
+                results[query] = location
+                if cache is not None and answered:
+                    cache.put(query, location)
+    return results
+
+def geocode_addresses(addresses, geocoder, cache=None, max_workers=GEOCODE_MAX_WORKERS, min_delay=GEOCODE_MIN_DELAY):
+    """Geocode building addresses. Every address is first looked up in Los Angeles, addresses that cannot be found
+    there are looked up again on their own (for places out of LA).
+
+    Args:
+        addresses (list): building addresses (ie: "3551 Trousdale Pkwy.")
+        geocoder (object): geocoder with a `geocode(query)` method
+        cache (GeocodeCache, optional): geocode cache. Defaults to None.
+        max_workers (int, optional): maximum number of concurrent geocoder calls. Defaults to GEOCODE_MAX_WORKERS.
+        min_delay (float, optional): minimum seconds between geocoder calls. Defaults to GEOCODE_MIN_DELAY.
+
+    Returns:
+        dict: address -> (lat, lon) or None
+    """
+    local_queries = {a: a + ", Los Angeles, CA" for a in addresses}
+    local = geocode_queries(list(local_queries.values()), geocoder, cache, max_workers, min_delay)
+
+    # Try for places out of LA
+    missing = [a for a in addresses if local[local_queries[a]] is None]
+    fallback = geocode_queries(missing, geocoder, cache, max_workers, min_delay)
+
+    return {a: local[local_queries[a]] or fallback.get(a) for a in addresses}
@@ -0,0 +1,340 @@
+import json
+import math
+import re
+from constants import *
+from utils import *
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_DECODER = json.JSONDecoder()
+
+class GeoJSONStreamError(ValueError):
+    """Raised when a geojson file is not a valid FeatureCollection"""
+
+class _JSONBuffer:
+    """Text of a file that json values are decoded from the front of, refilled from the file at the back"""
+
+    def __init__(self, reader, chunk_size):
+        self.reader = reader
+        self.chunk_size = chunk_size
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Read another chunk, dropping the text that was already decoded. Returns False at the end of the file"""
+        if self.eof:
+            return False
+        chunk = self.reader.read(self.chunk_size)
+        self.text = self.text[self.pos:] + chunk
+        self.pos = 0
+        self.eof = chunk == ""
+        return not self.eof
+
+    def peek(self):
+        """Skip whitespace and return the next character ("" at the end of the file)"""
+        while True:
+            self.pos = _WHITESPACE.match(self.text, self.pos).end()
+            if self.pos < len(self.text) or not self.fill():
+                return self.text[self.pos:self.pos + 1]
+
+    def expect(self, char):
+        """Skip the next character, which has to be char"""
+        found = self.peek()
+        if found != char:
+            raise GeoJSONStreamError(f"expected '{char}' but found '{found or 'end of file'}'")
+        self.pos += 1
+
+    def decode(self):
+        """Decode the next json value"""
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.text, self.pos)
+                # A number at the end of the text could continue in the next chunk
+                if end < len(self.text) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    raise GeoJSONStreamError(f"invalid json: {e}") from e
+            self.fill()
+
+def iter_positions(geometry):
+    """Yield every [lon, lat, ...] position of a geojson geometry (GeometryCollections included)"""
+    if geometry is None:
+        return
+    if "geometries" in geometry:
+        for child in geometry["geometries"]:
+            yield from iter_positions(child)
+        return
+
+    stack = [geometry.get("coordinates") or []]
+    while len(stack) > 0:
+        coordinates = stack.pop()
+        if len(coordinates) > 0 and not isinstance(coordinates[0], list):
+            yield coordinates
+        else:
+            stack.extend(reversed(coordinates))
+
+def is_in_bbox(feature, bbox):
+    """Return if any vertex of a feature is inside bbox
+
+    Args:
+        feature (dict): geojson feature
+        bbox (tuple): (min_lon, min_lat, max_lon, max_lat)
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    for position in iter_positions(feature.get("geometry")):
+        if min_lon <= position[0] <= max_lon and min_lat <= position[1] <= max_lat:
+            return True
+    return False
+
+def iter_geojson_features(source, keep=None, bbox=None, chunk_size=GEOJSON_CHUNK_SIZE):
+    """Read the features of a geojson FeatureCollection one at a time. Only one feature (and one chunk of the
+    file) is held in memory at once, so features that are filtered out never add up.
+
+    Args:
+        source (str): path of the geojson file, or a file object opened in text mode
+        keep (function, optional): only yield the features for which keep(feature) is true. Defaults to None.
+        bbox (tuple, optional): only yield the features with a vertex inside (min_lon, min_lat, max_lon, max_lat).
+        Defaults to None.
+        chunk_size (int, optional): characters read from the file at once. Defaults to GEOJSON_CHUNK_SIZE.
+
+    Yields:
+        dict: geojson feature
+    """
+    if isinstance(source, (str, Path)):
+        with open(source, "r", encoding="utf8") as geojson_reader:
+            yield from iter_geojson_features(geojson_reader, keep, bbox, chunk_size)
+        return
+
+    buffer = _JSONBuffer(source, chunk_size)
+    buffer.expect("{")
+    if buffer.peek() == "}":
+        return
+    # Walk the members of the collection, every member but "features" is skipped
+    while True:
+        key = buffer.decode()
+        buffer.expect(":")
+        if key != "features":
+            buffer.decode()
+        else:
+            buffer.expect("[")
+            if buffer.peek() == "]":
+                buffer.pos += 1
+            else:
+                while True:
+                    feature = buffer.decode()
+                    if (keep is None or keep(feature)) and (bbox is None or is_in_bbox(feature, bbox)):
+                        yield feature
+                    if buffer.peek() != ",":
+                        break
+                    buffer.pos += 1
+                buffer.expect("]")
+
+        if buffer.peek() != ",":
+            break
+        buffer.pos += 1
+    buffer.expect("}")
+
+# Nesting of the lists of positions (lines or rings) in the coordinates of each line geometry
+_LINE_DEPTHS = {"LineString": 0, "MultiLineString": 1, "Polygon": 1, "MultiPolygon": 2}
+
+def simplify_line(positions, tolerance, min_positions=2):
+    """Simplify a line (or closed ring) with the Douglas-Peucker algorithm: positions closer than tolerance to the
+    segment between the positions kept around them are dropped.
+
+    Args:
+        positions (list): [lon, lat, ...] positions
+        tolerance (float): largest distance (in degrees) a dropped position may be from the simplified line
+        min_positions (int, optional): the line is returned unchanged if fewer positions would be left (ie: 4 for
+        polygon rings). Defaults to 2.
+
+    Returns:
+        list: the kept positions (the first and last one are always kept)
+    """
+    if len(positions) <= 2:
+        return positions
+
+    keep = [False]*len(positions)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(positions) - 1)]
+    while len(stack) > 0:
+        start, end = stack.pop()
+        ax, ay = positions[start][0], positions[start][1]
+        dx, dy = positions[end][0] - ax, positions[end][1] - ay
+        length = dx*dx + dy*dy
+        max_dist, max_i = -1.0, None
+        for i in range(start + 1, end):
+            px, py = positions[i][0] - ax, positions[i][1] - ay
+            # Distance to the segment (to the start position for closed rings, where start and end are the same)
+            t = min(max((px*dx + py*dy)/length, 0.0), 1.0) if length > 0 else 0.0
+            dist = math.hypot(px - t*dx, py - t*dy)
+            if dist > max_dist:
+                max_dist, max_i = dist, i
+        if max_i is not None and max_dist > tolerance:
+            keep[max_i] = True
+            stack.append((start, max_i))
+            stack.append((max_i, end))
+
+    simplified = [p for p, k in zip(positions, keep) if k]
+    return simplified if len(simplified) >= min_positions else positions
+
+def _reduce_lines(coordinates, depth, precision, tolerance, min_positions):
+    if depth > 0:
+        return [_reduce_lines(c, depth - 1, precision, tolerance, min_positions) for c in coordinates]
+    if tolerance:
+        coordinates = simplify_line(coordinates, tolerance, min_positions)
+    if precision is not None:
+        coordinates = [[round(v, precision) for v in p] for p in coordinates]
+    return coordinates
+
+def reduce_geometry(geometry, precision=None, tolerance=None):
+    """Return a copy of a geojson geometry with its lines and rings simplified (see simplify_line) and its
+    coordinates rounded. The geometry is returned as is if there is nothing to reduce.
+
+    Args:
+        geometry (dict): geojson geometry
+        precision (int, optional): decimals kept in every coordinate (6 is about 10 cm). Defaults to None.
+        tolerance (float, optional): simplification tolerance in degrees. Defaults to None.
+    """
+    if geometry is None or (precision is None and not tolerance):
+        return geometry
+    if "geometries" in geometry:
+        return dict(geometry, geometries=[reduce_geometry(g, precision, tolerance) for g in geometry["geometries"]])
+
+    coordinates = geometry.get("coordinates")
+    kind = geometry.get("type")
+    if coordinates is None:
+        return geometry
+    if kind == "Point":
+        coordinates = [round(v, precision) for v in coordinates] if precision is not None else coordinates
+    elif kind == "MultiPoint":
+        coordinates = _reduce_lines(coordinates, 0, precision, None, 0)
+    elif kind in _LINE_DEPTHS:
+        # Rings need 4 positions (the first one repeated at the end) to stay valid polygons
+        min_positions = 4 if kind in ("Polygon", "MultiPolygon") else 2
+        coordinates = _reduce_lines(coordinates, _LINE_DEPTHS[kind], precision, tolerance, min_positions)
+    else:
+        return geometry
+    return dict(geometry, coordinates=coordinates)
+
+class GeoJSONWriter:
+    """Write a FeatureCollection one feature at a time, so the collection is never held in memory. The features
+    are written to <path>.partial, which is only renamed to path once the writer is closed. An interrupted run
+    never leaves a truncated file at path.
+
+    Every checkpoint_every features the partial file is flushed and its length is saved to <path>.checkpoint,
+    along with the keys of the features written so far. A writer opened with resume=True continues from the last
+    checkpoint and skips the features that were already written:
+
+        with GeoJSONWriter(path, resume=True) as writer:
+            for feature in features:
+                writer.write_feature(feature, key=feature["properties"]["building_code"])
+    """
+
+    def __init__(self, path, precision=None, tolerance=None, resume=False, source=None,
+                 checkpoint_every=GEOJSON_CHECKPOINT_FEATURES):
+        """
+        Args:
+            path (str): geojson file to create
+            precision (int, optional): decimals kept in every coordinate (see reduce_geometry). Defaults to None.
+            tolerance (float, optional): simplification tolerance in degrees (see reduce_geometry). Defaults to 
+            None.
+            resume (bool, optional): continue from the checkpoint of an interrupted run if there is one. Defaults 
+            to False.
+            source (object, optional): json serializable description of the inputs. A checkpoint is only resumed 
+            if it was written for the same source. Defaults to None.
+            checkpoint_every (int, optional): features between checkpoints. 0 to dissable. Defaults to 
+            GEOJSON_CHECKPOINT_FEATURES.
+        """
+        self.path = Path(path)
+        self.partial_path = self.path.with_name(self.path.name + ".partial")
+        self.checkpoint_path = self.path.with_name(self.path.name + ".checkpoint")
+        self.precision = precision
+        self.tolerance = tolerance
+        self.source = source
+        self.checkpoint_every = checkpoint_every
+        self.keys = set()
+        self.features = 0
+        self.skipped = 0
+
+        checkpoint = self._read_checkpoint() if resume else None
+        if checkpoint is not None:
+            # Anything written after the checkpoint may be cut off mid feature
+            self._file = open(self.partial_path, "r+b")
+            self._file.truncate(checkpoint["offset"])
+            self._file.seek(checkpoint["offset"])
+            self.features = checkpoint["features"]
+            self.keys = set(checkpoint["keys"])
+        else:
+            self._file = open(self.partial_path, "wb")
+            self._file.write(b'{"type": "FeatureCollection", "features": [')
+        self.resumed = self.features
+
+    def _read_checkpoint(self):
+        """Return the saved checkpoint if it can be resumed, None otherwise"""
+        try:
+            with open(self.checkpoint_path, "r") as checkpoint_reader:
+                checkpoint = json.load(checkpoint_reader)
+            if checkpoint["source"] == self.source and os.path.getsize(self.partial_path) >= checkpoint["offset"]:
+                return checkpoint
+        except (OSError, ValueError, KeyError):
+            pass
+        return None
+
+    def write_feature(self, feature, key=None):
+        """Write a feature unless a feature with the same key was already written
+
+        Args:
+            feature (dict): geojson feature
+            key (str, optional): unique key of the feature (ie: its building code), needed to skip it when 
+            resuming. Defaults to None.
+
+        Returns:
+            bool: if the feature was written
+        """
+        if key is not None and key in self.keys:
+            self.skipped += 1
+            return False
+
+        if self.precision is not None or self.tolerance:
+            feature = dict(feature, geometry=reduce_geometry(feature.get("geometry"), self.precision, self.tolerance))
+        text = json.dumps(feature)
+        self._file.write(((", " if self.features > 0 else "") + text).encode("utf8"))
+        self.features += 1
+        if key is not None:
+            self.keys.add(key)
+        if self.checkpoint_every and self.features % self.checkpoint_every == 0:
+            self.checkpoint()
+        return True
+
+    def checkpoint(self):
+        """Flush the partial file to disk and save how far it got"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        checkpoint = {"source": self.source, "offset": self._file.tell(), "features": self.features, 
+                      "keys": sorted(self.keys)}
+        tmp_path = self.checkpoint_path.with_name(self.checkpoint_path.name + ".tmp")
+        with open(tmp_path, "w") as checkpoint_writer:
+            json.dump(checkpoint, checkpoint_writer)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def close(self):
+        """Finish the collection and move it to path"""
+        self._file.write(b"]}")
+        self._file.close()
+        os.replace(self.partial_path, self.path)
+        if self.checkpoint_path.exists():
+            os.remove(self.checkpoint_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Keep what was written so the run can be resumed
+            self.checkpoint()
+            self._file.close()
@@ -0,0 +1,54 @@
+import argparse
+from constants import *
+
+def main(argv=None, prog=None):
+    """Command line entry point of heatmap.py (also run by `cli.py heatmap`)
+
+    Args:
+        argv (list, optional): command line arguments. Defaults to sys.argv[1:].
+        prog (str, optional): program name shown in the help. Defaults to the script name.
+    """
+    arg_parser = argparse.ArgumentParser(prog=prog, description="Render a heatmap of the exposures on campus, one "
+                                         "frame per day or week")
+    arg_parser.add_argument("paths", nargs="*", default=[BATCH_OUTPUT_FOLDER_PATH],
+                            help=f"parser output csv files or folders of them (default: /{BATCH_OUTPUT_FOLDER_NAME})")
+    arg_parser.add_argument("--history", action="store_true",
+                            help=f"read the exposures from the history store (/{HISTORY_FOLDER_NAME}) instead of csv files")
+    arg_parser.add_argument("--start", default=None, help="first snapshot date to read from the history (YYYY-MM-DD)")
+    arg_parser.add_argument("--end", default=None, help="last snapshot date to read from the history (YYYY-MM-DD)")
+    arg_parser.add_argument("--building-map", default=BUILDING_CODE_MAP_PATH, help="building code map csv")
+    arg_parser.add_argument("--period", default=HEATMAP_PERIOD, choices=HEATMAP_PERIODS, help="time span of a frame")
+    arg_parser.add_argument("--cell-size", type=float, default=HEATMAP_CELL_SIZE, help="grid cell size in degrees")
+    arg_parser.add_argument("--bbox", type=float, nargs=4, default=None,
+                            metavar=("MIN_LON", "MIN_LAT", "MAX_LON", "MAX_LAT"),
+                            help="area covered by the grid (default: every building with a location)")
+    arg_parser.add_argument("--sigma", type=float, default=HEATMAP_SIGMA, help="gaussian blur in cells (0 for none)")
+    arg_parser.add_argument("--no-png", action="store_true", help="only write the .npy stack")
+    arg_parser.add_argument("--output", default=HEATMAP_FOLDER_PATH, help="folder to write the frames to")
+    args = arg_parser.parse_args(argv)
+
+    # numpy is only imported once the arguments are valid so --help starts fast
+    from exposure import read_building_map
+    from aggregate import read_exposure_columns, read_history_columns, find_exposure_files
+    from rasterize import get_grid, rasterize, write_heatmap
+
+    with open(args.building_map, "r") as csv_reader:
+        building_map = read_building_map(csv_reader.read())
+
+    if args.history:
+        from history_store import HistoryStore
+        columns = read_history_columns(HistoryStore(), args.start, args.end)
+    else:
+        columns = read_exposure_columns(find_exposure_files(args.paths))
+
+    grid = None
+    if args.bbox is not None:
+        grid = get_grid(None, None, args.cell_size, args.bbox)
+    heatmap = rasterize(columns, building_map, grid, args.period, args.sigma, args.cell_size)
+    paths = write_heatmap(heatmap, args.output, not args.no_png)
+    print(f"Rendered {heatmap.exposures}/{len(columns.building)} exposures (the others have no known "
+          f"building location or snapshot date) into {len(heatmap.labels)} frames of {heatmap.grid.rows}x"
+          f"{heatmap.grid.cols} cells ({len(paths)} files in {args.output})")
+
+if __name__ == "__main__":
+    main()
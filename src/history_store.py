@@ -0,0 +1,212 @@
+import json
+import shutil
+import time
+from constants import *
+from utils import *
+from exposure import *
+import numpy as np
+
+class HistoryStore:
+    """Append-only columnar store of validated exposures across covid data snapshots.
+
+    Every ingested snapshot is written as one chunk: a folder with one .npy file per column (fixed width utf8
+    bytes) so chunks can be memory mapped instead of parsed. Rows of a chunk are sorted by building code. The
+    index (index.json) lists the snapshot date, source hash and the row range of every building code of each
+    chunk, so date and building queries only touch the rows they need. Existing chunks are never rewritten.
+    """
+
+    INDEX_NAME = "index.json"
+    CHUNK_FOLDER_NAME = "chunks"
+
+    def __init__(self, folder=HISTORY_FOLDER_PATH):
+        """
+        Args:
+            folder (str, optional): store folder. Defaults to HISTORY_FOLDER_PATH.
+        """
+        self.folder = Path(folder)
+        self.chunk_folder = self.folder / self.CHUNK_FOLDER_NAME
+        os.makedirs(self.chunk_folder, exist_ok=True)
+        self.index = self._read_index()
+
+    def _read_index(self):
+        """Return the index of the store (an empty one if the store is new)"""
+        index_path = self.folder / self.INDEX_NAME
+        if not isfile(index_path):
+            return {"chunks": []}
+        with open(index_path, "r") as index_reader:
+            return json.load(index_reader)
+
+    def _write_index(self):
+        """Atomically replace the index file with self.index"""
+        index_path = self.folder / self.INDEX_NAME
+        tmp_path = index_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w") as index_writer:
+            json.dump(self.index, index_writer, indent=1)
+        os.replace(tmp_path, index_path)
+
+    def has_source(self, source):
+        """Return if a snapshot with the given source hash was already ingested"""
+        return any(c["source"] == source for c in self.index["chunks"])
+
+    def write_chunk(self, exposures, date, source=None, building_header=()):
+        """Write the exposures of one snapshot as a new chunk without adding it to the index (see add_chunks). Safe
+        to call from several processes at once.
+
+        Args:
+            exposures (list): validated Exposure records of the snapshot
+            date (str): snapshot date (YYYY-MM-DD)
+            source (str, optional): content hash of the page the exposures come from. Defaults to None.
+            building_header (tuple, optional): building map header if building information was added. 
+            Defaults to ().
+
+        Returns:
+            dict: index entry of the chunk
+        """
+        # Sort by building code so each building is a contiguous row range
+        codes = [e.building_code or "null" for e in exposures]
+        order = sorted(range(len(exposures)), key=codes.__getitem__)
+        buildings = {}
+        for row, i in enumerate(order):
+            start, _ = buildings.get(codes[i], (row, row))
+            buildings[codes[i]] = (start, row + 1)
+
+        columns = tuple(EXPOSURE_HEADER) + tuple(building_header)
+        name = f"{date}-{source[:16] if source else time.time_ns()}"
+        tmp_folder = self.chunk_folder / f".{name}.{os.getpid()}.tmp"
+        os.makedirs(tmp_folder, exist_ok=True)
+        # Normalized so every snapshot spells the same weekdays/times the same way
+        rows = [exposures[i].to_row(normalize=True) + exposures[i].building for i in order]
+        for col, column in enumerate(columns):
+            values = [row[col].encode("utf8") for row in rows]
+            np.save(tmp_folder / f"{column}.npy", np.array(values, dtype=bytes) if len(values) > 0 
+                    else np.zeros(0, dtype="S1"))
+
+        chunk_path = self.chunk_folder / name
+        if chunk_path.exists():
+            shutil.rmtree(chunk_path)
+        os.replace(tmp_folder, chunk_path)
+        return {
+            "name": name,
+            "date": date,
+            "source": source,
+            "rows": len(exposures),
+            "columns": list(columns),
+            "buildings": {code: list(rows) for code, rows in buildings.items()},
+        }
+
+    def add_chunks(self, chunks):
+        """Add chunks written with write_chunk to the index. Chunks of already ingested sources are ignored.
+
+        Args:
+            chunks (list): index entries returned by write_chunk
+
+        Returns:
+            int: number of chunks added
+        """
+        added = 0
+        for chunk in chunks:
+            if chunk["source"] is not None and self.has_source(chunk["source"]):
+                continue
+            self.index["chunks"].append(chunk)
+            added += 1
+        if added > 0:
+            self.index["chunks"].sort(key=lambda c: (c["date"], c["name"]))
+            self._write_index()
+        return added
+
+    def ingest(self, exposures, date, source=None, building_header=()):
+        """Append the exposures of one snapshot to the store. A snapshot whose source was already ingested is 
+        skipped.
+
+        Args:
+            exposures (list): validated Exposure records of the snapshot
+            date (str): snapshot date (YYYY-MM-DD)
+            source (str, optional): content hash of the page the exposures come from. Defaults to None.
+            building_header (tuple, optional): building map header if building information was added. 
+            Defaults to ().
+
+        Returns:
+            bool: True if a chunk was added
+        """
+        if source is not None and self.has_source(source):
+            return False
+        return self.add_chunks([self.write_chunk(exposures, date, source, building_header)]) > 0
+
+    def get_chunks(self, start=None, end=None):
+        """Return the index entry of every chunk with a snapshot date between start and end (both included)
+
+        Args:
+            start (str, optional): first date (YYYY-MM-DD). Defaults to the first snapshot.
+            end (str, optional): last date (YYYY-MM-DD). Defaults to the last snapshot.
+        """
+        return [c for c in self.index["chunks"] 
+                if (start is None or c["date"] >= start) and (end is None or c["date"] <= end)]
+
+    def get_building_ranges(self, chunk, buildings=None):
+        """Return the (building code, first row, end row) of the given buildings of a chunk, in the order 
+        iter_chunks reads their rows. Buildings given more than once are only read once.
+
+        Args:
+            chunk (dict): index entry of the chunk
+            buildings (list, optional): building codes (ie: ["JFF"]). Defaults to every building, in row order.
+        """
+        if buildings is None:
+            return sorted(((code, r[0], r[1]) for code, r in chunk["buildings"].items()), key=lambda r: r[1])
+        return [(code, *chunk["buildings"][code][:2]) for code in dict.fromkeys(buildings) 
+                if code in chunk["buildings"]]
+
+    def iter_chunks(self, start=None, end=None, buildings=None, columns=None):
+        """Yield the columns of every chunk between start and end as memory mapped arrays. Only the row ranges of 
+        the given buildings are read.
+
+        Args:
+            start (str, optional): first date (YYYY-MM-DD). Defaults to the first snapshot.
+            end (str, optional): last date (YYYY-MM-DD). Defaults to the last snapshot.
+            buildings (list, optional): building codes to read (ie: ["JFF"]). Defaults to every building.
+            columns (list, optional): columns to read. Defaults to every column of the chunk.
+
+        Yields:
+            tuple: (index entry, dict of column name -> np.ndarray of utf8 bytes)
+        """
+        for chunk in self.get_chunks(start, end):
+            names = [c for c in (columns or chunk["columns"]) if c in chunk["columns"]]
+            arrays = {c: np.load(self.chunk_folder / chunk["name"] / f"{c}.npy", mmap_mode="r") for c in names}
+            if buildings is None:
+                yield chunk, arrays
+                continue
+
+            ranges = self.get_building_ranges(chunk, buildings)
+            if len(ranges) == 0:
+                continue
+            yield chunk, {c: np.concatenate([a[s:e] for _, s, e in ranges]) for c, a in arrays.items()}
+
+    def load(self, start=None, end=None, buildings=None, columns=None):
+        """Return every exposure between start and end as columns, with a "date" column added
+
+        Args:
+            start (str, optional): first date (YYYY-MM-DD). Defaults to the first snapshot.
+            end (str, optional): last date (YYYY-MM-DD). Defaults to the last snapshot.
+            buildings (list, optional): building codes to read (ie: ["JFF"]). Defaults to every building.
+            columns (list, optional): columns to read. Defaults to EXPOSURE_HEADER.
+
+        Returns:
+            dict: column name -> np.ndarray of utf8 bytes
+        """
+        columns = list(columns or EXPOSURE_HEADER)
+        loaded = {c: [] for c in columns + ["date"]}
+        for chunk, arrays in self.iter_chunks(start, end, buildings, columns):
+            rows = chunk["rows"] if buildings is None else len(next(iter(arrays.values()), ()))
+            for c in columns:
+                loaded[c].append(arrays[c] if c in arrays else np.full(rows, b"null"))
+            loaded["date"].append(np.full(rows, chunk["date"].encode("utf8")))
+        return {c: np.concatenate(a) if len(a) > 0 else np.zeros(0, dtype="S1") for c, a in loaded.items()}
+
+    def iter_exposures(self, start=None, end=None, buildings=None):
+        """Yield (date, Exposure) for every exposure between start and end (see iter_chunks)"""
+        for chunk, arrays in self.iter_chunks(start, end, buildings):
+            building_cols = chunk["columns"][len(EXPOSURE_HEADER):]
+            decoded = {c: np.char.decode(a, "utf8").tolist() for c, a in arrays.items()}
+            for i in range(len(decoded[EXPOSURE_HEADER[0]])):
+                exposure = Exposure.from_row([decoded[c][i] for c in EXPOSURE_HEADER], 
+                                             tuple(decoded[c][i] for c in building_cols))
+                yield chunk["date"], exposure
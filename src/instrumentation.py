@@ -0,0 +1,234 @@
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from constants import *
+from utils import *
+
+try:
+    import resource
+except ImportError: # Not available on windows
+    resource = None
+
+# Returned by Metrics.stage while disabled so a disabled stage costs a single attribute check
+_NULL_STAGE = nullcontext()
+
+def get_peak_rss():
+    """Return the peak resident memory of this process in bytes. None if it cannot be read on this platform"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes everywhere else
+    return peak if sys.platform == "darwin" else peak*1024
+
+def get_metric_name(name, prefix=METRICS_PREFIX):
+    """Return a valid prometheus metric name (ie: "rows rejected" -> "usc_covid_rows_rejected")"""
+    name = re.sub(r"[^a-zA-Z0-9_]", "_", name)
+    return f"{prefix}_{name}" if prefix else name
+
+def format_labels(labels):
+    """Return prometheus labels (ie: {reason="invalid time"}) of a sorted tuple of (label, value) pairs"""
+    if len(labels) == 0:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, v in labels)
+    return "{" + ",".join(f"{get_metric_name(k, None)}=\"{v}\"" for (k, _), v in zip(labels, escaped)) + "}"
+
+class Metrics:
+    """Wall time and peak memory of named stages along with labelled counters. Everything is a no-op until the
+    metrics are enabled, so the calls can stay in hot code. The peak memory of a stage is the peak rss of the
+    process when it ends, or the peak of the python allocations made during the stage when trace_memory is set.
+    """
+
+    def __init__(self, enabled=False, trace_memory=False):
+        """
+        Args:
+            enabled (bool, optional): record stages and counters. Defaults to False.
+            trace_memory (bool, optional): trace allocations for the peak memory of each stage (slow). Defaults
+            to False.
+        """
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.stages = {}    # stage name -> {"calls", "seconds", "peak_memory"}
+        self.counters = {}  # (counter name, sorted tuple of (label, value)) -> count
+        self._peaks = []    # traced peak so far of every open stage, innermost last
+        self._lock = threading.Lock()
+
+    def enable(self, trace_memory=None):
+        """Start recording. trace_memory overrides the one given to the constructor if not None"""
+        self.enabled = True
+        if trace_memory is not None:
+            self.trace_memory = trace_memory
+
+    def reset(self):
+        """Forget every recorded stage and counter"""
+        self.stages = {}
+        self.counters = {}
+
+    def stage(self, name):
+        """Return a context manager recording the wall time and peak memory of the code it wraps under name.
+        Stages can be nested and the same stage can be entered several times (the times are added up).
+
+        Args:
+            name (str): stage name (ie: "parse_html")
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return self._stage(name)
+
+    @contextmanager
+    def _stage(self, name):
+        tracing = self.trace_memory
+        if tracing:
+            self._start_tracing()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak = self._stop_tracing() if tracing else get_peak_rss()
+            self.add_stage(name, seconds, peak)
+
+    def _start_tracing(self):
+        # Imported on first use, most runs never trace memory
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        # Resetting the peak would lose the peak of the enclosing stage, so it is saved first
+        if len(self._peaks) > 0:
+            self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+        self._peaks.append(0)
+        tracemalloc.reset_peak()
+
+    def _stop_tracing(self):
+        import tracemalloc
+        peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+        if len(self._peaks) > 0:
+            self._peaks[-1] = max(self._peaks[-1], peak)
+        else:
+            tracemalloc.stop()
+        return peak
+
+    def add_stage(self, name, seconds, peak_memory=None, calls=1):
+        """Add a run of a stage that was timed elsewhere"""
+        if not self.enabled:
+            return
+        stats = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0, "peak_memory": None})
+        stats["calls"] += calls
+        stats["seconds"] += seconds
+        if peak_memory is not None:
+            stats["peak_memory"] = max(stats["peak_memory"] or 0, peak_memory)
+
+    def count(self, name, value=1, **labels):
+        """Add value to a counter
+
+        Args:
+            name (str): counter name (ie: "rows_rejected")
+            value (int, optional): amount to add. Defaults to 1.
+            labels (str): labels of the counter (ie: reason="invalid time"). Each combination of labels is counted
+            separately.
+        """
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        # Counters can be updated from worker threads (ie: geocode requests)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def get_count(self, name, **labels):
+        """Return the value of a counter, 0 if it was never counted"""
+        return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def to_dict(self):
+        """Return the stages and counters as a json serializable dict"""
+        return {
+            "stages": {name: dict(stats) for name, stats in self.stages.items()},
+            "counters": [{"name": name, "labels": dict(labels), "value": value}
+                         for (name, labels), value in sorted(self.counters.items())],
+        }
+
+    def merge(self, data):
+        """Add the stages and counters of a dict from to_dict (ie: recorded in a worker process) to these ones"""
+        for name, stats in data["stages"].items():
+            self.add_stage(name, stats["seconds"], stats["peak_memory"], stats["calls"])
+        for counter in data["counters"]:
+            key = (counter["name"], tuple(sorted(counter["labels"].items())))
+            self.counters[key] = self.counters.get(key, 0) + counter["value"]
+
+    def pop(self):
+        """Return to_dict() and reset. Used by worker processes to hand their metrics over to the main process"""
+        data = self.to_dict()
+        self.reset()
+        return data
+
+    def to_prometheus(self, prefix=METRICS_PREFIX):
+        """Return the stages and counters in the prometheus text format
+
+        Args:
+            prefix (str, optional): prefix of every metric name. Defaults to METRICS_PREFIX.
+        """
+        lines = []
+        def add_metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{format_labels(labels)} {value}" for labels, value in samples)
+
+        stages = sorted(self.stages.items())
+        if len(stages) > 0:
+            add_metric(get_metric_name("stage_seconds_total", prefix), "counter", "Wall time spent in each stage",
+                       [((("stage", name),), round(s["seconds"], 6)) for name, s in stages])
+            add_metric(get_metric_name("stage_calls_total", prefix), "counter", "Number of runs of each stage",
+                       [((("stage", name),), s["calls"]) for name, s in stages])
+            add_metric(get_metric_name("stage_peak_memory_bytes", prefix), "gauge", "Peak memory of each stage",
+                       [((("stage", name),), s["peak_memory"]) for name, s in stages if s["peak_memory"] is not None])
+
+        by_name = {}
+        for (name, labels), value in sorted(self.counters.items()):
+            by_name.setdefault(name, []).append((labels, value))
+        for name, samples in by_name.items():
+            add_metric(get_metric_name(f"{name}_total", prefix), "counter", name.replace("_", " "), samples)
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path):
+        with open(path, "w") as json_writer:
+            json.dump(dict(created=datetime.utcnow().strftime('%m-%d-%Y %H:%M:%S [UTC]'), **self.to_dict()),
+                      json_writer, indent=2)
+
+    def write_prometheus(self, path):
+        with open(path, "w") as prom_writer:
+            prom_writer.write(self.to_prometheus())
+
+    def write(self, path):
+        """Write the metrics to path, in the prometheus text format if it ends in .prom (or .txt), as json
+        otherwise"""
+        if os.path.dirname(str(path)):
+            os.makedirs(os.path.dirname(str(path)), exist_ok=True)
+        if str(path).lower().endswith((".prom", ".txt")):
+            self.write_prometheus(path)
+        else:
+            self.write_json(path)
+
+    def write_run(self, name, folder=METRICS_FOLDER_PATH):
+        """Write the metrics of a script run to <folder>/<name>.json and <folder>/<name>.prom. Does nothing if the
+        metrics are disabled.
+
+        Returns:
+            list: paths written
+        """
+        if not self.enabled:
+            return []
+        paths = [Path(folder) / f"{name}.json", Path(folder) / f"{name}.prom"]
+        for path in paths:
+            self.write(path)
+        return paths
+
+    def print_summary(self):
+        """Print the stages (slowest first) and counters"""
+        for name, stats in sorted(self.stages.items(), key=lambda s: -s[1]["seconds"]):
+            peak = stats["peak_memory"]
+            memory = f", peak memory: {peak/(1024*1024):.1f} MiB" if peak is not None else ""
+            print(f"  {name}: {stats['seconds']:.3f}s ({stats['calls']} calls{memory})")
+        for (name, labels), value in sorted(self.counters.items()):
+            print(f"  {name}{format_labels(labels)}: {value}")
+
+# Metrics of the current process. Scripts enable them with INSTRUMENTATION_ENABLED (or a command line option)
+METRICS = Metrics(INSTRUMENTATION_ENABLED, INSTRUMENTATION_TRACE_MEMORY)
@@ -0,0 +1,375 @@
+from constants import *
+from utils import *
+import argparse
+import hashlib
+import time
+from instrumentation import *
+from geojson_stream import GeoJSONWriter
+# outlines.py (numpy) and exposure.py are imported by the functions that need them, so --help starts fast
+
+def read_building_map_rows(building_map_csv, delim=",", newline="\n"):
+    """Return the header and the rows of a building code map csv. Quoted cells (ie: addresses with commas) are
+    kept whole
+
+    Returns:
+        tuple: (header cells, list of row cells)
+    """
+    from exposure import read_csv_rows
+    rows = read_csv_rows(building_map_csv, delim, newline)
+    if len(rows) == 0:
+        return [], []
+    return rows[0], rows[1:]
+
+def validate_building_code_map_file(building_map_csv,delim=',', newline="\n" ,quiet_mode=False):
+    """Validates the selected building code map to ensure it is valid  before trying to map buildings to shapes
+
+    Args:
+        path (str): path to building code map file. This is the output file from parse_building_directory.py
+    """
+    _, rows = read_building_map_rows(building_map_csv, delim, newline)
+    for num,cols in enumerate(rows):
+        if "".join(cols).strip() != "":
+            if len(cols) < 4:
+                if not quiet_mode:
+                    bad_csv_print(cols,"invalid length",num)
+                    return False
+            
+            # check building code is valid
+            if len(cols[0]) != 3:
+                if not quiet_mode:
+                    bad_csv_print(cols,f"invalid building code: \"{cols[0]}\"",num) 
+                return False
+            
+            # check lat is castable to float
+            if cols[3].lower() != "null": 
+                try:
+                    float(cols[3])
+                except ValueError:
+                    if not quiet_mode:
+                        bad_csv_print(cols,f"invalid latitude value: \"{cols[3]}\"",num) 
+                    return False
+
+            # check lon is castable to float 
+            if cols[4].lower() != "null":
+                try:
+                    float(cols[4])
+                except ValueError:
+                    if not quiet_mode:
+                        bad_csv_print(cols,f"invalid longitude value: \"{cols[4]}\"",num) 
+                    return False
+    return True
+
+def validate_building_geojson(building_outline ,quiet_mode=False):
+    # TODO: validate geojson files
+    print("THE GEOJSON VALIDATOR IS NOT DONE. PLASE FINISH")
+    return True
+
+def make_output_feature(feature, min_dist, header_cols, cols):
+    """Return a copy of a matched feature with the csv building columns overlaid on its properties. The source 
+    feature is left untouched, so the same loaded outlines can be matched again.
+
+    Args:
+        feature (dict): matched feature
+        min_dist (float): match distance
+        header_cols (list): building map csv header
+        cols (list): building map csv row of the matched building
+    """
+    prop = dict(feature["properties"])
+    prop["min_dist"] = min_dist
+    for num,c in enumerate(cols):
+        prop[header_cols[num]] = c
+
+    new_feature = dict(feature)
+    new_feature["properties"] = prop
+    new_feature["min_dist"] = min_dist
+    return new_feature
+
+def iter_output_features_global(outlines, building_map_csv, delim=',', newline="\n", weight_location_on_name=True,
+                                index=None, name_similarity=None, jobs=OUTLINE_MATCH_JOBS):
+    """Yield the output features of only the buildings mapped in the csv. Every candidate (building, feature) pair 
+    is scored once and conflicts are settled globally (see assign_features) instead of re-queueing buildings.
+
+    Args:
+        outlines (OutlineSet): building outline features
+        building_map_csv (str): csv of building map 
+        delim (str, optional): csv delimiter. Defaults to ','.
+        newline (str, optional): csv newline. Defaults to "\n".
+        weight_location_on_name (bool, optional): weight distance on name similarity. Defaults to True.
+        index (GridIndex, optional): spatial index over outlines. Defaults to None.
+        name_similarity (NameSimilarity, optional): precomputed name similarities. Defaults to None.
+        jobs (int, optional): number of worker processes scoring the buildings (see get_candidate_pairs). The 
+        matches are the same for any number. Defaults to OUTLINE_MATCH_JOBS.
+
+    Yields:
+        dict: output feature of every matched building, in csv order
+    """
+    from outlines import get_candidate_pairs, assign_features
+    header_cols, lines = read_building_map_rows(building_map_csv, delim, newline)
+
+    # make sure each line of the csv is valid
+    rows = []
+    for cols in lines:
+        if len(cols) > 4 and cols[3].lower() != "null" and cols[4].lower() != "null":
+            rows.append(cols)
+
+    with METRICS.stage("get_candidate_pairs"):
+        pairs = get_candidate_pairs(outlines, [float(c[3]) for c in rows], [float(c[4]) for c in rows], 
+                                    [c[1] for c in rows], weight_location_on_name, index, name_similarity, jobs)
+    with METRICS.stage("assign_features"):
+        matches = assign_features(outlines, *pairs)
+    METRICS.count("candidate_pairs", len(pairs[0]))
+    METRICS.count("buildings_matched", len(matches), result="matched")
+    METRICS.count("buildings_matched", len(rows) - len(matches), result="ignored")
+
+    print(f"Candidate pairs: {len(pairs[0])}")
+    print(f"IGNORED: {len(rows) - len(matches)}")
+
+    # Features are only built as they are consumed
+    for building_num, cols in enumerate(rows):
+        if building_num in matches:
+            feature_num, min_dist = matches[building_num]
+            yield make_output_feature(outlines.get_feature(feature_num), min_dist, header_cols, cols)
+
+def create_output_geojson_global(outlines, building_map_csv, delim=',', newline="\n", weight_location_on_name=True,
+                                 index=None, name_similarity=None, jobs=OUTLINE_MATCH_JOBS):
+    """Create a geojson from only the buildings mapped in the csv (see iter_output_features_global)"""
+    return {"type": "FeatureCollection", 
+            "features": list(iter_output_features_global(outlines, building_map_csv, delim, newline, 
+                                                         weight_location_on_name, index, name_similarity, jobs))}
+
+def iter_output_features(building_outline, building_map_csv, delim=',', newline="\n", weight_location_on_name=True,
+                         use_spatial_index=True, match_mode=OUTLINE_MATCH_MODE, 
+                         similarity_cache_folder=SIMILARITY_CACHE_FOLDER_PATH, jobs=OUTLINE_MATCH_JOBS):
+    """Yield the output features of only the buildings mapped in the csv, so they can be written as they are 
+    finalized (see geojson_stream.GeoJSONWriter)
+
+    Args:
+        building_outline (geojson): geojson with all the building outlines and additonal metadata. An already loaded
+        OutlineSet can be given instead to reuse it across several runs (it must have been loaded with 
+        require_name=weight_location_on_name).
+        building_map_csv (str): csv of building map 
+        delim (str, optional): csv delimiter. Defaults to ','.
+        newline (str, optional): csv newline. Defaults to "\n".
+        weight_location_on_name (bool, optional): weight distance on name similarity. Defaults to True.
+        use_spatial_index (bool, optional): only check features near each building instead of every feature. 
+        Defaults to True.
+        match_mode (str, optional): "global" to settle conflicts in one pass over every candidate pair, "blacklist" 
+        to re-queue buildings that lose a conflict. Defaults to OUTLINE_MATCH_MODE.
+        similarity_cache_folder (str, optional): folder to cache the name similarity matrix in. None to dissable 
+        caching. Defaults to SIMILARITY_CACHE_FOLDER_PATH.
+        jobs (int, optional): number of worker processes scoring the buildings in global mode. None for the number
+        of cpu cores. Defaults to OUTLINE_MATCH_JOBS.
+
+    Yields:
+        dict: output feature of every matched building. In blacklist mode a feature is only final once every 
+        building was matched, so they are all yielded at the end.
+    """
+    from outlines import OutlineSet, GridIndex, get_search_radius, find_closest_feature
+    from similarity import NameSimilarity
+    with METRICS.stage("load_outlines"):
+        if isinstance(building_outline, OutlineSet):
+            outlines = building_outline
+        else:
+            outlines = OutlineSet(building_outline, require_name=weight_location_on_name)
+        index = GridIndex(outlines, get_search_radius(weight_location_on_name)) if use_spatial_index else None
+    name_similarity = None
+    if weight_location_on_name:
+        csv_names = [cols[1] for cols in read_building_map_rows(building_map_csv, delim, newline)[1] if len(cols) > 2]
+        # Every pair is compared: with the trigram shortlist, names that share few trigrams (ie: short or
+        # abbreviated names) would get a similarity of 0 and could never be matched
+        with METRICS.stage("name_similarity"):
+            name_similarity = NameSimilarity(csv_names, outlines.names, threshold=None, 
+                                             cache_folder=similarity_cache_folder)
+
+    if match_mode == "global":
+        yield from iter_output_features_global(outlines, building_map_csv, delim, newline, weight_location_on_name,
+                                               index, name_similarity, jobs)
+        return
+
+    header_cols, lines = read_building_map_rows(building_map_csv, delim, newline)
+    emitted = {} # feature name -> output feature. Only the closest building is kept for each feature
+    ignored = 0
+    blacklist_size = 0
+    start_size = len(lines)
+
+    blacklist = {}
+    for cols in lines:
+        blacklist[cols[0]] = []
+
+    # Loop for each building in the input csv
+    match_start = time.perf_counter()
+    for i,cols in enumerate(lines):
+       
+        # blacklist a building in the csv from matching with a building in the json (a closer building exists)
+        # key: csv[0](3 letter code) value: geojson feature name
+
+        if len(cols) > 2:
+            csv_building_name = cols[1]
+        else:
+            continue
+
+        if PRINT_PROGRESS:
+            print(f"Checking: {csv_building_name} ({i}/{start_size})")
+            print(f"Remaining: {len(lines)-i}, Blacklist_Size: {blacklist_size}")
+
+        # make sure the line of the csv is valid
+        if cols[3].lower() != "null" and cols[4].lower() != "null":
+            curr_lat = float(cols[3])
+            curr_lon = float(cols[4])
+
+            feature_num, min_dist = find_closest_feature(outlines, curr_lat, curr_lon, csv_building_name, 
+                                                         blacklist[cols[0]], weight_location_on_name, index,
+                                                         name_similarity)
+            closest_feature = outlines.get_feature(feature_num) if feature_num is not None else "null"
+
+            # if there was a closests feature found for that building add it to the output geojson
+            if str(closest_feature).lower() != "null" and min_dist < OUTLINE_MATCH_DISTANCE:
+                
+                new_feature = make_output_feature(closest_feature, min_dist, header_cols, cols)
+                prop_name = closest_feature["properties"]["name"]
+                #print(f"ACCEPTED: {cols[1]} || {prop_name}" )
+
+                # Find if new feature is already in outputs
+                old_feature = emitted.get(prop_name)
+                if old_feature is not None:
+                    old_prop = old_feature["properties"]
+                    if min_dist < old_prop["min_dist"]:
+                        ocode = old_prop["building_code"]
+                        lines.append([old_prop[h] for h in header_cols])
+                        blacklist[ocode].append(prop_name)
+                        blacklist_size += 1
+                        METRICS.count("blacklist_retries")
+                        emitted[prop_name] = new_feature
+                        #print("new one closer")
+
+                    else:
+                        lines.append(cols)
+                        blacklist[cols[0]].append(prop_name)
+                        blacklist_size += 1
+                        METRICS.count("blacklist_retries")
+                        #print("old one closer")
+                else:
+                    emitted[prop_name] = new_feature
+            else:
+                #print(f"IGNORING - closest feature: {cols[0]}")
+                ignored += 1
+            
+    METRICS.add_stage("blacklist_match", time.perf_counter() - match_start)
+    METRICS.count("buildings_matched", len(emitted), result="matched")
+    METRICS.count("buildings_matched", ignored, result="ignored")
+    print(f"IGNORED: {ignored}")
+    yield from emitted.values()
+
+def create_output_geojson(building_outline,building_map_csv,delim=',', newline="\n", weight_location_on_name=True,
+                          use_spatial_index=True, match_mode=OUTLINE_MATCH_MODE, 
+                          similarity_cache_folder=SIMILARITY_CACHE_FOLDER_PATH, jobs=OUTLINE_MATCH_JOBS):
+    """Create a geojson from only the buildings mapped in the csv (see iter_output_features for the arguments)"""
+    return {"type": "FeatureCollection", 
+            "features": list(iter_output_features(building_outline, building_map_csv, delim, newline, 
+                                                  weight_location_on_name, use_spatial_index, match_mode, 
+                                                  similarity_cache_folder, jobs))}
+
+# ---------------------------------------------------------------------------------------------------------------------
+
+def main(argv=None, prog=None):
+    """Command line entry point of map_building_code_to_outline.py (also run by `cli.py map-outlines`)
+
+    Args:
+        argv (list, optional): command line arguments. Defaults to sys.argv[1:].
+        prog (str, optional): program name shown in the help. Defaults to the script name.
+    """
+    arg_parser = argparse.ArgumentParser(prog=prog, description="Match the buildings of a building code map to the "
+                                         f"building outlines of a geojson (both chosen from /{DATA_FOLDER_NAME})")
+    arg_parser.add_argument("--bbox", type=float, nargs=4, default=None, 
+                            metavar=("MIN_LON", "MIN_LAT", "MAX_LON", "MAX_LAT"),
+                            help="only load the outlines with a vertex inside this box")
+    arg_parser.add_argument("--output", default=None, metavar="FILE",
+                            help="name of the output geojson in the project root (asked for if not given)")
+    arg_parser.add_argument("--precision", type=int, default=None, metavar="DECIMALS",
+                            help="round the output coordinates to this many decimals (6 is about 10 cm)")
+    arg_parser.add_argument("--simplify", type=float, default=None, metavar="TOLERANCE",
+                            help="simplify the output outlines, dropping vertices within TOLERANCE degrees of "
+                            "the simplified outline")
+    arg_parser.add_argument("--resume", action="store_true",
+                            help="continue an interrupted run from its last checkpoint instead of starting over")
+    arg_parser.add_argument("--jobs", type=int, default=OUTLINE_MATCH_JOBS, 
+                            help=f"worker processes scoring the buildings, 0 for the cpu count (default: "
+                            f"{OUTLINE_MATCH_JOBS})")
+    args = arg_parser.parse_args(argv)
+    from outlines import load_outlines
+
+    # Ask user which file they want to open
+    data_pages = [f for f in listdir(DATA_FOLDER_PATH) if isfile(pjoin(DATA_FOLDER_PATH,f))]
+    data_paths = [pjoin(DATA_FOLDER_PATH,f) for f in listdir(DATA_FOLDER_PATH) if isfile(pjoin(DATA_FOLDER_PATH,f))]
+
+    data_pages = [f"{f} (created: {get_created_string(DATA_FOLDER_PATH,f)})" for f in data_pages ]
+    
+    # choose building outlines geojson
+    choice = simple_menu_print(f"Select a building outlines geojson from the /{DATA_FOLDER_NAME} directory:",data_pages)
+    building_outlines = data_paths[choice-1]
+
+    # chose building map csv
+    choice = simple_menu_print(f"Select a building code map from the /{DATA_FOLDER_NAME} directory:",data_pages)
+    building_code_map = data_paths[choice-1]
+
+    # open the selected files. Only the outlines that can be matched are kept while the file is read
+    try:
+        print("Opening outlines file...")
+        with METRICS.stage("read_outlines"):
+            outlines = load_outlines(building_outlines, bbox=args.bbox)
+    except Exception as e:
+        print("Something went wrong opening the builiding code map file:")
+        print(e)
+        print("Quitting")
+        sys.exit()
+
+    try:
+        print("Opening building code map...")
+        with open(building_code_map,"r") as csv_reader:
+            building_map_csv = csv_reader.read()
+    except Exception as e:
+        print("Something went wrong opening the builiding code map file:")
+        print(e)
+        print("Quitting")
+        sys.exit()
+
+    # Validate the read files 
+    print("Validating files...")
+
+    if not validate_building_code_map_file(building_map_csv,quiet_mode = not VERBOSE):
+        print("Error: Invalid building map csv file. Aborting!")
+        sys.exit()
+
+
+    # The name is needed before matching since features are written as they are finalized
+    file_name = args.output
+    if file_name is None:
+        print("\nWhat would you like to name the output?")
+        file_name = input()
+
+    # Append .geojson to the end if needed
+    tmp = file_name.split('.')
+    if len(tmp) == 1:
+        file_name = file_name + ".geojson"
+
+    out_file_full_path = PROJECT_ROOT_PATH / file_name
+    # A checkpoint is only resumed for the same inputs and options
+    source = {"outlines": str(building_outlines), "outlines_mtime": os.path.getmtime(building_outlines), 
+              "bbox": args.bbox, "building_map": hashlib.sha256(building_map_csv.encode("utf8")).hexdigest(), 
+              "precision": args.precision, "simplify": args.simplify, "match_mode": OUTLINE_MATCH_MODE}
+
+    print(f"Creating output geojson file: (At: {out_file_full_path})")
+    with METRICS.stage("create_output_geojson"), GeoJSONWriter(out_file_full_path, args.precision, args.simplify,
+                                                                args.resume, source) as writer:
+        if writer.resumed > 0:
+            print(f"Resuming after {writer.resumed} features")
+        for feature in iter_output_features(outlines, building_map_csv, jobs=args.jobs):
+            writer.write_feature(feature, key=feature["properties"].get("building_code"))
+    print(f"Wrote {writer.features} features")
+    METRICS.count("output_features", writer.features)
+
+    for path in METRICS.write_run("map_building_code_to_outline"):
+        print(f"Wrote metrics: (At: {path})")
+
+if __name__ == "__main__":
+    main()
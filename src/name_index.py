@@ -0,0 +1,68 @@
+from constants import *
+from utils import *
+import numpy as np
+
+def normalize_name(name):
+    """Return the name in lower case with everything but letters and numbers replaced by single spaces"""
+    return " ".join("".join(c if c.isalnum() else " " for c in name.lower()).split())
+
+def get_trigrams(name):
+    """Return the set of character trigrams of a name (ie: "Bing Hall" -> {"  b", " bi", "bin", ...}). The name is
+    padded so short names and word boundaries still produce trigrams.
+
+    Args:
+        name (str): name to split
+    """
+    padded = f"  {normalize_name(name)} "
+    return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+class NameIndex:
+    """Character trigram inverted index over a list of names. Returns a short list of candidate names sharing
+    enough trigrams with a query, so the (slow) exact comparison only has to be done on those.
+    """
+
+    def __init__(self, names):
+        """
+        Args:
+            names (list): names to index
+        """
+        self.names = list(names)
+        self.trigram_counts = np.zeros(len(self.names), dtype=np.int64)
+        postings = {}
+        for name_num, name in enumerate(self.names):
+            trigrams = get_trigrams(name) if name is not None else set()
+            self.trigram_counts[name_num] = len(trigrams)
+            for trigram in trigrams:
+                postings.setdefault(trigram, []).append(name_num)
+        self.postings = {t: np.array(p, dtype=np.int64) for t, p in postings.items()}
+
+    def __len__(self):
+        return len(self.names)
+
+    def get_overlaps(self, query):
+        """Return the trigram (dice) similarity of the query to every indexed name, between 0 and 1
+
+        Args:
+            query (str): name to look up
+        """
+        trigrams = get_trigrams(query)
+        lists = [self.postings[t] for t in trigrams if t in self.postings]
+        if len(lists) == 0 or len(self.names) == 0:
+            return np.zeros(len(self.names))
+
+        shared = np.bincount(np.concatenate(lists), minlength=len(self.names))
+        return 2*shared/np.maximum(len(trigrams) + self.trigram_counts, 1)
+
+    def get_candidates(self, query, threshold=NAME_INDEX_THRESHOLD):
+        """Return the index of every name with a trigram similarity to the query of at least threshold. Lower
+        thresholds give better recall but longer candidate lists.
+
+        Args:
+            query (str): name to look up
+            threshold (float, optional): minimum trigram similarity. Defaults to NAME_INDEX_THRESHOLD.
+
+        Returns:
+            np.ndarray: sorted indices of the candidate names
+        """
+        overlaps = self.get_overlaps(query)
+        return np.flatnonzero((overlaps >= threshold) & (overlaps > 0))
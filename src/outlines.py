@@ -0,0 +1,664 @@
+import json
+import math
+import tempfile
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from constants import *
+from utils import *
+from similarity import *
+from instrumentation import *
+from geojson_stream import *
+import numpy as np
+
+def get_radial_distance(a_lat, a_lon, b_lat, b_lon):
+    """retuen the radial distance between two points
+
+    Args:
+        a_lat (float): first lat
+        a_lon (float): first lon
+        b_lat (float): second lat
+        b_lon (float): second lon
+    """
+    lat_diff = np.absolute(a_lat - b_lat)
+    lon_diff = np.absolute(a_lon - b_lon)
+    radial_dist = np.sqrt(lat_diff**2 + lon_diff**2)
+    return radial_dist
+
+def is_candidate_feature(feature, require_name=True):
+    """Return if the given geojson feature is a building outline that csv buildings can be matched to
+
+    Args:
+        feature (dict): geojson feature
+        require_name (bool, optional): features without a name are not candidates. Defaults to True.
+    """
+    fprop = feature.get("properties")
+    if fprop is None or fprop == "":
+        return False
+
+    fname = fprop.get("name")
+    if require_name and (fname is None or fname == "None"):
+        return False
+
+    amenity = fprop.get("amenity")
+    return bool(fprop.get("building")) and fname != "None" and (amenity is None or amenity == "None")
+
+def flatten_coordinates(coordinates, lons, lats):
+    """Append every position of geojson coordinates to lons/lats and return the shape needed to rebuild the
+    coordinates (see build_coordinates): None for a single position, the number of positions for a list of
+    positions and a list of shapes for anything nested deeper (ie: polygon rings).
+
+    Args:
+        coordinates (list): "coordinates" of a geojson geometry
+        lons (array): lons to append to
+        lats (array): lats to append to
+    """
+    if len(coordinates) > 0 and not isinstance(coordinates[0], list):
+        lons.append(float(coordinates[0]))
+        lats.append(float(coordinates[1]))
+        return None
+
+    shapes = [flatten_coordinates(c, lons, lats) for c in coordinates]
+    if len(shapes) > 0 and all(s is None for s in shapes):
+        return len(shapes)
+    return shapes
+
+def build_coordinates(lons, lats, shape, start=0):
+    """Rebuild the geojson coordinates flattened by flatten_coordinates
+
+    Args:
+        lons (np.ndarray): flattened lons
+        lats (np.ndarray): flattened lats
+        shape (int, list or None): shape returned by flatten_coordinates
+        start (int, optional): index of the first position of the coordinates in lons/lats. Defaults to 0.
+
+    Returns:
+        tuple: (coordinates, index after the last position)
+    """
+    if shape is None:
+        return [float(lons[start]), float(lats[start])], start + 1
+    if isinstance(shape, int):
+        end = start + shape
+        return [list(p) for p in zip(lons[start:end].tolist(), lats[start:end].tolist())], end
+
+    coordinates = []
+    for child in shape:
+        child_coordinates, start = build_coordinates(lons, lats, child, start)
+        coordinates.append(child_coordinates)
+    return coordinates, start
+
+def get_ring_centroid(lats, lons):
+    """Return the area and centroid of a polygon ring (shoelace formula). The ring may or may not repeat its
+    first vertex at the end.
+
+    Args:
+        lats (np.ndarray): ring lats
+        lons (np.ndarray): ring lons
+
+    Returns:
+        tuple: (area, lat, lon). The area is in square degrees and always positive, 0 for degenerate rings.
+    """
+    if len(lats) < 3:
+        return 0.0, None, None
+    # Relative to the first vertex, the products of absolute coordinates would lose most of their precision
+    y = lats - lats[0]
+    x = lons - lons[0]
+    next_y = np.roll(y, -1)
+    next_x = np.roll(x, -1)
+    cross = x*next_y - next_x*y
+    area = cross.sum()/2
+    if area == 0:
+        return 0.0, None, None
+    lat = float(((y + next_y)*cross).sum()/(6*area) + lats[0])
+    lon = float(((x + next_x)*cross).sum()/(6*area) + lons[0])
+    return abs(float(area)), lat, lon
+
+class OutlineSet:
+    """Building outline features that csv buildings can be matched to, along with their names and vertices. The
+    vertices of every feature are flattened into contiguous lat/lon arrays so distances can be computed with a 
+    few numpy operations instead of a python loop per vertex. Only the properties of the features are kept
+    besides the vertex arrays, the features themselves are rebuilt on demand (see get_feature).
+    """
+
+    def __init__(self, building_outline, require_name=True, bbox=None):
+        """
+        Args:
+            building_outline (geojson): geojson with all the building outlines and additonal metadata, or any 
+            iterable of its features (ie: iter_geojson_features)
+            require_name (bool, optional): skip features without a name. Defaults to True.
+            bbox (tuple, optional): skip features without a vertex inside (min_lon, min_lat, max_lon, max_lat). 
+            Defaults to None.
+        """
+        self.names = []
+        self.shells = []  # every feature with None in place of its coordinates
+        self.shapes = []  # nesting of the coordinates of every feature (see flatten_coordinates)
+        lats = array("d")
+        lons = array("d")
+        counts = []
+
+        features = building_outline["features"] if isinstance(building_outline, dict) else building_outline
+        for feature in features:
+            fprop = feature.get("properties")
+            if fprop is None or fprop == "":
+                print(f"WARNING: feature lacks properties field. Skipping feature: {feature}")
+                continue
+            if not is_candidate_feature(feature, require_name):
+                continue
+            if bbox is not None and not is_in_bbox(feature, bbox):
+                continue
+
+            geometry = feature.get("geometry") or {}
+            start = len(lats)
+            if "coordinates" in geometry:
+                shape = flatten_coordinates(geometry["coordinates"] or [], lons, lats)
+                shell_geometry = dict(geometry, coordinates=None)
+            else:
+                # GeometryCollections are rare enough to be kept whole
+                for position in iter_positions(geometry):
+                    lons.append(float(position[0]))
+                    lats.append(float(position[1]))
+                shape = None
+                shell_geometry = geometry
+            if len(lats) == start:
+                continue
+
+            self.names.append(fprop.get("name"))
+            self.shells.append(dict(feature, geometry=shell_geometry))
+            self.shapes.append(shape)
+            counts.append(len(lats) - start)
+
+        # Vertices of feature n are lats/lons[offsets[n]:offsets[n+1]]
+        self.lats = np.frombuffer(lats, dtype=np.float64)
+        self.lons = np.frombuffer(lons, dtype=np.float64)
+        self.offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.offsets[1:])
+
+    @classmethod
+    def from_arrays(cls, lats, lons, offsets, names):
+        """Return an OutlineSet over already flattened vertex arrays (ie: memory mapped by a worker process, see 
+        init_match_worker). It can compute distances but not rebuild features."""
+        outlines = cls.__new__(cls)
+        outlines.names = names
+        outlines.shells = None
+        outlines.shapes = None
+        outlines.lats = lats
+        outlines.lons = lons
+        outlines.offsets = offsets
+        return outlines
+
+    def __len__(self):
+        return len(self.names)
+
+    def get_feature(self, feature_num):
+        """Return a new geojson feature (dict) for the given feature, with the same members as the source feature.
+        Coordinates are rebuilt from the vertex arrays (as floats, without altitudes)."""
+        shell = self.shells[feature_num]
+        geometry = shell["geometry"]
+        if "coordinates" in geometry:
+            coordinates, _ = build_coordinates(self.lons, self.lats, self.shapes[feature_num], 
+                                               int(self.offsets[feature_num]))
+            geometry = dict(geometry, coordinates=coordinates)
+        return dict(shell, geometry=geometry)
+
+    def get_coords(self, feature_num):
+        """Return the (lat, lon) vertex arrays of a feature"""
+        start, end = self.offsets[feature_num], self.offsets[feature_num + 1]
+        return self.lats[start:end], self.lons[start:end]
+
+    def get_centroid(self, feature_num):
+        """Return the (lat, lon) centroid of a feature. Polygons are weighted by their area (holes are taken out),
+        other geometries (or degenerate polygons) use the mean of their vertices."""
+        geometry_type = self.shells[feature_num]["geometry"].get("type")
+        shape = self.shapes[feature_num]
+        if geometry_type == "Polygon":
+            polygons = [shape]
+        elif geometry_type == "MultiPolygon":
+            polygons = shape
+        else:
+            polygons = []
+
+        start = int(self.offsets[feature_num])
+        total_area = lat_sum = lon_sum = 0.0
+        for rings in polygons:
+            for ring_num, count in enumerate(rings):
+                if not isinstance(count, int): # Empty ring
+                    continue
+                area, lat, lon = get_ring_centroid(self.lats[start:start + count], self.lons[start:start + count])
+                start += count
+                # The first ring is the outside of the polygon, the others are holes
+                sign = 1 if ring_num == 0 else -1
+                total_area += sign*area
+                if area > 0:
+                    lat_sum += sign*area*lat
+                    lon_sum += sign*area*lon
+
+        if total_area > 0:
+            return lat_sum/total_area, lon_sum/total_area
+        lats, lons = self.get_coords(feature_num)
+        return float(lats.mean()), float(lons.mean())
+
+    def get_distances(self, lat, lon, feature_nums=None):
+        """Return the distance from the given point to the closest vertex of each feature
+
+        Args:
+            lat (float): point lat
+            lon (float): point lon
+            feature_nums (list, optional): features to compute the distance to. Defaults to every feature.
+
+        Returns:
+            np.ndarray: distance to each feature (in the order of feature_nums)
+        """
+        if feature_nums is None:
+            if len(self) == 0:
+                return np.zeros(0)
+            dists = get_radial_distance(self.lats, self.lons, lat, lon)
+            return np.minimum.reduceat(dists, self.offsets[:-1])
+
+        feature_nums = np.asarray(feature_nums, dtype=np.int64)
+        if len(feature_nums) == 0:
+            return np.zeros(0)
+
+        # Gather the vertices of the requested features into one contiguous block
+        starts = self.offsets[feature_nums]
+        counts = self.offsets[feature_nums + 1] - starts
+        local_offsets = np.zeros(len(counts), dtype=np.int64)
+        np.cumsum(counts[:-1], out=local_offsets[1:])
+        vertex_nums = np.repeat(starts - local_offsets, counts) + np.arange(counts.sum())
+
+        dists = get_radial_distance(self.lats[vertex_nums], self.lons[vertex_nums], lat, lon)
+        return np.minimum.reduceat(dists, local_offsets)
+
+    def get_distance_matrix(self, lats, lons, chunk_size=OUTLINE_DISTANCE_CHUNK_SIZE):
+        """Return the distance from every point to the closest vertex of every feature
+
+        Args:
+            lats (list): point lats
+            lons (list): point lons
+            chunk_size (int, optional): number of points computed at once (bounds the size of the temporary
+            points x vertices array). Defaults to OUTLINE_DISTANCE_CHUNK_SIZE.
+
+        Returns:
+            np.ndarray: (points x features) distance matrix
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        output = np.empty((len(lats), len(self)), dtype=np.float64)
+        if len(self) == 0:
+            return output
+
+        for start in range(0, len(lats), chunk_size):
+            end = start + chunk_size
+            dists = get_radial_distance(self.lats[None, :], self.lons[None, :], lats[start:end, None], 
+                                        lons[start:end, None])
+            output[start:end] = np.minimum.reduceat(dists, self.offsets[:-1], axis=1)
+        return output
+
+    def get_distance(self, feature_num, lat, lon):
+        """Return the distance from the given point to the closest vertex of a feature
+
+        Args:
+            feature_num (int): index of the feature
+            lat (float): point lat
+            lon (float): point lon
+        """
+        return float(self.get_distances(lat, lon, [feature_num])[0])
+
+class GridIndex:
+    """Uniform grid over the vertices of an OutlineSet. Every feature with a vertex within cell_size of a point is
+    found by only looking at the 3x3 cells around the point.
+    """
+
+    def __init__(self, outlines, cell_size):
+        """
+        Args:
+            outlines (OutlineSet): features to index
+            cell_size (float): size of a grid cell in degrees. This is the largest radius that can be searched.
+        """
+        self.cell_size = cell_size
+        self.cells = {}
+        for feature_num in range(len(outlines)):
+            lats, lons = outlines.get_coords(feature_num)
+            cell_lats = np.floor(lats/cell_size).astype(np.int64)
+            cell_lons = np.floor(lons/cell_size).astype(np.int64)
+            for cell in set(zip(cell_lats.tolist(), cell_lons.tolist())):
+                self.cells.setdefault(cell, []).append(feature_num)
+
+    @classmethod
+    def from_arrays(cls, cell_size, cell_keys, cell_offsets, cell_features):
+        """Return a GridIndex from the arrays of to_arrays"""
+        index = cls.__new__(cls)
+        index.cell_size = cell_size
+        features = cell_features.tolist()
+        bounds = cell_offsets.tolist()
+        index.cells = {(cell_lat, cell_lon): features[bounds[i]:bounds[i + 1]] 
+                       for i, (cell_lat, cell_lon) in enumerate(cell_keys.tolist())}
+        return index
+
+    def to_arrays(self):
+        """Return the cells as arrays that can be shared with worker processes: the (lat, lon) key of every cell,
+        and the features of every cell one after the other (those of cell n are cell_features[cell_offsets[n]:
+        cell_offsets[n+1]])"""
+        keys = list(self.cells)
+        cell_offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum([len(self.cells[k]) for k in keys], out=cell_offsets[1:])
+        return {
+            "cell_keys": np.array(keys, dtype=np.int64).reshape(len(keys), 2),
+            "cell_offsets": cell_offsets,
+            "cell_features": np.array([f for k in keys for f in self.cells[k]], dtype=np.int64),
+        }
+
+    def get_cell(self, lat, lon):
+        """Return the grid cell that contains the given point"""
+        return (math.floor(lat/self.cell_size), math.floor(lon/self.cell_size))
+
+    def get_candidates(self, lat, lon):
+        """Return the sorted index of every feature that could have a vertex within cell_size of the given point
+
+        Args:
+            lat (float): point lat
+            lon (float): point lon
+        """
+        cell_lat, cell_lon = self.get_cell(lat, lon)
+        candidates = set()
+        for i in (-1, 0, 1):
+            for j in (-1, 0, 1):
+                candidates.update(self.cells.get((cell_lat + i, cell_lon + j), ()))
+        return sorted(candidates)
+
+def load_outlines(path, require_name=True, bbox=None):
+    """Load the building outlines of a geojson file, streaming its features so only the kept ones are ever held in
+    memory (instead of the whole file)
+
+    Args:
+        path (str): geojson file
+        require_name (bool, optional): skip features without a name. Defaults to True.
+        bbox (tuple, optional): skip features without a vertex inside (min_lon, min_lat, max_lon, max_lat). 
+        Defaults to None.
+
+    Returns:
+        OutlineSet: the building outlines
+    """
+    return OutlineSet(iter_geojson_features(path), require_name, bbox)
+
+def geocode_from_outlines(building_names, outlines, min_similarity=OFFLINE_GEOCODE_MIN_SIMILARITY,
+                          threshold=NAME_INDEX_THRESHOLD):
+    """Locate buildings without a geocoder. Each building name is matched to the most similar feature name and the
+    building is placed at the centroid of the first feature with that name. A match is only kept if no other
+    building name is more similar to that feature name, so "Royal Street Structure" is not placed at the "Flower
+    Street Structure" outline when both are in the directory.
+
+    Args:
+        building_names (list): building names (ie: from the building directory)
+        outlines (OutlineSet): named building outlines
+        min_similarity (float, optional): lowest compare_strings ratio accepted as the same building. Defaults to
+        OFFLINE_GEOCODE_MIN_SIMILARITY.
+        threshold (float, optional): trigram shortlist threshold (see compute_similarity_matrix). Defaults to 
+        NAME_INDEX_THRESHOLD.
+
+    Returns:
+        dict: building name -> (lat, lon) or None if no feature name is similar enough
+    """
+    unique_building_names = sorted({n for n in building_names if n is not None})
+    first_features = {}
+    for feature_num, name in enumerate(outlines.names):
+        if name is not None:
+            first_features.setdefault(name, feature_num)
+    feature_names = sorted(first_features)
+
+    # Only ratios of at least min_similarity matter, every other pair is skipped as early as possible
+    matrix = compute_similarity_matrix(unique_building_names, feature_names, threshold, 
+                                       min_similarity=min_similarity)
+    matched = {}
+    if matrix.size > 0:
+        # Ties go to the first feature name in sorted order
+        cols = np.argmax(matrix, axis=1)
+        scores = matrix[np.arange(len(matrix)), cols]
+        best_building = matrix.max(axis=0)
+        for row, (col, score) in enumerate(zip(cols.tolist(), scores.tolist())):
+            if score >= min_similarity and score >= best_building[col]:
+                matched[unique_building_names[row]] = feature_names[col]
+
+    locations = {}
+    for name in building_names:
+        if name in locations:
+            continue
+        feature_name = matched.get(name)
+        locations[name] = outlines.get_centroid(first_features[feature_name]) if feature_name is not None else None
+        METRICS.count("offline_geocode_lookups", result="found" if feature_name is not None else "not_found")
+    return locations
+
+def get_search_radius(weight_location_on_name=True):
+    """Return the largest vertex distance a feature can have and still be accepted as a match. Name weighting can
+    at most halve the distance (a perfect name match)"""
+    if weight_location_on_name:
+        return 2*OUTLINE_MATCH_DISTANCE
+    return OUTLINE_MATCH_DISTANCE
+
+def get_match_distances(outlines, lat, lon, feature_nums, csv_building_name=None, weight_location_on_name=True,
+                        name_similarity=None):
+    """Return the match distance from a csv building to each of the given features. This is the distance to the
+    closest vertex of the feature. When weighting on name, the distance is divided by 2*similarity of the names 
+    (inf for features with completely different names).
+
+    Args:
+        outlines (OutlineSet): features to search
+        lat (float): building lat
+        lon (float): building lon
+        feature_nums (list): features to compute the distance to
+        csv_building_name (str, optional): building name from the building code map. Defaults to None.
+        weight_location_on_name (bool, optional): weight distance on name similarity. Defaults to True.
+        name_similarity (NameSimilarity, optional): precomputed name similarities. Defaults to None.
+
+    Returns:
+        np.ndarray: distance to each feature (in the order of feature_nums)
+    """
+    dists = outlines.get_distances(lat, lon, feature_nums)
+
+    # Add a multiplyer to the distance based on how similar the building names are
+    if weight_location_on_name:
+        if name_similarity is not None:
+            string_cmp = 2*name_similarity.get_similarities(csv_building_name, feature_nums)
+        else:
+            string_cmp = np.array([2*compare_strings(csv_building_name, outlines.names[f]) 
+                                   if csv_building_name is not None else 0 for f in feature_nums])
+        # If strings have no relation distance = inf
+        with np.errstate(divide="ignore"):
+            dists = np.where(string_cmp > 0, dists/string_cmp, np.inf)
+    return dists
+
+def find_closest_feature(outlines, lat, lon, csv_building_name=None, excluded_names=(), weight_location_on_name=True,
+                         index=None, name_similarity=None):
+    """Find the feature closest to a csv building. The distance to a feature is the distance to its closest vertex.
+    When weighting on name, the distance is divided by 2*similarity of the names (features with completely
+    different names are skipped).
+
+    Args:
+        outlines (OutlineSet): features to search
+        lat (float): building lat
+        lon (float): building lon
+        csv_building_name (str, optional): building name from the building code map. Defaults to None.
+        excluded_names (iterable, optional): names of features that cannot be matched (blacklist). Defaults to ().
+        weight_location_on_name (bool, optional): weight distance on name similarity. Defaults to True.
+        index (GridIndex, optional): spatial index over outlines. Only features within the search radius are
+        checked if given, otherwise every feature is. Defaults to None.
+        name_similarity (NameSimilarity, optional): precomputed name similarities of the csv buildings against 
+        the features of outlines. Names are compared on the fly if not given. Defaults to None.
+
+    Returns:
+        tuple: (feature index, distance) or (None, 100) if there is no feature
+    """
+    if index is not None:
+        candidates = index.get_candidates(lat, lon)
+    else:
+        candidates = range(len(outlines))
+
+    candidates = [f for f in candidates if outlines.names[f] not in excluded_names]
+    METRICS.count("features_scanned", len(candidates))
+    if len(candidates) == 0:
+        return None, 100
+
+    dists = get_match_distances(outlines, lat, lon, candidates, csv_building_name, weight_location_on_name, 
+                                name_similarity)
+    best = int(np.argmin(dists))
+    if not dists[best] < 100:
+        return None, 100
+    return candidates[best], float(dists[best])
+
+def score_buildings(outlines, lats, lons, csv_building_names, weight_location_on_name=True, index=None,
+                    name_similarity=None, first_building=0):
+    """Score the (csv building, feature) pairs of a block of buildings (see get_candidate_pairs)
+
+    Args:
+        first_building (int, optional): index of the first building of the block. Defaults to 0.
+
+    Returns:
+        tuple: (building indices, feature indices, distances) arrays of every pair under OUTLINE_MATCH_DISTANCE, 
+        and the number of features scanned
+    """
+    building_nums = []
+    feature_nums = []
+    dists = []
+    scanned = 0
+    for building_num, (lat, lon, name) in enumerate(zip(lats, lons, csv_building_names), first_building):
+        candidates = index.get_candidates(lat, lon) if index is not None else range(len(outlines))
+        candidates = np.asarray(candidates, dtype=np.int64)
+        scanned += len(candidates)
+        if len(candidates) == 0:
+            continue
+
+        candidate_dists = get_match_distances(outlines, lat, lon, candidates, name, weight_location_on_name,
+                                              name_similarity)
+        close = candidate_dists < OUTLINE_MATCH_DISTANCE
+        building_nums.append(np.full(np.count_nonzero(close), building_num, dtype=np.int64))
+        feature_nums.append(candidates[close])
+        dists.append(candidate_dists[close])
+
+    if len(building_nums) == 0:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0), scanned
+    return np.concatenate(building_nums), np.concatenate(feature_nums), np.concatenate(dists), scanned
+
+def write_shared_arrays(folder, arrays):
+    """Save numpy arrays to folder so worker processes can memory map them (see load_shared_arrays). The pages of
+    the files are shared by every process instead of each worker getting its own pickled copy."""
+    for name, values in arrays.items():
+        np.save(Path(folder) / f"{name}.npy", np.ascontiguousarray(values))
+
+def load_shared_arrays(folder):
+    """Return the read-only memory mapped arrays saved by write_shared_arrays, by name"""
+    return {path.stem: np.load(path, mmap_mode="r") for path in Path(folder).glob("*.npy")}
+
+# Outlines, spatial index and name similarities the buildings are scored against, set once per worker process 
+# (see init_match_worker)
+_worker_outlines = None
+_worker_index = None
+_worker_name_similarity = None
+_worker_weight_location_on_name = True
+
+def init_match_worker(folder, cell_size, threshold, weight_location_on_name):
+    """Process pool initializer. Maps the arrays shared by get_candidate_pairs instead of unpickling the outlines"""
+    global _worker_outlines, _worker_index, _worker_name_similarity, _worker_weight_location_on_name
+    arrays = load_shared_arrays(folder)
+    names = json.loads(arrays["names"].tobytes())
+    _worker_outlines = OutlineSet.from_arrays(arrays["lats"], arrays["lons"], arrays["offsets"], names["features"])
+    _worker_index = None
+    if cell_size is not None:
+        _worker_index = GridIndex.from_arrays(cell_size, arrays["cell_keys"], arrays["cell_offsets"], 
+                                              arrays["cell_features"])
+    _worker_name_similarity = None
+    if "similarity" in arrays:
+        _worker_name_similarity = NameSimilarity.from_arrays(names["csv_similarity"], names["feature_similarity"],
+                                                             arrays["similarity"], arrays["feature_cols"], 
+                                                             threshold)
+    _worker_weight_location_on_name = weight_location_on_name
+
+def score_match_block(block):
+    """Score a block of buildings against the worker's outlines"""
+    first_building, lats, lons, csv_building_names = block
+    return score_buildings(_worker_outlines, lats, lons, csv_building_names, _worker_weight_location_on_name,
+                           _worker_index, _worker_name_similarity, first_building)
+
+def get_shared_match_arrays(outlines, index=None, name_similarity=None):
+    """Return everything a worker needs to score buildings as arrays for write_shared_arrays (names are stored 
+    as utf8 json)"""
+    arrays = {"lats": outlines.lats, "lons": outlines.lons, "offsets": outlines.offsets}
+    names = {"features": outlines.names}
+    if index is not None:
+        arrays.update(index.to_arrays())
+    if name_similarity is not None:
+        arrays["similarity"] = name_similarity.matrix
+        arrays["feature_cols"] = name_similarity.feature_cols
+        names["csv_similarity"] = list(name_similarity.csv_index)
+        names["feature_similarity"] = name_similarity.feature_names[:-1]
+    arrays["names"] = np.frombuffer(json.dumps(names).encode("utf8"), dtype=np.uint8)
+    return arrays
+
+def get_candidate_pairs(outlines, lats, lons, csv_building_names, weight_location_on_name=True, index=None,
+                        name_similarity=None, jobs=OUTLINE_MATCH_JOBS, block_rows=OUTLINE_MATCH_BLOCK_ROWS):
+    """Score every (csv building, feature) pair that is close enough to be matched. With several jobs, blocks of
+    buildings are scored across a pool of worker processes that memory map the vertices, spatial index and name
+    similarities (see get_shared_match_arrays). Blocks are put back in building order, so the pairs are the same
+    no matter the number of workers.
+
+    Args:
+        outlines (OutlineSet): features to search
+        lats (list): lat of each csv building
+        lons (list): lon of each csv building
+        csv_building_names (list): name of each csv building
+        weight_location_on_name (bool, optional): weight distance on name similarity. Defaults to True.
+        index (GridIndex, optional): spatial index over outlines. Defaults to None.
+        name_similarity (NameSimilarity, optional): precomputed name similarities. Defaults to None.
+        jobs (int, optional): number of worker processes. None for the number of cpu cores. Defaults to 
+        OUTLINE_MATCH_JOBS.
+        block_rows (int, optional): number of buildings per worker task. Defaults to OUTLINE_MATCH_BLOCK_ROWS.
+
+    Returns:
+        tuple: (building indices, feature indices, distances) arrays of every pair under OUTLINE_MATCH_DISTANCE
+    """
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(lats) <= block_rows or len(outlines) == 0:
+        blocks = [score_buildings(outlines, lats, lons, csv_building_names, weight_location_on_name, index,
+                                  name_similarity)]
+    else:
+        starts = range(0, len(lats), block_rows)
+        tasks = [(start, lats[start:start + block_rows], lons[start:start + block_rows], 
+                  csv_building_names[start:start + block_rows]) for start in starts]
+        cell_size = index.cell_size if index is not None else None
+        threshold = name_similarity.threshold if name_similarity is not None else None
+        with tempfile.TemporaryDirectory(prefix="outlines-") as folder:
+            write_shared_arrays(folder, get_shared_match_arrays(outlines, index, name_similarity))
+            with ProcessPoolExecutor(max_workers=min(jobs, len(tasks)), initializer=init_match_worker,
+                                     initargs=(folder, cell_size, threshold, weight_location_on_name)) as pool:
+                blocks = list(pool.map(score_match_block, tasks))
+    METRICS.count("features_scanned", sum(b[3] for b in blocks))
+
+    return (np.concatenate([b[0] for b in blocks]), np.concatenate([b[1] for b in blocks]), 
+            np.concatenate([b[2] for b in blocks]))
+
+def assign_features(outlines, building_nums, feature_nums, dists):
+    """Match csv buildings to features in one pass. Pairs are accepted closest first, skipping pairs whose building
+    was already matched or whose feature name was already taken. Since buildings and features rank each other by
+    the same distance, this gives the same matches the blacklist re-queue loop converges to, without re-scanning
+    any features.
+
+    Args:
+        outlines (OutlineSet): features the pairs refer to
+        building_nums (np.ndarray): building index of each candidate pair
+        feature_nums (np.ndarray): feature index of each candidate pair
+        dists (np.ndarray): distance of each candidate pair
+
+    Returns:
+        dict: building index -> (feature index, distance)
+    """
+    # Ties are broken by building order then feature order
+    order = np.lexsort((feature_nums, building_nums, dists))
+
+    matches = {}
+    taken_names = set()
+    for pair in order.tolist():
+        building_num = int(building_nums[pair])
+        feature_num = int(feature_nums[pair])
+        fname = outlines.names[feature_num]
+        if building_num in matches or fname in taken_names:
+            continue
+        matches[building_num] = (feature_num, float(dists[pair]))
+        taken_names.add(fname)
+    return matches
@@ -1,6 +1,11 @@
-from bs4 import BeautifulSoup
+import argparse
 from constants import *
-from geopy.geocoders import Nominatim
+from utils import *
+from instrumentation import *
+from record_io import *
+
+# Columns of the building code map
+BUILDING_MAP_HEADER = ("building_code", "building_name", "building_address", "lat", "lon")
 
 
 def parse_page_direcory_html_file(path):
@@ -12,6 +17,7 @@ def parse_page_direcory_html_file(path):
     Returns:
         [BeautifulSoup]: beutiful soup object
     """
+    from bs4 import BeautifulSoup
     try:
         with open(path, encoding="utf8") as f:
             soup = BeautifulSoup(f, "html.parser")
@@ -21,44 +27,95 @@ def parse_page_direcory_html_file(path):
         return None
 
 
+def get_directory_buildings(parsed_html):
+    """Return the code, name and address of every building in the parsed building directory page
+
+    Args:
+        parsed_html (BeautifulSoup): parsed building directory page
+
+    Returns:
+        list: list of (building_code, building_name, building_address) tuples
+    """
+    buildings = []
+    for t in parsed_html.find_all('tr'):
+        building_code = t.find('th').contents[0].strip().upper()
+
+        td_split = t.find('td').contents[0].split(",")
+        building_name = td_split[0].strip()
+        building_location = ','.join(td_split[1:]).strip()
+        buildings.append((building_code, building_name, building_location))
+    return buildings
+
 # ===================================================================================================
 
-if __name__ == "__main__":
+def main(argv=None, prog=None):
+    """Command line entry point of parse_building_directory.py (also run by `cli.py geocode`)
+
+    Args:
+        argv (list, optional): command line arguments. Defaults to sys.argv[1:].
+        prog (str, optional): program name shown in the help. Defaults to the script name.
+    """
+    arg_parser = argparse.ArgumentParser(prog=prog, description="Create the building code map by geocoding every "
+                                         "building of the building directory page "
+                                         f"(/{HTML_FOLDER_NAME}/{CLASS_DIR_PAGE_NAME})")
+    arg_parser.add_argument("--outlines", default=None, metavar="GEOJSON",
+                            help="building outlines geojson. Buildings whose name matches an outline are placed at "
+                            "its centroid, only the others are geocoded")
+    arg_parser.add_argument("--output", default=BUILDING_CODE_MAP_PATH, 
+                            help="file to write the building code map to, its extension picks the format (default: "
+                            f"/{DATA_FOLDER_NAME}/{BUILDING_CODE_MAP_NAME})")
+    arg_parser.add_argument("--no-remote", action="store_true",
+                            help="never call the remote geocoder (buildings that are not found offline get null)")
+    args = arg_parser.parse_args(argv)
+
     # https://classes.usc.edu/building-directory/
-    parsed_html = parse_page_direcory_html_file(CLASS_DIR_PAGE_PATH)
+    with METRICS.stage("parse_html"):
+        parsed_html = parse_page_direcory_html_file(CLASS_DIR_PAGE_PATH)
 
     if parsed_html == None: # TODO check if page is empty
         print("Parse building dir HTML file is empty. Quitting")
         exit()
 
-    tables = parsed_html.find_all('tr')
-    csv = "building_code,building_name,building_address,lat,lon\n"
+    with METRICS.stage("get_directory_buildings"):
+        buildings = get_directory_buildings(parsed_html)
+    METRICS.count("buildings_parsed", len(buildings))
+    rows = []
+
+    # Buildings found in the outlines never go to the network
+    offline_locations = {}
+    if args.outlines is not None:
+        # numpy is only needed for the outlines
+        from outlines import load_outlines, geocode_from_outlines
+        with METRICS.stage("geocode_from_outlines"):
+            offline_locations = geocode_from_outlines([b[1] for b in buildings], load_outlines(args.outlines))
+        found = sum(offline_locations[b[1]] is not None for b in buildings)
+        print(f"Located {found}/{len(buildings)} buildings from the outlines")
+    remaining = [b[2] for b in buildings if offline_locations.get(b[1]) is None]
+
+    # One client for every lookup. Results are cached so a refresh only geocodes new/expired addresses
+    locations = {}
+    cache = None
+    if len(remaining) > 0 and not args.no_remote:
+        # geopy is slow to import and only needed here
+        from geopy.geocoders import Nominatim
+        from geocode_cache import GeocodeCache, geocode_addresses
+        geolocator = Nominatim(user_agent="my_user_agent")
+        cache = GeocodeCache()
+        with METRICS.stage("geocode"):
+            locations = geocode_addresses(remaining, geolocator, cache)
     
     geo_success = 0
     geo_failed = 0
     geo_total = 0
 
-    for t in tables:
-        building_code = t.find('th').contents[0].strip().upper()
-        
-        td_split = t.find('td').contents[0].split(",")
-        building_name = td_split[0].strip()
-        building_location = ''.join(td_split[1:]).strip()
-
-        
-        geolocator = Nominatim(user_agent="my_user_agent")
-        geo_location = geolocator.geocode(building_location + ", Los Angeles, CA", geometry ="svg")
-
-        # Try for places out of LA
-        if geo_location is None: 
-            geo_location = geolocator.geocode(building_location)
-
-        if geo_location is not None and len(geo_location) > 0:
+    for building_code, building_name, building_location in buildings:
+        geo_location = offline_locations.get(building_name) or locations.get(building_location)
+        if geo_location is not None:
             geo_success += 1
-            print(f"SUCCESS: " + building_location + ", Los Angeles, CA")
-            print(geo_location.raw)
-            lat = str(geo_location.latitude)
-            lon = str(geo_location.longitude)
+            if PRINT_PROGRESS:
+                print(f"SUCCESS: " + building_location + ", Los Angeles, CA")
+            lat = str(geo_location[0])
+            lon = str(geo_location[1])
         else:
             geo_failed += 1
             print(f"ERROR:   " + building_location + ", Los Angeles, CA")
@@ -66,11 +123,22 @@ if __name__ == "__main__":
             lon = "null"
         geo_total += 1
 
-        csv += f"{building_code},{building_name},{building_location},{lat},{lon}\n"
+        rows.append((building_code, building_name, building_location, lat, lon))
     
     print(f"Geo Location success rate of "\
-        "{100*np.round((geo_success/geo_total),2)}% (Successful: {geo_success}, Failed: {geo_failed})")
-    # Note: Buildings with commas in location have commas removed here (ie:  "P.O. Box 398, Catalina Island,
-    # 90704" becomes "P.O. Box 398 Catalina Island 90704")
-    with open(BUILDING_CODE_MAP_PATH,"w") as f:
-        f.write(csv)
+        f"{round(100*geo_success/max(geo_total,1),2)}% (Successful: {geo_success}, Failed: {geo_failed})")
+    METRICS.count("buildings_geocoded", geo_success, result="success")
+    METRICS.count("buildings_geocoded", geo_failed, result="failed")
+    if cache is not None:
+        print(f"Geocode cache hits: {cache.hits}, Cache misses: {cache.misses}")
+        cache.close()
+    # Cells with commas are quoted (ie: "P.O. Box 398, Catalina Island, 90704")
+    with METRICS.stage("write_output"), open_record_writer(args.output, BUILDING_MAP_HEADER) as writer:
+        writer.write_rows(rows)
+    print(f"Wrote {writer.rows} buildings: (At: {args.output})")
+
+    for path in METRICS.write_run("parse_building_directory"):
+        print(f"Wrote metrics: (At: {path})")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,14 @@
-from bs4 import BeautifulSoup
+import argparse
+import json
+import time
+from html.parser import HTMLParser
 from constants import *
 from utils import *
+from instrumentation import *
+from record_io import *
+# exposure.py and snapshot_cache.py are imported by the functions that need them, so --help starts fast
+
+HEADING_TAGS = ("h1", "h2", "h3", "h4", "h5", "h6")
 
 def parse_cases_html_file(path):
     """Parse the given html file using BeautifulSoup. Return BeautifulSoup object if parsable, None otherwise. 
@@ -11,6 +19,8 @@ def parse_cases_html_file(path):
     Returns:
         [BeautifulSoup]: beutiful soup object
     """
+    # Only needed when STREAM_HTML_PAGES is off, so it is not imported with the module
+    from bs4 import BeautifulSoup
     try:
         with open(path, encoding="utf8") as f:
             soup = BeautifulSoup(f, "html.parser")
@@ -19,6 +29,84 @@ def parse_cases_html_file(path):
         print(f"Could not find the html file: {path}")
         return None
 
+class StrongTextExtractor(HTMLParser):
+    """Incremental html parser that only keeps the first text node of every <strong> element (what 
+    BeautifulSoup's `strong.contents[0]` returns) along with the text of the closest preceding heading. Nothing 
+    else from the page is stored, so memory use only depends on the size of the pending elements, not the page.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.heading = None
+        self.found = []
+        self._open_strongs = 0
+        self._strong_text = None
+        self._heading_tag = None
+        self._heading_text = []
+
+    def _finish_strong_text(self):
+        """Emit the text collected for the most recently opened <strong> element (if any)"""
+        if self._strong_text is not None:
+            self.found.append((self.heading, "".join(self._strong_text)))
+            self._strong_text = None
+
+    def handle_starttag(self, tag, attrs):
+        # The first child of the strong ended, its text is complete
+        self._finish_strong_text()
+        if tag == "strong":
+            self._open_strongs += 1
+            self._strong_text = []
+        elif tag in HEADING_TAGS:
+            self._heading_tag = tag
+            self._heading_text = []
+
+    def handle_endtag(self, tag):
+        self._finish_strong_text()
+        if tag == "strong" and self._open_strongs > 0:
+            self._open_strongs -= 1
+        elif tag == self._heading_tag:
+            self.heading = " ".join("".join(self._heading_text).split())
+            self._heading_tag = None
+
+    def handle_data(self, data):
+        if self._strong_text is not None:
+            self._strong_text.append(data)
+        if self._heading_tag is not None:
+            self._heading_text.append(data)
+
+    def pop_found(self):
+        """Return every (heading, strong text) pair found since the last call and clear them"""
+        found = self.found
+        self.found = []
+        return found
+
+def iter_strong_text(path, with_headings=False, chunk_size=64*1024):
+    """Stream the given html file and yield the text of each <strong> element without building the whole DOM.
+    The yielded text is the same as `strong.contents[0]` for every element of `soup.find_all('strong')`, so the 
+    output can be fed straight into parse_page_strong_text.
+
+    Args:
+        path (str): Path location to html file
+        with_headings (bool, optional): Yield (heading, text) tuples where heading is the text of the closest 
+        preceding <h1>-<h6> element (ie: the date the exposures were posted). Defaults to False.
+        chunk_size (int, optional): Number of characters read from the file at a time. Defaults to 64KB.
+
+    Yields:
+        str: text of the <strong> element (or a (heading, text) tuple if with_headings is set)
+    """
+    extractor = StrongTextExtractor()
+    with open(path, encoding="utf8") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            extractor.feed(chunk)
+            for heading, text in extractor.pop_found():
+                yield (heading, text) if with_headings else text
+    extractor.close()
+    for heading, text in extractor.pop_found():
+        yield (heading, text) if with_headings else text
+
 # def parse_page_div_text(divs):
 #     div_with_most_paragraphs = 
 
@@ -26,7 +114,7 @@ def parse_page_strong_text(strongs):
     """Parse the page into a list of lines that contain covid exposures by class and date
 
     Args:
-        strongs (list): List of lines with <strong> elements from the soup class. List should be of str type though.
+        strongs (iterable): <strong> elements from the soup class or their text as str (ie: from iter_strong_text)
 
     Returns:
         [list]: List of valid covid exposure classes with all accompaning data. 
@@ -34,7 +122,8 @@ def parse_page_strong_text(strongs):
     """
     splits = []
     for i in strongs:
-        white_space_split = i.contents[0].split()
+        text = i if isinstance(i, str) else i.contents[0]
+        white_space_split = text.split()
         removed_junk = []
         if len(white_space_split) >= 3:
             removed_junk.append(white_space_split[0])
@@ -55,56 +144,10 @@ def parse_page_strong_text(strongs):
     return splits
 
 
-def str_contains_only_day_of_week_characters(input_string):
-    """Check if the string given contains only characters used in the day of week section (ie: "MWF")
-
-    Args:
-        input_string (str): String from cell expecting days of week location
-
-    Returns:
-        [bool]: True if only contains days of week chars. False otherwise
-    """
-    days_of_week_chars = ["m","t","w","h","f","s"]
-    for c in input_string:
-        if c.lower() not in days_of_week_chars:
-            return False
-            
-    return True
-
-def str_is_acceptable_time(input_string):
-    """Check if the given string is parsable as a time (format = numbers : numbers)
-
-    Args:
-        input_string ([type]): True if parsable as time false otherwise
-    """
-    split = input_string.split(":")
-    if len(split) != 2:
-        return False
-    
-    if split[0].isnumeric() and split[1].isnumeric():
-        return True
-    
-    return False
-
-def str_is_acceptable_characters(input_string):
-    """Check if the stirng contains only valid askii characters (between 32 and 126)
-
-    Args:
-        input_string (str): input string to check 
-
-    Returns:
-        boolean: True if valid. False if invalid.
-    """
-    for c in input_string:
-        o = ord(c)
-        if o < 32 or o > 126:
-            return False
-    return True
-
 def create_csv(splits, delim=",",newline="\n"):
     """Create a csv file from the splits of every parsed line. Attempt to make each line have the same number of 
     elements filling unknown cells with null. Also provides another level of rudimentary validation before appending 
-    a line to the putput
+    a line to the putput. Kept for compatibility, the record based create_rows function should be preferred.
 
     Args:
         splits (list): list of strings for every parsed line
@@ -115,117 +158,34 @@ def create_csv(splits, delim=",",newline="\n"):
         [str]: csv string. Each row is an exposure event with class. Note: output needs to be validated with the
         validate_csv function after due to the inconsistant nature of USC's recording.
     """
-    csv_header = f"class_name{delim}code{delim}weekday{delim}start_time{delim}end_time{delim}location{newline}"
-    csv_str = csv_header
-    for i in splits:
-        if len(i) >= 1:
-            csv_str += i[0] + delim
-        else:
-            csv_str += 5*("null" + delim)
-        
-        if len(i) >= 2:
-            csv_str += i[1] + delim
-        else:
-            csv_str += 4*("null" + delim)
-
-        if len(i) >= 5:
-            has_weekdays = str_contains_only_day_of_week_characters(i[2])
-            has_first_time = str_is_acceptable_time(i[3])
-            has_second_time = str_is_acceptable_time(i[4])
-            if has_weekdays and has_first_time and has_second_time:
-                csv_str += i[2] + delim
-                csv_str += i[3] + delim
-                csv_str += i[4] + delim
-            else:
-                csv_str += 3*("null" + delim)
-        
-        if not str_is_acceptable_time(i[-1]):
-            csv_str += i[-1] + newline
-        else:
-            csv_str += "null" + newline
-    return csv_str
+    from exposure import EXPOSURE_HEADER, create_rows, rows_to_csv
+    return rows_to_csv([EXPOSURE_HEADER] + create_rows(splits), delim, newline)
 
 
 def validate_csv(csv_str, delim=',',newline="\n",quiet_mode=False):
-    """Reads in csv with possibly invalid rows and returns a csv with invalid rows removed. Prints out invalid lines 
-    as they come.
+    """Reads in csv with possibly invalid rows and returns a csv with invalid rows removed. Prints a summary of the 
+    invalid lines. Kept for compatibility, the record based validate_rows function should be preferred.
 
     Args:
         csv_str (str): csv string
         delim (str): Delimiter for csv. Defaults to ','.
         newline (str): new line for csv. Defaults to "\\n".
         quiet_mode (bool): Dissable printing invalid lines
-    """
-
-    valid_first_line = f"class_name{delim}code{delim}weekday{delim}start_time{delim}end_time{delim}location"
-    listify = csv_str.split(newline) 
 
-    if listify[0] != valid_first_line:
-        print(f"Given: {listify[0]}")
-        print(f"Expected: {valid_first_line}")
-        print("Error: first line of csv must be valid header. Aborting.")
-        sys.exit()
-
-    outp = listify[0] + newline
-    for i in range(1,len(listify)-1):
-        line_valid = True
-        split = listify[i].split(delim)
-        
-        # Validate row has all columns
-        if len(split) != 6:
-            line_valid = False
-            if not quiet_mode:
-                bad_csv_print(split,"invalid length",i)
-        
-        # Validate first row (class name) has name + code hyphen sep
-        elif len(split[0].split("-")) != 2:
-            line_valid = False
-            if not quiet_mode:
-                bad_csv_print(split, "Invalid class field",i)
-
-        # Validate chass code is strictly numeric
-        elif not split[1].isnumeric():
-            line_valid = False
-            if not quiet_mode:
-                bad_csv_print(split, "Class ID not numeric",i)
-        
-        # Validate days of week contain only day of the week characters
-        elif not str_contains_only_day_of_week_characters(split[2]) and not split[2].lower() == "null":
-            line_valid = False
-            if not quiet_mode:
-                bad_csv_print(split, "Day of week field invalid",i)
-
-        # Check start timestamp is valid
-        elif not str_is_acceptable_time(split[3]) and not split[3].lower() == "null":
-            line_valid = False
-            if not quiet_mode:
-                bad_csv_print(split, "Start time invalid",i)
-
-        # Check end timestamp is valid
-        elif not str_is_acceptable_time(split[4]) and not split[4].lower() == "null":
-            line_valid = False
-            if not quiet_mode:
-                bad_csv_print(split, "End time invalid",i)
-
-        elif not str_is_acceptable_characters(split[5]):
-            line_valid = False
-            if not quiet_mode:
-                bad_csv_print(split, "Location is not alphanumeric", i) 
-
-        if line_valid:
-            l = listify[i]
-            els = l.split(delim)
-            for i,o in enumerate(els):
-                if i+1 != len(els):
-                    outp += o + delim
-                else:
-                    outp += o + newline
+    Raises:
+        InvalidHeaderError: the first line of the csv is not EXPOSURE_HEADER
+    """
+    from exposure import EXPOSURE_VALIDATOR, read_csv_rows, validate_rows, exposures_to_csv
+    rows = read_csv_rows(csv_str, delim, newline)
+    EXPOSURE_VALIDATOR.check_header(rows[0] if len(rows) > 0 else ())
 
-    return outp
+    exposures = validate_rows(rows[1:], quiet_mode=quiet_mode)
+    return exposures_to_csv(exposures, delim=delim, newline=newline)
     
 def add_building_code_name_and_location(target_csv, building_map_csv,delim=",",newline="\n"):
     """Appends a `building_name` and `building_location` field to the end od the target_csv and attemts to match 
-    building codes from the building_map_csv to each building
+    building codes from the building_map_csv to each building. Kept for compatibility, the record based 
+    add_building_information function should be preferred.
 
     Args:
         target_csv (str): string representation of csv. Any format will do as long as the `location` field is the 
@@ -234,54 +194,319 @@ def add_building_code_name_and_location(target_csv, building_map_csv,delim=",",n
         delim (str, optional): Delimiter for csv file. Defaults to ",".
         newline (str, optional): newline indicator for csv file. Defaults to "\\n".
     """
-    class_map_dict = {}
-    building_csv_line = building_map_csv.split(newline)
-    building_csv_line = building_csv_line[1:] # ignore first line (header)
-    target_csv_line = target_csv.split(newline)
-
-    # Append new columns to header
-    output_csv = target_csv_line[0][0:] # target csv header
-    building_map_csv_header_list = building_map_csv.split(newline)[0].split(delim)
-    building_map_csv_header = building_map_csv_header_list[1:]
-    building_map_csv_header = delim.join(building_map_csv_header)
-    output_csv += building_map_csv_header + newline
-
-    # create dict associating building code with csv information
-    for i in building_csv_line:
-        elements = i.split(delim)
-        building_csv = delim.join(elements[1:])
-        if len(elements[0]) > 1:
-            class_map_dict[elements[0]] = building_csv
-
-    target_csv_line = target_csv_line[1:] # ignore header
-
-    # for each line of the target csv
-    for i in target_csv_line:
-        
-        if len(i) > 1: # Ignore empty lines
-            elements = i.split(delim)
-            building_code = elements[-1]
-
-            # Get building code information from last line of target csv
-            if len(building_code) >= 3 and building_code.lower() != "office" and building_code.lower() != "null":
-                building_code = building_code[0:3].upper()
-            else:
-                building_code = "No building code found"
-
-            output_csv += i[0:] #Existing elements minus newline
-            if building_code in class_map_dict:
-                output_csv += delim + class_map_dict.get(building_code)
-                output_csv += newline
-            else:
-                output_csv += (len(building_map_csv_header_list)-1)*(delim + "null")
-                output_csv += newline
-
-    return output_csv
-# ========================================================================================================
+    from exposure import read_building_map, read_csv_rows, get_building_fields, rows_to_csv
+    building_map = read_building_map(building_map_csv, delim, newline)
+    target_rows = read_csv_rows(target_csv, delim, newline)
+    if len(target_rows) == 0:
+        return ""
 
-if __name__ == "__main__":
+    output_rows = [target_rows[0] + list(building_map.header)]
+    for row in target_rows[1:]:
+        output_rows.append(row + list(get_building_fields(row[-1], building_map)))
+    return rows_to_csv(output_rows, delim, newline)
+
+def parse_html_page(path):
+    """Parse the exposure lines out of the given covid data page. Uses the streaming reader when
+    STREAM_HTML_PAGES is set.
+
+    Args:
+        path (str): Path location to html file
+
+    Returns:
+        [list]: List of parsed exposure lines (see parse_page_strong_text). None if the file could not be read.
+    """
+    with METRICS.stage("parse_html"):
+        if STREAM_HTML_PAGES:
+            try:
+                return parse_page_strong_text(iter_strong_text(path))
+            except FileNotFoundError:
+                print(f"Could not find the html file: {path}")
+                return None
+
+        parsed_html = parse_cases_html_file(path)
+        if parsed_html is None:
+            return None
+        return parse_page_strong_text(parsed_html.find_all('strong'))
+
+def load_page_exposures(path, cache=None, html_hash=None, quiet_mode=True, report=None):
+    """Parse and validate the given covid data page. If a cache is given, pages that were already parsed are
+    read from the cache instead.
+
+    Args:
+        path (str): Path location to html file
+        cache (SnapshotCache, optional): parsed page cache. Defaults to None.
+        html_hash (str, optional): content hash of the page if already known. Defaults to None.
+        quiet_mode (bool, optional): Dissable printing invalid lines. Defaults to True.
+        report (ValidationReport, optional): report to add the rejected rows to (only when the page is parsed, not 
+        when it comes from the cache). Defaults to None.
+
+    Returns:
+        [list]: list of valid Exposure. None if the file could not be read.
+    """
+    from exposure import create_rows, validate_rows
+    from snapshot_cache import file_hash
+    if cache is not None:
+        html_hash = html_hash or file_hash(path)
+        exposures = cache.get(html_hash)
+        if exposures is not None:
+            return exposures
+
+    splits = parse_html_page(path)
+    if splits is None:
+        return None
+
+    exposures = validate_rows(create_rows(splits), quiet_mode=quiet_mode, report=report)
+    if cache is not None:
+        cache.put(html_hash, exposures)
+    return exposures
+
+def find_html_pages(folder):
+    """Return a sorted list of paths of every covid data page in the given folder. The building directory page
+    is ignored since it is not a covid data page.
+
+    Args:
+        folder (str): folder to search (ie: HTML_FOLDER_PATH)
+    """
+    pages = []
+    for f in sorted(listdir(folder)):
+        path = pjoin(folder, f)
+        if isfile(path) and f.lower().endswith((".html", ".htm")) and f != CLASS_DIR_PAGE_NAME:
+            pages.append(path)
+    return pages
+
+def get_batch_outputs(pages, output_folder, record_format=RECORD_FORMAT):
+    """Return the output file of every page, named after the page (ie: html/page.html -> output/page.csv)
+
+    Args:
+        pages (list): paths of the covid data pages (see find_html_pages)
+        output_folder (str): folder to write the output files to
+        record_format (str, optional): format of the output files (see record_io.py). Defaults to RECORD_FORMAT.
+
+    Raises:
+        ValueError: pages only differ by their extension (ie: page.html and page.htm) and would write the same file
+    """
+    pages_by_stem = {}
+    for page in pages:
+        # Lower case so names that only differ by case do not overwrite each other on case insensitive file systems
+        pages_by_stem.setdefault(Path(page).stem.lower(), []).append(Path(page).name)
+    duplicates = [names for names in pages_by_stem.values() if len(names) > 1]
+    if len(duplicates) > 0:
+        raise ValueError(f"Pages would write the same output file, rename or remove one of each: "
+                         f"{'; '.join(', '.join(names) for names in duplicates)}")
+    return [get_record_path(output_folder, Path(page).stem, record_format) for page in pages]
+
+# Building code map, parsed page cache and history store loaded once per batch worker process 
+# (see init_batch_worker)
+_batch_building_map = None
+_batch_cache = None
+_batch_history = None
+_batch_normalize = False
+
+def init_batch_worker(building_map, cache=None, history=None, metrics=False, trace_memory=False, normalize=False):
+    """Process pool initializer. Stores the building code map so every page parsed by this worker reuses it
+    instead of re-reading it from disk.
+
+    Args:
+        building_map (BuildingMap): building code map or None to skip appending building information
+        cache (SnapshotCache, optional): parsed page cache shared by every worker. Defaults to None.
+        history (HistoryStore, optional): store to write a chunk of every page to. Defaults to None.
+        metrics (bool, optional): record the stages and counters of every page (see instrumentation.py). 
+        Defaults to False.
+        trace_memory (bool, optional): trace allocations for the peak memory of each stage. Defaults to False.
+        normalize (bool, optional): write the normalized cells (see Exposure.to_row). Defaults to False.
+    """
+    global _batch_building_map, _batch_cache, _batch_history, _batch_normalize
+    _batch_building_map = building_map
+    _batch_cache = cache
+    _batch_history = history
+    _batch_normalize = normalize
+    if metrics:
+        METRICS.enable(trace_memory)
+
+def parse_batch_page(page, output_path, write_history=True):
+    """Parse, validate and (optionally) append building information to a single page and write the result to
+    output_path. Runs inside a batch worker process.
+
+    Args:
+        page (str): path to the covid data html page
+        output_path (str): path of the file to create, its extension picks the format (see record_io.py)
+        write_history (bool, optional): write a history chunk for the page (if the worker has a history store).
+        Defaults to True.
+
+    Returns:
+        dict: manifest entry describing the result of this page. The history chunk written for the page (if any)
+        is returned under "history_chunk" for the main process to add to the store index, and the metrics recorded
+        for the page (if enabled) under "metrics" for the main process to merge.
+    """
+    from exposure import EXPOSURE_VALIDATOR, add_building_information, write_exposure_records
+    from validation import ValidationReport
+    from snapshot_cache import file_hash
+    start = time.perf_counter()
+    entry = {"page": str(page), "output": None, "valid_rows": 0, "cache_hit": False, "error": None, 
+             "validation": None, "history_chunk": None}
+    try:
+        enriched = _batch_building_map is not None
+        building_header = _batch_building_map.header if enriched else ()
+
+        exposures = None
+        html_hash = None
+        if _batch_cache is not None:
+            html_hash = file_hash(page)
+            exposures = _batch_cache.get(html_hash, enriched)
+            entry["cache_hit"] = exposures is not None
+
+        if exposures is None:
+            report = ValidationReport(EXPOSURE_VALIDATOR.errors)
+            # The page was already looked up, so it is parsed without going through the cache again
+            exposures = load_page_exposures(page, report=report)
+            if exposures is None:
+                raise FileNotFoundError(page)
+            entry["validation"] = report.to_dict() if report.total > 0 else None
+            if _batch_cache is not None:
+                # Also kept without building information for the interactive mode
+                _batch_cache.put(html_hash, exposures)
+
+            if enriched:
+                with METRICS.stage("add_building_information"):
+                    exposures = add_building_information(exposures, _batch_building_map)
+                if _batch_cache is not None:
+                    _batch_cache.put(html_hash, exposures, enriched)
+        entry["valid_rows"] = len(exposures)
+
+        with METRICS.stage("write_output"):
+            write_exposure_records(exposures, output_path, building_header, normalize=_batch_normalize)
+        entry["output"] = str(output_path)
+
+        if _batch_history is not None and write_history:
+            html_hash = html_hash or file_hash(page)
+            if not _batch_history.has_source(html_hash):
+                with METRICS.stage("write_history_chunk"):
+                    entry["history_chunk"] = _batch_history.write_chunk(exposures, get_snapshot_date(page), 
+                                                                        html_hash, building_header)
+    except Exception as e:
+        entry["error"] = f"{type(e).__name__}: {e}"
+    entry["seconds"] = round(time.perf_counter() - start, 4)
+    if METRICS.enabled:
+        METRICS.count("pages", result="failed" if entry["error"] is not None else "parsed")
+        METRICS.count("rows_written", entry["valid_rows"])
+        METRICS.add_stage("page", entry["seconds"])
+        entry["metrics"] = METRICS.pop()
+    return entry
+
+def run_batch(html_folder=HTML_FOLDER_PATH, output_folder=BATCH_OUTPUT_FOLDER_PATH, jobs=None, 
+              building_map_path=BUILDING_CODE_MAP_PATH, use_cache=True, history_folder=HISTORY_FOLDER_PATH,
+              record_format=RECORD_FORMAT, normalize=NORMALIZE_CELLS):
+    """Parse every covid data page in html_folder across a pool of worker processes. Writes one file per page to
+    output_folder along with a manifest (BATCH_MANIFEST_NAME) describing every page.
+
+    Args:
+        html_folder (str, optional): folder with the covid data pages. Defaults to HTML_FOLDER_PATH.
+        output_folder (str, optional): folder to write the output files to. Defaults to BATCH_OUTPUT_FOLDER_PATH.
+        jobs (int, optional): number of worker processes. Defaults to the number of cpu cores.
+        building_map_path (str, optional): building code map csv to append building information with. None to 
+        skip. Defaults to BUILDING_CODE_MAP_PATH.
+        use_cache (bool, optional): read/write parsed pages from the snapshot cache. Defaults to True.
+        history_folder (str, optional): history store to append every new page to. None to skip. Defaults to 
+        HISTORY_FOLDER_PATH.
+        record_format (str, optional): format of the output files (see record_io.py). Defaults to RECORD_FORMAT.
+        normalize (bool, optional): write the normalized cells instead of the cells as they appear on the pages
+        (see Exposure.to_row). Defaults to NORMALIZE_CELLS.
+
+    Returns:
+        dict: the manifest that was written
+
+    Raises:
+        ValueError: two pages would write the same output file (see get_batch_outputs)
+    """
+    # Only imported for batches so the interactive mode (and --help) starts fast
+    from concurrent.futures import ProcessPoolExecutor
+    from exposure import read_building_map
+    from snapshot_cache import SnapshotCache, file_hash
+    from history_store import HistoryStore
+
+    if record_format in ("parquet", "arrow"):
+        # Fail before any page is parsed rather than once per page
+        import_pyarrow()
+    pages = find_html_pages(html_folder)
+    outputs = get_batch_outputs(pages, output_folder, record_format)
+    os.makedirs(output_folder, exist_ok=True)
+
+    building_map = None
+    if building_map_path is not None:
+        with open(building_map_path, "r") as csv_reader:
+            building_map = read_building_map(csv_reader.read())
+
+    cache = SnapshotCache(building_map_path=building_map_path) if use_cache else None
+    history = HistoryStore(history_folder) if history_folder is not None else None
+
+    # Pages with the same content would write the same chunk (or chunks add_chunks drops), so only the first page
+    # of every new source writes one
+    write_history = [False]*len(pages)
+    if history is not None:
+        seen = set()
+        for i, page in enumerate(pages):
+            source = file_hash(page)
+            write_history[i] = source not in seen and not history.has_source(source)
+            seen.add(source)
+
+    jobs = jobs or os.cpu_count() or 1
+
+    start = time.perf_counter()
+    entries = []
+    initargs = (building_map, cache, history, METRICS.enabled, METRICS.trace_memory, normalize)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_batch_worker, initargs=initargs) as pool:
+        # chunksize keeps the per-task overhead low when there are hundreds of small pages
+        chunksize = max(1, len(pages) // (4*jobs))
+        for entry in pool.map(parse_batch_page, pages, outputs, write_history, chunksize=chunksize):
+            if entry["error"] is not None:
+                print(f"ERROR:   {entry['page']} ({entry['error']})")
+            elif PRINT_PROGRESS:
+                print(f"SUCCESS: {entry['page']} ({entry['valid_rows']} rows)")
+            if "metrics" in entry:
+                METRICS.merge(entry.pop("metrics"))
+            entries.append(entry)
+    METRICS.add_stage("batch", time.perf_counter() - start)
+
+    # Chunks are added to the index from this process only so workers never write it concurrently
+    history_chunks = [e.pop("history_chunk") for e in entries]
+    with METRICS.stage("add_history_chunks"):
+        history_added = history.add_chunks([c for c in history_chunks if c]) if history is not None else 0
+
+    rejected = {}
+    for entry in entries:
+        for error, count in (entry["validation"] or {}).get("rejected", {}).items():
+            rejected[error] = rejected.get(error, 0) + count
+
+    cache_hits = sum(1 for e in entries if e["cache_hit"])
+    manifest = {
+        "created": datetime.utcnow().strftime('%m-%d-%Y %H:%M:%S [UTC]'),
+        "building_map": None if building_map_path is None else str(building_map_path),
+        "jobs": jobs,
+        "seconds": round(time.perf_counter() - start, 4),
+        "cache": None if cache is None else {"hits": cache_hits, "misses": len(entries) - cache_hits, 
+                                              "evicted": cache.evict()},
+        "history": None if history is None else {"folder": str(history_folder), "added": history_added},
+        "rejected": rejected,
+        "pages": entries,
+    }
+    with open(Path(output_folder) / BATCH_MANIFEST_NAME, "w") as manifest_writer:
+        json.dump(manifest, manifest_writer, indent=2)
+
+    failed = sum(1 for e in entries if e["error"] is not None)
+    print(f"Parsed {len(entries)-failed}/{len(entries)} pages in {manifest['seconds']}s (Failed: {failed})")
+    if cache is not None:
+        print(f"Cache hits: {cache_hits}, Cache misses: {len(entries) - cache_hits}")
+    if len(rejected) > 0:
+        print(f"Rejected rows: {', '.join(f'{error}: {count}' for error, count in rejected.items())}")
+    if history is not None:
+        print(f"Added {history_added} snapshots to the history store ({history_folder})")
+    return manifest
+
+def run_interactive():
+    """Parse a single page chosen from the html folder, asking the user what to do along the way"""
     # https://sites.google.com/usc.edu/covidnotifications-ay22/home
-    
+    from exposure import read_building_map, add_building_information, write_exposure_records
+    from snapshot_cache import SnapshotCache, file_hash
 
     # Ask user which file they want to open
     menu_title = "Select a file to parse from html"
@@ -292,62 +517,108 @@ if __name__ == "__main__":
     choice = simple_menu_print(f"Select a file to parse from the /{HTML_FOLDER_NAME} directory:",html_pages)
     selected = html_pages_path[choice-1]
 
-    print("Parsing html to csv: ",end="",flush=True)
-    parsed_html = parse_cases_html_file(selected)
+    print("Parsing and validating html: ",end="",flush=True)
+    cache = SnapshotCache() if USE_SNAPSHOT_CACHE else None
+    exposures = load_page_exposures(selected, cache, quiet_mode = not VERBOSE)
 
-    if parsed_html == None: # TODO check if page is empty
+    if exposures == None: # TODO check if page is empty
         print("Parsed HTML file is empty. Quitting")
         sys.exit()
 
-    strongs = parsed_html.find_all('strong')
-    splits = parse_page_strong_text(strongs)
-    
-    unvalidated_csv = create_csv(splits)
-    print("Done")
-
-    print("Validating csv...")
-    valid_csv = validate_csv(unvalidated_csv,quiet_mode = not VERBOSE)
-    print("Done")
+    building_header = ()
+    print("Done" if cache is None or cache.hits == 0 else "Done (cached)")
+    if cache is not None:
+        cache.evict()
 
     print("\nShould this program try to append building code information to the end of the csv?: [y/n]")
     choice=input().lower()
     if choice == "y" or choice == "yes":
         try:
-            class_dir_map = ""
             # read in the building code map csv file
             print(f"Appending building information: (Using: {BUILDING_CODE_MAP_PATH})")
-            print("Appending building information: (Using: {})".format(BUILDING_CODE_MAP_PATH))
             with open(BUILDING_CODE_MAP_PATH,"r") as csv_reader:
-                class_dir_map = csv_reader.read()
+                building_map = read_building_map(csv_reader.read())
 
-            mapped_csv = add_building_code_name_and_location(valid_csv,class_dir_map)
+            with METRICS.stage("add_building_information"):
+                exposures = add_building_information(exposures,building_map)
+            building_header = building_map.header
         except Exception as e:
             print(f"Something went wrong: {e}")
 
             print("\nSave unmapped building code csv? [y/n]")
             choice = input()
-            if choice == "y" or choice == "yes":
-                mapped_csv = valid_csv
-            else:
+            if choice != "y" and choice != "yes":
                 sys.exit()
-    else:
-        mapped_csv = valid_csv
 
     print("\nWhat would you like to name the output?")
     file_name = input()
 
-    # Append .csv to the end if needed
+    # Append the extension of the default format if needed. Any other extension of record_io.py picks that format
     tmp = file_name.split('.')
     if len(tmp) == 1:
-        file_name = file_name + ".csv"
+        file_name = file_name + RECORD_FORMATS[RECORD_FORMAT]
 
     out_file_full_path = PROJECT_ROOT_PATH / file_name
-    # Write the final csv file
-    print(f"Creating output csv file: (At: {out_file_full_path})")
-    with open(out_file_full_path,"w") as csv_writer:
-        csv_writer.write(mapped_csv)
+    # Write the final output file
+    print(f"Creating output file: (At: {out_file_full_path})")
+    with METRICS.stage("write_output"):
+        write_exposure_records(exposures, out_file_full_path, building_header, normalize=NORMALIZE_CELLS)
+
+    if USE_HISTORY_STORE:
+        from history_store import HistoryStore
+        history = HistoryStore()
+        with METRICS.stage("write_history_chunk"):
+            added = history.ingest(exposures, get_snapshot_date(selected), file_hash(selected), building_header)
+        if added:
+            print(f"Added snapshot to the history store (At: {HISTORY_FOLDER_PATH})")
+
+    for path in METRICS.write_run("parser"):
+        print(f"Wrote metrics: (At: {path})")
 
+# ========================================================================================================
 
+def main(argv=None, prog=None):
+    """Command line entry point of parser.py (also run by `cli.py parse`)
 
+    Args:
+        argv (list, optional): command line arguments. Defaults to sys.argv[1:].
+        prog (str, optional): program name shown in the help. Defaults to the script name.
+    """
+    arg_parser = argparse.ArgumentParser(prog=prog, description="Parse USC covid data pages into csv files")
+    subparsers = arg_parser.add_subparsers(dest="command")
+    batch_parser = subparsers.add_parser("batch", help=f"parse every page in the /{HTML_FOLDER_NAME} directory")
+    batch_parser.add_argument("--jobs", type=int, default=None, help="number of worker processes (default: cpu count)")
+    batch_parser.add_argument("--html", default=HTML_FOLDER_PATH, help="folder with the covid data pages")
+    batch_parser.add_argument("--output", default=BATCH_OUTPUT_FOLDER_PATH, help="folder to write the output files to")
+    batch_parser.add_argument("--format", default=RECORD_FORMAT, choices=list(RECORD_FORMATS), 
+                              help=f"format of the output files (default: {RECORD_FORMAT}, parquet and arrow need pyarrow)")
+    batch_parser.add_argument("--no-building-map", action="store_true", help="do not append building information")
+    batch_parser.add_argument("--no-cache", action="store_true", help="parse every page even if it was cached")
+    batch_parser.add_argument("--normalize", action="store_true", 
+                              help="write weekdays in order and zero padded times (ie: H -> TH, 9:30 -> 09:30)")
+    batch_parser.add_argument("--history", default=HISTORY_FOLDER_PATH, help="history store to append the pages to")
+    batch_parser.add_argument("--no-history", action="store_true", help="do not append the pages to the history store")
+    batch_parser.add_argument("--metrics", default=None, 
+                              help="write per stage timings and counters to this file (.prom for prometheus, json otherwise)")
+    batch_parser.add_argument("--trace-memory", action="store_true", 
+                              help="trace allocations for the peak memory of each stage (slow)")
+    args = arg_parser.parse_args(argv)
+
+    if args.command == "batch":
+        if args.metrics is not None:
+            METRICS.enable(args.trace_memory or None)
+        building_map_path = None if args.no_building_map else BUILDING_CODE_MAP_PATH
+        history_folder = None if args.no_history or not USE_HISTORY_STORE else args.history
+        run_batch(args.html, args.output, args.jobs, building_map_path, not args.no_cache, history_folder, 
+                  args.format, args.normalize or NORMALIZE_CELLS)
+        if args.metrics is not None:
+            METRICS.write(args.metrics)
+            print(f"Wrote metrics to {args.metrics}:")
+            METRICS.print_summary()
+        else:
+            METRICS.write_run("parser")
+    else:
+        run_interactive()
 
-    
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+import json
+import struct
+import zlib
+from datetime import date
+from typing import NamedTuple
+from constants import *
+from utils import *
+from exposure import *
+from aggregate import *
+import numpy as np
+
+# Colors of the heatmap (RGBA) from no exposures to the most exposures, interpolated in between
+HEATMAP_COLORS = [(0, 0, 0, 0), (128, 0, 0, 160), (255, 64, 0, 210), (255, 200, 0, 240), (255, 255, 255, 255)]
+
+class HeatmapGrid(NamedTuple):
+    """Lat/lon grid the exposures are binned onto. Row 0 is the southern edge and column 0 the western edge"""
+    min_lat: float
+    min_lon: float
+    cell_size: float  # size of a cell in degrees
+    rows: int
+    cols: int
+
+    @property
+    def bbox(self):
+        """(min_lon, min_lat, max_lon, max_lat) of the grid"""
+        return (self.min_lon, self.min_lat, self.min_lon + self.cols*self.cell_size,
+                self.min_lat + self.rows*self.cell_size)
+
+class Heatmap(NamedTuple):
+    """Exposure counts of every grid cell for every frame (see rasterize)"""
+    frames: np.ndarray  # (frames x rows x cols) float32
+    labels: list        # label of every frame (ie: "2022-01-31" or "2022-W05")
+    grid: HeatmapGrid
+    period: str         # "day" or "week"
+    sigma: float        # gaussian blur applied to the frames (in cells)
+    exposures: int      # number of exposures binned onto the grid
+
+def get_grid(lats, lons, cell_size=HEATMAP_CELL_SIZE, bbox=None, padding=HEATMAP_PADDING):
+    """Return a grid covering bbox, or the given points plus padding cells on every side
+
+    Args:
+        lats (np.ndarray): point lats (nan are ignored)
+        lons (np.ndarray): point lons (nan are ignored)
+        cell_size (float, optional): cell size in degrees. Defaults to HEATMAP_CELL_SIZE.
+        bbox (tuple, optional): (min_lon, min_lat, max_lon, max_lat) to cover. Defaults to the points.
+        padding (int, optional): cells added around the points. Defaults to HEATMAP_PADDING.
+    """
+    if bbox is None:
+        known = ~(np.isnan(lats) | np.isnan(lons))
+        if not np.any(known):
+            raise ValueError("No building has a location to fit the heatmap grid to")
+        margin = padding*cell_size
+        bbox = (lons[known].min() - margin, lats[known].min() - margin,
+                lons[known].max() + margin, lats[known].max() + margin)
+
+    min_lon, min_lat, max_lon, max_lat = (float(b) for b in bbox)
+    rows = max(1, int(np.ceil((max_lat - min_lat)/cell_size)))
+    cols = max(1, int(np.ceil((max_lon - min_lon)/cell_size)))
+    return HeatmapGrid(min_lat, min_lon, cell_size, rows, cols)
+
+def get_building_locations(building_labels, building_map):
+    """Return the lat and lon arrays of every building code of a building vocabulary (nan if the building is
+    unknown or has no location)
+
+    Args:
+        building_labels (list): building code of every vocabulary code (ie: ExposureColumns.labels["building"])
+        building_map (BuildingMap): building code map with lat and lon columns
+    """
+    lat_i = building_map.header.index("lat")
+    lon_i = building_map.header.index("lon")
+    lats = np.full(len(building_labels), np.nan)
+    lons = np.full(len(building_labels), np.nan)
+    for code, label in enumerate(building_labels):
+        fields = building_map.buildings.get(label)
+        if fields is None or fields[lat_i].lower() == "null" or fields[lon_i].lower() == "null":
+            continue
+        lats[code] = float(fields[lat_i])
+        lons[code] = float(fields[lon_i])
+    return lats, lons
+
+def get_frames(date_labels, period=HEATMAP_PERIOD):
+    """Return the frame of every snapshot date. Frames cover every day (or week) from the first date to the last
+    one, so days without snapshots are empty frames instead of being skipped.
+
+    Args:
+        date_labels (list): snapshot date (YYYY-MM-DD) of every vocabulary code (ie: ExposureColumns.labels["date"])
+        period (str, optional): "day" or "week". Defaults to HEATMAP_PERIOD.
+
+    Returns:
+        tuple: (frame of every date code (-1 for null dates) as an np.ndarray, list of frame labels)
+    """
+    if period not in HEATMAP_PERIODS:
+        raise ValueError(f"Unknown heatmap period \"{period}\" (expected one of {', '.join(HEATMAP_PERIODS)})")
+
+    ordinals = []
+    for label in date_labels:
+        try:
+            day = datetime.strptime(label, "%Y-%m-%d").date()
+        except ValueError:
+            ordinals.append(None)
+            continue
+        # Weeks start on monday
+        ordinals.append(day.toordinal() - (day.weekday() if period == "week" else 0))
+
+    known = [o for o in ordinals if o is not None]
+    if len(known) == 0:
+        return np.full(len(date_labels), -1, dtype=np.int64), []
+
+    step = 7 if period == "week" else 1
+    first = min(known)
+    frame_codes = np.array([-1 if o is None else (o - first)//step for o in ordinals], dtype=np.int64)
+    labels = []
+    for frame in range((max(known) - first)//step + 1):
+        day = date.fromordinal(first + frame*step)
+        if period == "week":
+            year, week, _ = day.isocalendar()
+            labels.append(f"{year}-W{week:02d}")
+        else:
+            labels.append(day.isoformat())
+    return frame_codes, labels
+
+def get_gaussian_kernel(sigma):
+    """Return a normalized 1d gaussian kernel (radius of 3 sigma)"""
+    radius = max(1, int(np.ceil(3*sigma)))
+    x = np.arange(-radius, radius + 1, dtype=np.float64)
+    kernel = np.exp(-0.5*(x/sigma)**2)
+    return (kernel/kernel.sum()).astype(np.float32)
+
+def blur(frames, sigma=HEATMAP_SIGMA):
+    """Return the frames convolved with a gaussian kernel. The kernel is separable, so the whole stack is blurred
+    with one shifted sum per kernel tap along each axis instead of a loop per frame or cell.
+
+    Args:
+        frames (np.ndarray): (frames x rows x cols) stack
+        sigma (float, optional): standard deviation in cells. Defaults to HEATMAP_SIGMA.
+    """
+    if sigma <= 0:
+        return frames
+    kernel = get_gaussian_kernel(sigma)
+    radius = len(kernel)//2
+    for axis in (1, 2):
+        pad = [(0, 0)]*frames.ndim
+        pad[axis] = (radius, radius)
+        padded = np.pad(frames, pad)
+        output = np.zeros_like(frames)
+        size = frames.shape[axis]
+        for tap, weight in enumerate(kernel):
+            output += weight*np.take(padded, np.arange(tap, tap + size), axis=axis)
+        frames = output
+    return frames
+
+def rasterize(columns, building_map, grid=None, period=HEATMAP_PERIOD, sigma=HEATMAP_SIGMA,
+              cell_size=HEATMAP_CELL_SIZE):
+    """Bin the exposures onto a lat/lon grid, one frame per day or week. Exposures are first counted per building
+    and snapshot date, so the histogram only has one (weighted) point per building and date.
+
+    Args:
+        columns (ExposureColumns): exposures (see read_exposure_columns or read_history_columns)
+        building_map (BuildingMap): building code map with the lat and lon of every building
+        grid (HeatmapGrid, optional): grid to bin onto. Defaults to a grid fit to the buildings with a location.
+        period (str, optional): "day" or "week". Defaults to HEATMAP_PERIOD.
+        sigma (float, optional): gaussian blur in cells, 0 for none. Defaults to HEATMAP_SIGMA.
+        cell_size (float, optional): cell size in degrees when fitting the grid. Defaults to HEATMAP_CELL_SIZE.
+
+    Returns:
+        [Heatmap]: the frames
+    """
+    building_lats, building_lons = get_building_locations(columns.labels["building"], building_map)
+    if grid is None:
+        grid = get_grid(building_lats, building_lons, cell_size)
+    frame_codes, labels = get_frames(columns.labels["date"], period)
+
+    table = aggregate(columns, ("building", "date"))
+    buildings, dates = table.codes[:, 0], table.codes[:, 1]
+    frames = frame_codes[dates]
+    lats, lons = building_lats[buildings], building_lons[buildings]
+    known = (frames >= 0) & ~np.isnan(lats)
+
+    if len(labels) == 0:
+        return Heatmap(np.zeros((0, grid.rows, grid.cols), np.float32), labels, grid, period, sigma, 0)
+    min_lon, min_lat, max_lon, max_lat = grid.bbox
+    counts, _ = np.histogramdd((frames[known], lats[known], lons[known]), bins=(len(labels), grid.rows, grid.cols),
+                               range=((-0.5, len(labels) - 0.5), (min_lat, max_lat), (min_lon, max_lon)),
+                               weights=table.counts[known])
+    return Heatmap(blur(counts.astype(np.float32), sigma), labels, grid, period, sigma, int(counts.sum()))
+
+def get_colormap(colors=HEATMAP_COLORS):
+    """Return a (256 x 4) uint8 lookup table interpolating the given RGBA colors"""
+    colors = np.array(colors, dtype=np.float64)
+    stops = np.linspace(0, 255, len(colors))
+    levels = np.arange(256)
+    return np.stack([np.interp(levels, stops, colors[:, c]) for c in range(4)], axis=1).round().astype(np.uint8)
+
+def colorize(frame, vmax, colormap=None):
+    """Return the RGBA image (rows x cols x 4 uint8, north up) of a frame
+
+    Args:
+        frame (np.ndarray): (rows x cols) counts
+        vmax (float): count shown with the last color (larger counts are clipped)
+        colormap (np.ndarray, optional): (256 x 4) lookup table. Defaults to get_colormap().
+    """
+    colormap = get_colormap() if colormap is None else colormap
+    levels = np.clip(frame/max(vmax, 1e-12), 0, 1)*255
+    # Grid rows go south to north, image rows north to south
+    return colormap[levels.round().astype(np.uint8)[::-1]]
+
+def write_png(path, image):
+    """Write an RGBA image (rows x cols x 4 uint8) as a png file
+
+    Args:
+        path (str): png file to create
+        image (np.ndarray): image to write
+    """
+    rows, cols, _ = image.shape
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    # Every scanline starts with its filter type (0: none)
+    scanlines = np.zeros((rows, 1 + 4*cols), dtype=np.uint8)
+    scanlines[:, 1:] = image.reshape(rows, 4*cols)
+    with open(path, "wb") as png_writer:
+        png_writer.write(b"\x89PNG\r\n\x1a\n")
+        png_writer.write(chunk(b"IHDR", struct.pack(">IIBBBBB", cols, rows, 8, 6, 0, 0, 0)))
+        png_writer.write(chunk(b"IDAT", zlib.compress(scanlines.tobytes(), 6)))
+        png_writer.write(chunk(b"IEND", b""))
+
+def write_heatmap(heatmap, folder=HEATMAP_FOLDER_PATH, png=True):
+    """Write the frames of a heatmap to folder: heatmap.npy (the frames x rows x cols stack), heatmap.json (frame
+    labels and grid) and one png per frame. Every png uses the same scale so frames can be compared.
+
+    Args:
+        heatmap (Heatmap): frames to write
+        folder (str, optional): folder to write to. Defaults to HEATMAP_FOLDER_PATH.
+        png (bool, optional): also write the png frames. Defaults to True.
+
+    Returns:
+        list: paths written
+    """
+    folder = Path(folder)
+    os.makedirs(folder, exist_ok=True)
+    paths = [folder / "heatmap.npy", folder / "heatmap.json"]
+    np.save(paths[0], heatmap.frames)
+    with open(paths[1], "w") as json_writer:
+        json.dump({"labels": heatmap.labels, "grid": heatmap.grid._asdict(), "bbox": heatmap.grid.bbox,
+                   "period": heatmap.period, "sigma": heatmap.sigma, "exposures": heatmap.exposures}, json_writer,
+                  indent=2)
+
+    if png:
+        colormap = get_colormap()
+        vmax = float(heatmap.frames.max(initial=0))
+        for label, frame in zip(heatmap.labels, heatmap.frames):
+            path = folder / f"heatmap-{label}.png"
+            write_png(path, colorize(frame, vmax, colormap))
+            paths.append(path)
+    return paths
@@ -0,0 +1,269 @@
+import csv
+import gzip
+import json
+from abc import ABC, abstractmethod
+from constants import *
+from utils import *
+
+# File extension of every record format
+RECORD_FORMATS = {
+    "csv": ".csv",
+    "csv.gz": ".csv.gz",
+    "ndjson": ".ndjson",
+    "ndjson.gz": ".ndjson.gz",
+    "parquet": ".parquet",
+    "arrow": ".arrow",
+}
+
+def get_record_format(path):
+    """Return the record format of a file from its extension (ie: "page.csv.gz" -> "csv.gz"). None if unknown"""
+    name = Path(path).name.lower()
+    # Longest extension first so ".csv.gz" is not taken for ".gz"
+    for record_format, extension in sorted(RECORD_FORMATS.items(), key=lambda f: -len(f[1])):
+        if name.endswith(extension):
+            return record_format
+    return None
+
+def get_record_path(folder, stem, record_format=RECORD_FORMAT):
+    """Return the path of a record file named stem in folder (ie: ("output", "page", "csv.gz") ->
+    output/page.csv.gz)"""
+    return Path(folder) / (stem + RECORD_FORMATS[record_format])
+
+def import_pyarrow():
+    """Import pyarrow, which is only needed for the parquet and arrow formats"""
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError("the parquet and arrow formats need pyarrow (pip install pyarrow)") from e
+    return pyarrow
+
+def open_text(path, mode, compress=False):
+    """Open a text file for csv/ndjson records, gzip compressed if compress is set"""
+    if compress:
+        return gzip.open(path, mode + "t", encoding="utf8", newline="", compresslevel=RECORD_GZIP_LEVEL)
+    return open(path, mode, encoding="utf8", newline="")
+
+class RecordWriter(ABC):
+    """Base of the streaming record writers. Rows are buffered and handed to the file chunk_rows at a time, so
+    memory stays flat no matter how many rows are written. Subclasses implement _write_chunk and _close. Writers 
+    are context managers:
+
+        with open_record_writer("page.parquet", header) as writer:
+            writer.write_rows(rows)
+    """
+
+    def __init__(self, path, header, chunk_rows=RECORD_CHUNK_ROWS):
+        """
+        Args:
+            path (str): file to create
+            header (tuple): name of every column
+            chunk_rows (int, optional): rows written at once. Defaults to RECORD_CHUNK_ROWS.
+        """
+        self.path = path
+        self.header = tuple(header)
+        self.chunk_rows = chunk_rows
+        self.rows = 0
+        self._chunk = []
+
+    def write_row(self, row):
+        """Add a row (one str cell per column)"""
+        self._chunk.append(row)
+        if len(self._chunk) >= self.chunk_rows:
+            self.flush()
+
+    def write_rows(self, rows):
+        """Add every row of an iterable"""
+        for row in rows:
+            self.write_row(row)
+
+    def flush(self):
+        """Write the buffered rows"""
+        if len(self._chunk) > 0:
+            self._write_chunk(self._chunk)
+            self.rows += len(self._chunk)
+            self._chunk = []
+
+    def close(self):
+        """Write the buffered rows and close the file"""
+        self.flush()
+        self._close()
+
+    @abstractmethod
+    def _write_chunk(self, chunk):
+        """Write a list of rows to the file"""
+
+    @abstractmethod
+    def _close(self):
+        """Close the file"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class CSVWriter(RecordWriter):
+    """RFC 4180 csv (cells with delimiters, quotes or newlines are quoted), optionally gzip compressed"""
+
+    def __init__(self, path, header, chunk_rows=RECORD_CHUNK_ROWS, delim=",", newline="\n", compress=None):
+        """
+        Args:
+            delim (str, optional): Delimiter for csv. Defaults to ",".
+            newline (str, optional): Newline for csv. Defaults to "\\n".
+            compress (bool, optional): gzip the file. Defaults to whether path ends in ".gz".
+        """
+        super().__init__(path, header, chunk_rows)
+        compress = str(path).lower().endswith(".gz") if compress is None else compress
+        self._file = open_text(path, "w", compress)
+        self._writer = csv.writer(self._file, delimiter=delim, lineterminator=newline)
+        self._writer.writerow(self.header)
+
+    def _write_chunk(self, chunk):
+        self._writer.writerows(chunk)
+
+    def _close(self):
+        self._file.close()
+
+class NDJSONWriter(RecordWriter):
+    """One json object per line mapping every column name to its cell, optionally gzip compressed"""
+
+    def __init__(self, path, header, chunk_rows=RECORD_CHUNK_ROWS, compress=None):
+        """
+        Args:
+            compress (bool, optional): gzip the file. Defaults to whether path ends in ".gz".
+        """
+        super().__init__(path, header, chunk_rows)
+        compress = str(path).lower().endswith(".gz") if compress is None else compress
+        self._file = open_text(path, "w", compress)
+
+    def _write_chunk(self, chunk):
+        self._file.write("".join(json.dumps(dict(zip(self.header, row))) + "\n" for row in chunk))
+
+    def _close(self):
+        self._file.close()
+
+class ParquetWriter(RecordWriter):
+    """Parquet file with one string column per header column. Every chunk is a row group, and columns are stored
+    apart so readers only decode the columns they ask for. Needs pyarrow."""
+
+    def __init__(self, path, header, chunk_rows=RECORD_CHUNK_ROWS, compression=PARQUET_COMPRESSION):
+        """
+        Args:
+            compression (str, optional): parquet compression codec. Defaults to PARQUET_COMPRESSION.
+        """
+        super().__init__(path, header, chunk_rows)
+        self._pa = import_pyarrow()
+        import pyarrow.parquet
+        self._schema = self._pa.schema([(name, self._pa.string()) for name in self.header])
+        self._writer = pyarrow.parquet.ParquetWriter(str(path), self._schema, compression=compression)
+
+    def _write_chunk(self, chunk):
+        columns = [self._pa.array(column, self._pa.string()) for column in zip(*chunk)]
+        self._writer.write_table(self._pa.Table.from_arrays(columns, schema=self._schema))
+
+    def _close(self):
+        self._writer.close()
+
+class ArrowWriter(RecordWriter):
+    """Arrow IPC file with one string column per header column and one record batch per chunk. The file can be
+    memory mapped and its columns read without copying. Needs pyarrow."""
+
+    def __init__(self, path, header, chunk_rows=RECORD_CHUNK_ROWS):
+        super().__init__(path, header, chunk_rows)
+        self._pa = import_pyarrow()
+        self._schema = self._pa.schema([(name, self._pa.string()) for name in self.header])
+        self._sink = self._pa.OSFile(str(path), "wb")
+        self._writer = self._pa.ipc.new_file(self._sink, self._schema)
+
+    def _write_chunk(self, chunk):
+        columns = [self._pa.array(column, self._pa.string()) for column in zip(*chunk)]
+        self._writer.write_batch(self._pa.RecordBatch.from_arrays(columns, schema=self._schema))
+
+    def _close(self):
+        self._writer.close()
+        self._sink.close()
+
+def open_record_writer(path, header, record_format=None, chunk_rows=RECORD_CHUNK_ROWS, delim=","):
+    """Return the writer for a record file
+
+    Args:
+        path (str): file to create
+        header (tuple): name of every column
+        record_format (str, optional): one of RECORD_FORMATS. Defaults to the format of the path's extension
+        (csv if it has none of them).
+        chunk_rows (int, optional): rows written at once. Defaults to RECORD_CHUNK_ROWS.
+        delim (str, optional): Delimiter for csv. Defaults to ",".
+
+    Returns:
+        RecordWriter: writer to write the rows with and close
+    """
+    record_format = record_format or get_record_format(path) or "csv"
+    if record_format in ("csv", "csv.gz"):
+        return CSVWriter(path, header, chunk_rows, delim, compress=record_format == "csv.gz")
+    if record_format in ("ndjson", "ndjson.gz"):
+        return NDJSONWriter(path, header, chunk_rows, compress=record_format == "ndjson.gz")
+    if record_format == "parquet":
+        return ParquetWriter(path, header, chunk_rows)
+    if record_format == "arrow":
+        return ArrowWriter(path, header, chunk_rows)
+    raise ValueError(f"Unknown record format \"{record_format}\" (expected one of {', '.join(RECORD_FORMATS)})")
+
+def iter_records(path, columns=None, delim=",", chunk_rows=RECORD_CHUNK_ROWS):
+    """Read a record file one row at a time. The first row yielded is the header, then every row as a list of
+    cells. Csv files are yielded as is, so a csv file without a header starts with its first row.
+
+    Args:
+        path (str): file written by a RecordWriter (or any csv file)
+        columns (iterable, optional): only return these columns, in the order of the file. Columnar formats
+        (parquet, arrow) never decode the others. Ndjson files return every one of them in the given order, None
+        for the records that do not have it. Csv files ignore it since they may not have a header. Defaults to
+        every column (for ndjson files, every key of any record, which reads the file twice).
+        delim (str, optional): Delimiter for csv. Defaults to ",".
+        chunk_rows (int, optional): rows decoded at once from columnar formats. Defaults to RECORD_CHUNK_ROWS.
+
+    Yields:
+        list: header and then every row
+    """
+    record_format = get_record_format(path) or "csv"
+    if record_format in ("csv", "csv.gz"):
+        with open_text(path, "r", record_format == "csv.gz") as csv_reader:
+            yield from csv.reader(csv_reader, delimiter=delim)
+
+    elif record_format in ("ndjson", "ndjson.gz"):
+        compress = record_format == "ndjson.gz"
+        if columns is not None:
+            header = list(columns)
+        else:
+            # Records may not all have the same keys, the header is every key in the order it is first seen
+            header = {}
+            with open_text(path, "r", compress) as json_reader:
+                for line in json_reader:
+                    if not line.isspace():
+                        header.update(dict.fromkeys(json.loads(line)))
+            header = list(header)
+        yield header
+        with open_text(path, "r", compress) as json_reader:
+            for line in json_reader:
+                if line.isspace():
+                    continue
+                record = json.loads(line)
+                yield [record.get(k) for k in header]
+
+    elif record_format == "parquet":
+        import_pyarrow()
+        import pyarrow.parquet
+        parquet_file = pyarrow.parquet.ParquetFile(str(path))
+        header = [n for n in parquet_file.schema_arrow.names if columns is None or n in columns]
+        yield header
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=header):
+            yield from (list(row) for row in zip(*(c.to_pylist() for c in batch.columns)))
+
+    elif record_format == "arrow":
+        pa = import_pyarrow()
+        with pa.memory_map(str(path), "r") as source:
+            arrow_reader = pa.ipc.open_file(source)
+            header = [n for n in arrow_reader.schema.names if columns is None or n in columns]
+            yield header
+            for i in range(arrow_reader.num_record_batches):
+                batch = arrow_reader.get_batch(i).select(header)
+                yield from (list(row) for row in zip(*(c.to_pylist() for c in batch.columns)))
@@ -0,0 +1,137 @@
+import argparse
+from utils import *
+from constants import *
+from geojson_stream import *
+# similarity.py (numpy) and exposure.py are imported by the functions that need them, so --help starts fast
+
+def get_csv_building_names(input, newline="\n", delim=","):
+    """Given an input building_code_map csv file return a list of every building name in that list
+
+    Args:
+        input (str): input csv
+        newline (str, optional): csv file newline character. Defaults to "\n".
+        delim (str, optional): csv file delimiter. Defaults to ",".
+
+    Returns:
+        list: list of every building name
+    """
+    from exposure import read_csv_rows
+    rows = read_csv_rows(input, delim, newline)[1:]
+    names = []
+    for cols in rows:
+        if len(cols) > 1:
+            names.append(cols[1])
+    
+    return names
+
+def get_geojson_building_names(input):
+    """Take in a geojson object and return a list of each building name found within the geojson
+
+    Args:
+        input (geojson,json,dict): input geojson file, or any iterable of its features (ie: iter_geojson_features)
+
+    Returns:
+        list: list of each building name
+    """
+    features = input["features"] if isinstance(input, dict) else input
+    names = []
+    for ele in features:
+        try:
+            properties = ele["properties"]
+            if properties["building"] is not None and properties["building"].lower() == "university":
+                n = properties["name"]
+                if n is not None and n.lower() != "none":
+                    # Remove commas 
+                    n = n.split(",")
+                    n = "".join(n)
+                    
+                    # add building name to array
+                    names.append(n)
+        except Exception as e:
+            print(f"Error (ignoring): {e}")
+    names.sort()
+    return names
+
+def create_similarity_csv(geojson_names, csv_names, output_path=SIMILARITY_CSV_PATH, jobs=None, npy_path=None, 
+                          top_k=None, threshold=None):
+    """Write how similar every building code map name is to every geojson name. The matrix is computed in blocks 
+    across a pool of worker processes and streamed to disk as the blocks finish.
+
+    Args:
+        geojson_names (list): building names from the outlines geojson (columns)
+        csv_names (list): building names from the building code map (rows)
+        output_path (str, optional): csv file to create. Defaults to SIMILARITY_CSV_PATH.
+        jobs (int, optional): number of worker processes. Defaults to the number of cpu cores.
+        npy_path (str, optional): also write the matrix to this binary .npy file. Defaults to None.
+        top_k (int, optional): only write the top_k most similar geojson names of each csv name (one 
+        `name,match,similarity` line per pair) instead of the whole matrix. Defaults to None.
+        threshold (float, optional): only compare names sharing at least this trigram similarity, the other pairs 
+        are written as 0. None compares every pair. Defaults to None.
+    """
+    from similarity import write_similarity_csv, write_similarity_npy, write_top_k_csv
+    if top_k is not None:
+        write_top_k_csv(csv_names, geojson_names, top_k, output_path, jobs, threshold=threshold)
+    else:
+        write_similarity_csv(csv_names, geojson_names, output_path, jobs, threshold=threshold)
+
+    if npy_path is not None:
+        write_similarity_npy(csv_names, geojson_names, npy_path, jobs, threshold=threshold)
+
+def main(argv=None, prog=None):
+    """Command line entry point of similar_tester.py (also run by `cli.py similarity`)
+
+    Args:
+        argv (list, optional): command line arguments. Defaults to sys.argv[1:].
+        prog (str, optional): program name shown in the help. Defaults to the script name.
+    """
+    arg_parser = argparse.ArgumentParser(prog=prog, description="Compare building code map names against geojson names")
+    arg_parser.add_argument("--output", default=SIMILARITY_CSV_PATH, help="csv file to create")
+    arg_parser.add_argument("--jobs", type=int, default=None, help="number of worker processes (default: cpu count)")
+    arg_parser.add_argument("--npy", default=None, help="also write the matrix to this .npy file")
+    arg_parser.add_argument("--top-k", type=int, default=None, help="only keep the k most similar names per row")
+    arg_parser.add_argument("--index-threshold", type=float, default=None, 
+                            help=f"only compare names with at least this trigram similarity (ie: {NAME_INDEX_THRESHOLD})")
+    arg_parser.add_argument("--bbox", type=float, nargs=4, default=None, 
+                            metavar=("MIN_LON", "MIN_LAT", "MAX_LON", "MAX_LAT"),
+                            help="only read the names of the outlines with a vertex inside this box")
+    args = arg_parser.parse_args(argv)
+
+    # Ask user which file they want to open
+    data_pages = [f for f in listdir(DATA_FOLDER_PATH) if isfile(pjoin(DATA_FOLDER_PATH,f))]
+    data_paths = [pjoin(DATA_FOLDER_PATH,f) for f in listdir(DATA_FOLDER_PATH) if isfile(pjoin(DATA_FOLDER_PATH,f))]
+
+    data_pages = [f"{f} (created: {get_created_string(DATA_FOLDER_PATH,f)})" for f in data_pages ]
+    
+    # choose building outlines geojson
+    choice = simple_menu_print(f"Select a building outlines geojson from the /{DATA_FOLDER_NAME} directory:",data_pages)
+    building_outlines = data_paths[choice-1]
+
+    # chose building map csv
+    choice = simple_menu_print(f"Select a building code map from the /{DATA_FOLDER_NAME} directory:",data_pages)
+    building_code_map = data_paths[choice-1]
+
+    # open the selected files. The names are read while streaming the outlines, the features are not kept
+    try:
+        print("Opening outlines file...")
+        geojson_names = get_geojson_building_names(iter_geojson_features(building_outlines, bbox=args.bbox))
+    except Exception as e:
+        print("Something went wrong opening the builiding code map file:")
+        print(e)
+        print("Quitting")
+        sys.exit()
+
+    try:
+        print("Opening building code map...")
+        with open(building_code_map,"r") as csv_reader:
+            building_map_csv = csv_reader.read()
+    except Exception as e:
+        print("Something went wrong opening the builiding code map file:")
+        print(e)
+        print("Quitting")
+        sys.exit()
+
+    csv_names = get_csv_building_names(building_map_csv)
+    create_similarity_csv(geojson_names, csv_names, args.output, args.jobs, args.npy, args.top_k, args.index_threshold)
+
+if __name__ == "__main__":
+    main()
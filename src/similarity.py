@@ -0,0 +1,307 @@
+import csv
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+from constants import *
+from utils import *
+from name_index import *
+import numpy as np
+
+def compare_strings(first, second):
+    """Compare two strings and return a number between 0 and 1 representing how similar they are.
+    1=perfect match
+    0=no match
+
+    Args:
+        first (str): first string
+        second (str): second string
+
+    Returns:
+        float: float representing how similar the two strings are
+    """
+
+    return SequenceMatcher(None, first, second).ratio()
+
+def compute_similarity_matrix(row_names, col_names, threshold=None, name_index=None, min_similarity=None):
+    """Return the compare_strings ratio of every row name against every column name
+
+    Args:
+        row_names (list): names for each row (first argument of compare_strings)
+        col_names (list): names for each column (second argument of compare_strings)
+        threshold (float, optional): only compare the pairs of names whose trigram similarity is at least 
+        threshold (see NameIndex). The other pairs are left at 0. None compares every pair. Defaults to None.
+        name_index (NameIndex, optional): index over col_names if one was already built. Defaults to None.
+        min_similarity (float, optional): pairs whose ratio is below min_similarity may be left at 0. Their
+        ratio is only bounded (see SequenceMatcher.quick_ratio) instead of computed. Defaults to None.
+
+    Returns:
+        np.ndarray: (rows x columns) float64 matrix
+    """
+    matrix = np.zeros((len(row_names), len(col_names)), dtype=np.float64)
+    if threshold is not None:
+        name_index = name_index or NameIndex(col_names)
+        # Group the shortlisted pairs by column so each column name is only analysed once (see below)
+        col_rows = [[] for _ in col_names]
+        for i, row_name in enumerate(row_names):
+            for j in name_index.get_candidates(row_name, threshold).tolist():
+                col_rows[j].append(i)
+    else:
+        col_rows = [range(len(row_names))]*len(col_names)
+
+    matcher = SequenceMatcher(None)
+    for j, rows in enumerate(col_rows):
+        if len(rows) == 0:
+            continue
+        # SequenceMatcher caches the analysis of the second sequence, so it is only done once per column
+        matcher.set_seq2(col_names[j])
+        for i in rows:
+            matcher.set_seq1(row_names[i])
+            if min_similarity is not None and (matcher.real_quick_ratio() < min_similarity 
+                                               or matcher.quick_ratio() < min_similarity):
+                continue
+            matrix[i, j] = matcher.ratio()
+    return matrix
+
+def get_similarity_cache_path(row_names, col_names, threshold=None, cache_folder=SIMILARITY_CACHE_FOLDER_PATH):
+    """Return the cache file of the similarity matrix of the given names"""
+    key = json.dumps([list(row_names), list(col_names), threshold]).encode("utf8")
+    return Path(cache_folder) / f"similarity-{hashlib.sha256(key).hexdigest()}.npy"
+
+def get_similarity_matrix(row_names, col_names, threshold=None, cache_folder=SIMILARITY_CACHE_FOLDER_PATH):
+    """Return the similarity matrix of the given names (see compute_similarity_matrix). The matrix is stored in
+    cache_folder so it is only ever computed once for the same names.
+
+    Args:
+        row_names (list): names for each row
+        col_names (list): names for each column
+        threshold (float, optional): trigram shortlist threshold (see compute_similarity_matrix). Defaults to None.
+        cache_folder (str, optional): folder to cache the matrix in. None to dissable caching. Defaults to
+        SIMILARITY_CACHE_FOLDER_PATH.
+    """
+    if cache_folder is None:
+        return compute_similarity_matrix(row_names, col_names, threshold)
+
+    path = get_similarity_cache_path(row_names, col_names, threshold, cache_folder)
+    try:
+        matrix = np.load(path)
+        if matrix.shape == (len(row_names), len(col_names)):
+            return matrix
+    except (FileNotFoundError, ValueError, OSError):
+        pass
+
+    matrix = compute_similarity_matrix(row_names, col_names, threshold)
+    os.makedirs(cache_folder, exist_ok=True)
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp.npy")
+    np.save(tmp_path, matrix)
+    os.replace(tmp_path, path)
+    return matrix
+
+class NameSimilarity:
+    """Similarity of every csv building name against every feature name. Each unique pair of names is only
+    compared once, no matter how many features share a name or how many times a building is checked.
+    """
+
+    def __init__(self, csv_names, feature_names, threshold=NAME_INDEX_THRESHOLD, 
+                 cache_folder=SIMILARITY_CACHE_FOLDER_PATH):
+        """
+        Args:
+            csv_names (list): building names from the building code map
+            feature_names (list): name of each feature (in feature order). None for features without a name.
+            threshold (float, optional): only compare names whose trigram similarity is at least threshold, the 
+            others count as completely different names. None compares every pair. Defaults to 
+            NAME_INDEX_THRESHOLD.
+            cache_folder (str, optional): folder to cache the matrix in. None to dissable caching. Defaults to
+            SIMILARITY_CACHE_FOLDER_PATH.
+        """
+        unique_csv_names = sorted({n for n in csv_names if n is not None})
+        unique_feature_names = sorted({n for n in feature_names if n is not None})
+        self.csv_index = {n: i for i, n in enumerate(unique_csv_names)}
+        self.feature_names = unique_feature_names + [None]
+        feature_index = {n: i for i, n in enumerate(unique_feature_names)}
+
+        # Extra column of zeros for features without a name
+        matrix = get_similarity_matrix(unique_csv_names, unique_feature_names, threshold, cache_folder)
+        self.matrix = np.hstack([matrix, np.zeros((len(unique_csv_names), 1))])
+        self.feature_cols = np.array([feature_index.get(n, len(unique_feature_names)) for n in feature_names],
+                                     dtype=np.int64)
+        self.threshold = threshold
+        self.name_index = NameIndex(self.feature_names) if threshold is not None else None
+
+    @classmethod
+    def from_arrays(cls, csv_names, feature_names, matrix, feature_cols, threshold=NAME_INDEX_THRESHOLD):
+        """Return a NameSimilarity over an already computed matrix (ie: memory mapped by a worker process)
+
+        Args:
+            csv_names (list): unique csv names of the matrix rows, in row order
+            feature_names (list): unique feature names of the matrix columns, in column order (without the column
+            of features without a name)
+            matrix (np.ndarray): similarity matrix, with the extra column of zeros
+            feature_cols (np.ndarray): matrix column of each feature
+            threshold (float, optional): trigram threshold the matrix was computed with. Defaults to 
+            NAME_INDEX_THRESHOLD.
+        """
+        name_similarity = cls.__new__(cls)
+        name_similarity.csv_index = {n: i for i, n in enumerate(csv_names)}
+        name_similarity.feature_names = list(feature_names) + [None]
+        name_similarity.matrix = matrix
+        name_similarity.feature_cols = feature_cols
+        name_similarity.threshold = threshold
+        name_similarity.name_index = NameIndex(name_similarity.feature_names) if threshold is not None else None
+        return name_similarity
+
+    def get_similarities(self, csv_name, feature_nums=None):
+        """Return the similarity of a csv building name to each feature name
+
+        Args:
+            csv_name (str): building name from the building code map
+            feature_nums (list, optional): features to return. Defaults to every feature.
+
+        Returns:
+            np.ndarray: similarity to each feature (in the order of feature_nums)
+        """
+        cols = self.feature_cols if feature_nums is None else self.feature_cols[np.asarray(feature_nums, np.int64)]
+        row = self.csv_index.get(csv_name)
+        if row is not None:
+            return self.matrix[row, cols]
+
+        # Name was not known up front, compare it directly
+        similarities = np.zeros(len(cols))
+        if csv_name is not None:
+            shortlist = None
+            if self.name_index is not None:
+                shortlist = set(self.name_index.get_candidates(csv_name, self.threshold).tolist())
+            for i, col in enumerate(cols.tolist()):
+                if self.feature_names[col] is not None and (shortlist is None or col in shortlist):
+                    similarities[i] = compare_strings(csv_name, self.feature_names[col])
+        return similarities
+
+# Column names (and trigram index) of the matrix being computed, set once per worker process 
+# (see init_similarity_worker)
+_worker_col_names = None
+_worker_threshold = None
+_worker_name_index = None
+
+def init_similarity_worker(col_names, threshold=None):
+    """Process pool initializer. Stores the column names so they are only sent to each worker once"""
+    global _worker_col_names, _worker_threshold, _worker_name_index
+    _worker_col_names = col_names
+    _worker_threshold = threshold
+    _worker_name_index = NameIndex(col_names) if threshold is not None else None
+
+def compute_similarity_block(row_names):
+    """Compute the rows of the similarity matrix for the given row names against the worker's column names"""
+    return compute_similarity_matrix(row_names, _worker_col_names, _worker_threshold, _worker_name_index)
+
+def iter_similarity_blocks(row_names, col_names, jobs=None, block_rows=SIMILARITY_BLOCK_ROWS, threshold=None):
+    """Compute the similarity matrix in blocks of rows across a pool of worker processes. Blocks are yielded in
+    order as soon as they are done, so the whole matrix never has to be held in memory.
+
+    Args:
+        row_names (list): names for each row
+        col_names (list): names for each column
+        jobs (int, optional): number of worker processes. Defaults to the number of cpu cores.
+        block_rows (int, optional): number of rows per block. Defaults to SIMILARITY_BLOCK_ROWS.
+        threshold (float, optional): trigram shortlist threshold (see compute_similarity_matrix). Defaults to None.
+
+    Yields:
+        tuple: (index of the first row of the block, (block rows x columns) matrix)
+    """
+    jobs = jobs or os.cpu_count() or 1
+    starts = range(0, len(row_names), block_rows)
+    blocks = [row_names[start:start + block_rows] for start in starts]
+
+    if jobs == 1:
+        init_similarity_worker(col_names, threshold)
+        for start, block in zip(starts, blocks):
+            yield start, compute_similarity_block(block)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_similarity_worker, initargs=(col_names, threshold)) as pool:
+        for start, matrix in zip(starts, pool.map(compute_similarity_block, blocks)):
+            yield start, matrix
+
+def write_similarity_csv(row_names, col_names, path, jobs=None, block_rows=SIMILARITY_BLOCK_ROWS, threshold=None):
+    """Write the similarity matrix as csv. The first row is the column names and the first column is the row names
+
+    Args:
+        row_names (list): names for each row
+        col_names (list): names for each column
+        path (str): csv file to create
+        jobs (int, optional): number of worker processes. Defaults to the number of cpu cores.
+        block_rows (int, optional): number of rows computed per block. Defaults to SIMILARITY_BLOCK_ROWS.
+        threshold (float, optional): trigram shortlist threshold (see compute_similarity_matrix). Defaults to None.
+    """
+    with open(path, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file, lineterminator="\n")
+        writer.writerow([""] + list(col_names))
+        for start, matrix in iter_similarity_blocks(row_names, col_names, jobs, block_rows, threshold):
+            for name, row in zip(row_names[start:], matrix.tolist()):
+                writer.writerow([name] + row)
+
+def write_similarity_npy(row_names, col_names, path, jobs=None, block_rows=SIMILARITY_BLOCK_ROWS, threshold=None):
+    """Write the similarity matrix as a binary .npy file. The file is memory mapped and filled one block at a time
+    so matrices larger than memory can be created (and later opened with np.load(path, mmap_mode="r")).
+
+    Args:
+        row_names (list): names for each row
+        col_names (list): names for each column
+        path (str): npy file to create
+        jobs (int, optional): number of worker processes. Defaults to the number of cpu cores.
+        block_rows (int, optional): number of rows computed per block. Defaults to SIMILARITY_BLOCK_ROWS.
+        threshold (float, optional): trigram shortlist threshold (see compute_similarity_matrix). Defaults to None.
+    """
+    output = np.lib.format.open_memmap(path, mode="w+", dtype=np.float64, shape=(len(row_names), len(col_names)))
+    for start, matrix in iter_similarity_blocks(row_names, col_names, jobs, block_rows, threshold):
+        output[start:start + len(matrix)] = matrix
+    output.flush()
+    del output
+
+def get_top_k_similarities(row_names, col_names, k, jobs=None, block_rows=SIMILARITY_BLOCK_ROWS, threshold=None):
+    """Return only the k most similar columns of each row. Memory use is rows x k instead of rows x columns
+
+    Args:
+        row_names (list): names for each row
+        col_names (list): names for each column
+        k (int): number of columns to keep per row
+        jobs (int, optional): number of worker processes. Defaults to the number of cpu cores.
+        block_rows (int, optional): number of rows computed per block. Defaults to SIMILARITY_BLOCK_ROWS.
+        threshold (float, optional): trigram shortlist threshold (see compute_similarity_matrix). Defaults to None.
+
+    Returns:
+        tuple: (rows x k column indices, rows x k similarities) sorted most similar first
+    """
+    k = min(k, len(col_names))
+    top_cols = np.zeros((len(row_names), k), dtype=np.int64)
+    top_scores = np.zeros((len(row_names), k), dtype=np.float64)
+    if k == 0:
+        return top_cols, top_scores
+
+    for start, matrix in iter_similarity_blocks(row_names, col_names, jobs, block_rows, threshold):
+        cols = np.argpartition(-matrix, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(matrix, cols, axis=1)
+        # Sort the k kept columns, most similar first (ties by column order)
+        order = np.lexsort((cols, -scores), axis=1)
+        top_cols[start:start + len(matrix)] = np.take_along_axis(cols, order, axis=1)
+        top_scores[start:start + len(matrix)] = np.take_along_axis(scores, order, axis=1)
+    return top_cols, top_scores
+
+def write_top_k_csv(row_names, col_names, k, path, jobs=None, block_rows=SIMILARITY_BLOCK_ROWS, threshold=None):
+    """Write the k most similar columns of each row as csv with one `row_name,col_name,similarity` line per pair
+
+    Args:
+        row_names (list): names for each row
+        col_names (list): names for each column
+        k (int): number of columns to keep per row
+        path (str): csv file to create
+        jobs (int, optional): number of worker processes. Defaults to the number of cpu cores.
+        block_rows (int, optional): number of rows computed per block. Defaults to SIMILARITY_BLOCK_ROWS.
+        threshold (float, optional): trigram shortlist threshold (see compute_similarity_matrix). Defaults to None.
+    """
+    top_cols, top_scores = get_top_k_similarities(row_names, col_names, k, jobs, block_rows, threshold)
+    with open(path, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file, lineterminator="\n")
+        writer.writerow(["name", "match", "similarity"])
+        for name, cols, scores in zip(row_names, top_cols.tolist(), top_scores.tolist()):
+            for col, score in zip(cols, scores):
+                writer.writerow([name, col_names[col], score])
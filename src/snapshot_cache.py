@@ -0,0 +1,159 @@
+import hashlib
+import json
+import pickle
+from constants import *
+from utils import *
+from instrumentation import *
+
+def file_hash(path, chunk_size=1024*1024):
+    """Return the sha256 hex digest of the contents of the given file. None if the file does not exist
+
+    Args:
+        path (str): path of the file to hash
+        chunk_size (int, optional): Number of bytes read at a time. Defaults to 1MB.
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+class SnapshotCache:
+    """On disk cache of the parsed records of each covid data page. Entries are keyed by the content hash of the
+    html page and PARSER_VERSION, so a page is only parsed again if it (or the parser) changed. Enriched entries
+    (records with building information) also depend on the building code map, they are removed as soon as the
+    cache is opened with a different building code map.
+
+    Entries are evicted least recently used first once the cache grows over max_bytes.
+    """
+
+    META_NAME = "meta.json"
+
+    def __init__(self, folder=SNAPSHOT_CACHE_FOLDER_PATH, max_bytes=SNAPSHOT_CACHE_MAX_BYTES,
+                 building_map_path=BUILDING_CODE_MAP_PATH):
+        """
+        Args:
+            folder (str, optional): cache folder. Defaults to SNAPSHOT_CACHE_FOLDER_PATH.
+            max_bytes (int, optional): size of the cache before entries are evicted. Defaults to
+            SNAPSHOT_CACHE_MAX_BYTES.
+            building_map_path (str, optional): building code map the enriched entries were made with. Defaults to
+            BUILDING_CODE_MAP_PATH.
+        """
+        self.folder = Path(folder)
+        self.max_bytes = max_bytes
+        self.building_map_hash = file_hash(building_map_path) if building_map_path is not None else None
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.folder, exist_ok=True)
+        self._check_building_map()
+
+    def _check_building_map(self):
+        """Remove every enriched entry if the building code map changed since the cache was last opened. A cache
+        opened without a building code map never reads enriched entries, so it leaves them alone."""
+        if self.building_map_hash is None:
+            return
+        meta_path = self.folder / self.META_NAME
+        meta = {}
+        if isfile(meta_path):
+            with open(meta_path, "r") as meta_reader:
+                meta = json.load(meta_reader)
+
+        if meta.get("building_map_hash") != self.building_map_hash:
+            for entry in self._entries():
+                if entry.name.startswith("enriched-"):
+                    entry.unlink(missing_ok=True)
+            meta["building_map_hash"] = self.building_map_hash
+            with open(meta_path, "w") as meta_writer:
+                json.dump(meta, meta_writer)
+
+    def _entries(self):
+        """Return the path of every entry in the cache"""
+        return [p for p in self.folder.glob("*.pickle") if p.is_file()]
+
+    def key(self, html_hash, enriched=False):
+        """Return the entry name for a page with the given content hash
+
+        Args:
+            html_hash (str): content hash of the html page (see file_hash)
+            enriched (bool, optional): entry with building information. Defaults to False.
+        """
+        if enriched:
+            return f"enriched-{PARSER_VERSION}-{html_hash}-{self.building_map_hash}.pickle"
+        return f"validated-{PARSER_VERSION}-{html_hash}.pickle"
+
+    def get(self, html_hash, enriched=False):
+        """Return the cached records for the page with the given content hash. None if it is not cached
+
+        Args:
+            html_hash (str): content hash of the html page (see file_hash)
+            enriched (bool, optional): get the records with building information. Defaults to False.
+        """
+        path = self.folder / self.key(html_hash, enriched)
+        try:
+            with open(path, "rb") as f:
+                records = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            METRICS.count("snapshot_cache_lookups", result="miss")
+            return None
+
+        # Mark the entry as recently used for eviction
+        os.utime(path)
+        self.hits += 1
+        METRICS.count("snapshot_cache_lookups", result="hit")
+        return records
+
+    def put(self, html_hash, records, enriched=False):
+        """Store the records of the page with the given content hash
+
+        Args:
+            html_hash (str): content hash of the html page (see file_hash)
+            records (list): validated Exposure records
+            enriched (bool, optional): records have building information. Defaults to False.
+        """
+        path = self.folder / self.key(html_hash, enriched)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(records, f, protocol=pickle.HIGHEST_PROTOCOL)
+        # Atomic so other processes sharing the cache never read a partial entry
+        os.replace(tmp_path, path)
+
+    def size(self):
+        """Return the total size of the cache in bytes"""
+        return sum(p.stat().st_size for p in self._entries())
+
+    def evict(self):
+        """Remove the least recently used entries until the cache is under max_bytes. Returns the number of
+        entries removed"""
+        entries = []
+        for p in self._entries():
+            stat = p.stat()
+            entries.append((stat.st_mtime, stat.st_size, p))
+        entries.sort()
+
+        total = sum(e[1] for e in entries)
+        removed = 0
+        for _, entry_size, p in entries:
+            if total <= self.max_bytes:
+                break
+            p.unlink(missing_ok=True)
+            total -= entry_size
+            removed += 1
+        return removed
+
+    def clear(self):
+        """Remove every entry"""
+        for p in self._entries():
+            p.unlink(missing_ok=True)
+
+    def stats(self):
+        """Return a dict with the hit/miss counts of this cache object"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits/lookups if lookups > 0 else 0.0,
+        }
@@ -0,0 +1,58 @@
+import argparse
+from constants import *
+
+def main(argv=None, prog=None):
+    """Command line entry point of sum_covid_data.py (also run by `cli.py sum`)
+
+    Args:
+        argv (list, optional): command line arguments. Defaults to sys.argv[1:].
+        prog (str, optional): program name shown in the help. Defaults to the script name.
+    """
+    arg_parser = argparse.ArgumentParser(prog=prog, description="Count the exposures of parser output csv files by "
+                                         "any combination of building, class, weekday, time and date")
+    arg_parser.add_argument("paths", nargs="*", default=[OUTPUT_FILE_PATH], 
+                            help="parser output csv files or folders of them (default: output.csv)")
+    arg_parser.add_argument("--by", default="building", 
+                            help=f"comma separated keys to group by ({', '.join(AGGREGATE_KEYS)}). Default: building")
+    arg_parser.add_argument("--top", type=int, default=None, help="only keep the largest groups")
+    arg_parser.add_argument("--per", default="", help="comma separated keys of --by to take the --top groups within")
+    arg_parser.add_argument("--bucket", type=int, default=AGGREGATE_TIME_BUCKET_MINUTES, 
+                            help="length of the time of day buckets in minutes")
+    arg_parser.add_argument("--keep-null", action="store_true", help="also count exposures with null keys")
+    arg_parser.add_argument("--history", action="store_true", 
+                            help=f"read the exposures from the history store (/{HISTORY_FOLDER_NAME}) instead of csv files")
+    arg_parser.add_argument("--start", default=None, help="first snapshot date to read from the history (YYYY-MM-DD)")
+    arg_parser.add_argument("--end", default=None, help="last snapshot date to read from the history (YYYY-MM-DD)")
+    arg_parser.add_argument("--output", default=SUMMED_DATA_FILE_PATH, help="csv file to create")
+    arg_parser.add_argument("--header", action="store_true", 
+                            help="write the key names as the first line (by default every line is a group and its count)")
+    args = arg_parser.parse_args(argv)
+    if args.bucket <= 0:
+        arg_parser.error(f"--bucket must be a positive number of minutes, not {args.bucket}")
+
+    # numpy is only imported once the arguments are valid so --help starts fast
+    from aggregate import read_exposure_columns, read_history_columns, find_exposure_files, aggregate, top_n, \
+        write_table
+    from history_store import HistoryStore
+
+    by = tuple(k.strip() for k in args.by.split(",") if k.strip())
+    per = tuple(k.strip() for k in args.per.split(",") if k.strip())
+
+    if args.history:
+        store = HistoryStore()
+        sources = store.get_chunks(args.start, args.end)
+        columns = read_history_columns(store, args.start, args.end, bucket_minutes=args.bucket)
+    else:
+        sources = find_exposure_files(args.paths)
+        columns = read_exposure_columns(sources, args.bucket)
+    table = aggregate(columns, by, drop_null=not args.keep_null)
+    if args.top is not None:
+        table = top_n(table, args.top, per)
+
+    with open(args.output, "w", newline="") as writer:
+        write_table(table, writer, header=args.header)
+    print(f"Counted {len(columns.building)} exposures from {len(sources)} snapshots into {len(table.counts)} groups "
+          f"({args.output})")
+
+if __name__ == "__main__":
+    main()
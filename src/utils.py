@@ -1,5 +1,6 @@
 import sys
 import os
+import re
 from datetime import datetime
 from constants import *
 
@@ -65,4 +66,62 @@ def bad_csv_print(list_split, error_message, line_number=None):
     if line_number is not None:
         print(f"Bad element on line {line_number}: {list_split}. ({error_message}). Removing from csv.")
     else:
-        print(f"Bad line in csv: {list_split}. ({error_message}). Removing from csv.")
\ No newline at end of file
+        print(f"Bad line in csv: {list_split}. ({error_message}). Removing from csv.")
+
+def str_contains_only_day_of_week_characters(input_string):
+    """Check if the string given contains only characters used in the day of week section (ie: "MWF")
+
+    Args:
+        input_string (str): String from cell expecting days of week location
+
+    Returns:
+        [bool]: True if only contains days of week chars. False otherwise
+    """
+    days_of_week_chars = ["m","t","w","h","f","s"]
+    for c in input_string:
+        if c.lower() not in days_of_week_chars:
+            return False
+            
+    return True
+
+def str_is_acceptable_time(input_string):
+    """Check if the given string is parsable as a time (format = numbers : numbers)
+
+    Args:
+        input_string ([type]): True if parsable as time false otherwise
+    """
+    split = input_string.split(":")
+    if len(split) != 2:
+        return False
+    
+    if split[0].isnumeric() and split[1].isnumeric():
+        return True
+    
+    return False
+
+def str_is_acceptable_characters(input_string):
+    """Check if the stirng contains only valid askii characters (between 32 and 126)
+
+    Args:
+        input_string (str): input string to check 
+
+    Returns:
+        boolean: True if valid. False if invalid.
+    """
+    for c in input_string:
+        o = ord(c)
+        if o < 32 or o > 126:
+            return False
+    return True
+
+def get_snapshot_date(path):
+    """Return the date (YYYY-MM-DD) of the covid data snapshot a file was made from. Taken from the file name
+    (ie: "page-2022-01-31.csv") when it has one, otherwise from when the file was last modified.
+
+    Args:
+        path (str): covid data html page or parser output csv
+    """
+    match = re.search(r"(\d{4})[-_](\d{2})[-_](\d{2})", Path(path).name)
+    if match is not None:
+        return "-".join(match.groups())
+    return datetime.utcfromtimestamp(os.stat(path).st_mtime).strftime("%Y-%m-%d")
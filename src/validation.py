@@ -0,0 +1,162 @@
+import re
+from operator import itemgetter
+from typing import NamedTuple
+from constants import *
+from utils import *
+
+class ValidationError(ValueError):
+    """Raised when input cannot be validated at all (as opposed to single invalid rows, which are rejected)"""
+
+class InvalidHeaderError(ValidationError):
+    """Raised when the header of a csv does not match the expected columns"""
+
+    def __init__(self, given, expected):
+        self.given = tuple(given)
+        self.expected = tuple(expected)
+        super().__init__(f"first line of csv must be a valid header (given: {','.join(self.given)}, "
+                         f"expected: {','.join(self.expected)})")
+
+class ColumnRule(NamedTuple):
+    """Declarative check of a single column. A cell is valid if the whole cell matches pattern"""
+    column: str               # name of the column
+    error: str                # reason given for rejected rows
+    pattern: str              # regular expression the whole cell has to match
+    allow_null: bool = False  # "null" (any case) is also valid
+    flags: int = 0            # re flags of pattern
+
+# Reason given for rows that do not have one cell per column
+INVALID_LENGTH_ERROR = "invalid length"
+
+class ValidationReport:
+    """Number of rows rejected by each rule, with the first few rejected rows of each rule as samples"""
+
+    def __init__(self, errors=(), sample_size=VALIDATION_SAMPLE_SIZE):
+        """
+        Args:
+            errors (tuple, optional): reasons rows can be rejected for, in the order they are checked. Defaults
+            to ().
+            sample_size (int, optional): number of rejected rows kept per rule. Defaults to VALIDATION_SAMPLE_SIZE.
+        """
+        self.sample_size = sample_size
+        self.total = 0
+        self.rejected = {error: 0 for error in errors}
+        self.samples = {error: [] for error in errors}
+
+    @property
+    def valid(self):
+        return self.total - sum(self.rejected.values())
+
+    def reject(self, error, line_number, row):
+        """Count a rejected row"""
+        self.rejected[error] = self.rejected.get(error, 0) + 1
+        samples = self.samples.setdefault(error, [])
+        if len(samples) < self.sample_size:
+            samples.append((line_number, list(row)))
+
+    def merge(self, other):
+        """Add the counts (and samples, up to sample_size) of another report to this one"""
+        self.total += other.total
+        for error, count in other.rejected.items():
+            self.rejected[error] = self.rejected.get(error, 0) + count
+            samples = self.samples.setdefault(error, [])
+            samples.extend(other.samples.get(error, [])[:self.sample_size - len(samples)])
+
+    def to_dict(self):
+        """Return the report as a json serializable dict"""
+        return {
+            "total": self.total,
+            "valid": self.valid,
+            "rejected": {error: count for error, count in self.rejected.items() if count > 0},
+            "samples": {error: [{"line": num, "row": row} for num, row in samples]
+                        for error, samples in self.samples.items() if len(samples) > 0},
+        }
+
+    def print_summary(self):
+        """Print the number of rows rejected by each rule along with the sample rows"""
+        rejected = self.total - self.valid
+        if rejected == 0:
+            return
+        print(f"Removed {rejected}/{self.total} invalid rows:")
+        for error, count in self.rejected.items():
+            if count == 0:
+                continue
+            print(f"  {error}: {count}")
+            for num, row in self.samples[error]:
+                bad_csv_print(row, error, num)
+
+class RowValidator:
+    """Validates rows against a schema (tuple of ColumnRule). Every pattern is compiled once, and rows are checked
+    column by column: each rule only matches the distinct values of its column, and the rows holding a rejected
+    value are found with a set lookup. A row is rejected for the first rule (in schema order) it breaks.
+    """
+
+    def __init__(self, schema, sample_size=VALIDATION_SAMPLE_SIZE):
+        """
+        Args:
+            schema (tuple): ColumnRule for the columns to check. Every column of the rows has to be named by at
+            least one rule, in the order of the columns.
+            sample_size (int, optional): number of rejected rows kept per rule. Defaults to VALIDATION_SAMPLE_SIZE.
+        """
+        self.schema = tuple(schema)
+        self.columns = tuple(dict.fromkeys(rule.column for rule in self.schema))
+        self.sample_size = sample_size
+        self.errors = (INVALID_LENGTH_ERROR,) + tuple(dict.fromkeys(rule.error for rule in self.schema))
+        self._checks = []
+        for rule in self.schema:
+            pattern = f"(?:{rule.pattern})"
+            if rule.allow_null:
+                pattern = f"(?i:null)|{pattern}"
+            self._checks.append((self.columns.index(rule.column), rule.error,
+                                 re.compile(pattern, rule.flags).fullmatch))
+
+    def check_header(self, header):
+        """Raise InvalidHeaderError if header is not the schema columns"""
+        if tuple(header) != self.columns:
+            raise InvalidHeaderError(header, self.columns)
+
+    def get_row_error(self, row):
+        """Return the reason the given row is rejected, None if it is valid"""
+        if len(row) != len(self.columns):
+            return INVALID_LENGTH_ERROR
+        for col, error, match in self._checks:
+            if match(row[col]) is None:
+                return error
+        return None
+
+    def validate(self, rows, first_line=1):
+        """Split rows into valid and rejected rows
+
+        Args:
+            rows (iterable): rows (list of str cells) without the header
+            first_line (int, optional): line number of the first row (for the samples). Defaults to 1.
+
+        Returns:
+            tuple: (list of valid rows, ValidationReport)
+        """
+        report = ValidationReport(self.errors, self.sample_size)
+        rows = rows if isinstance(rows, list) else list(rows)
+        report.total = len(rows)
+
+        # 0 for rows that are still valid, 1 once a rule rejects them
+        rejected = bytearray(len(rows))
+        checked = rows
+        if any(length != len(self.columns) for length in set(map(len, rows))):
+            for i, row in enumerate(rows):
+                if len(row) != len(self.columns):
+                    rejected[i] = 1
+                    report.reject(INVALID_LENGTH_ERROR, first_line + i, row)
+            # Placeholder rows so the columns of the other rows can still be read in one pass
+            placeholder = len(self.columns)*(None,)
+            checked = [row if not r else placeholder for row, r in zip(rows, rejected)]
+
+        for col, error, match in self._checks:
+            column = list(map(itemgetter(col), checked))
+            bad_values = {v for v in set(column) if v is not None and match(v) is None}
+            if len(bad_values) == 0:
+                continue
+            for i, value in enumerate(column):
+                if value in bad_values and not rejected[i]:
+                    rejected[i] = 1
+                    report.reject(error, first_line + i, rows[i])
+
+        return [row for row, r in zip(rows, rejected) if not r], report
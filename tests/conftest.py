@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The modules of src import each other by name (ie: `from constants import *`), like when a script is run
+sys.path.insert(0, str(Path(__file__).parents[1] / "src"))
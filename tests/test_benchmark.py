@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+import benchmark
+from exposure import EXPOSURE_VALIDATOR, create_rows, validate_rows
+from validation import ValidationReport
+
+def test_generators_are_seeded():
+    assert benchmark.generate_cases_page(50, seed=1) == benchmark.generate_cases_page(50, seed=1)
+    assert benchmark.generate_cases_page(50, seed=1) != benchmark.generate_cases_page(50, seed=2)
+    csv = benchmark.generate_building_map(30, seed=1)
+    assert csv == benchmark.generate_building_map(30, seed=1)
+    assert benchmark.generate_outlines(40, csv, seed=1) == benchmark.generate_outlines(40, csv, seed=1)
+    assert benchmark.generate_building_directory(30, seed=1).count("<tr>") == 30
+
+def test_malformed_lines_are_rejected():
+    report = ValidationReport(EXPOSURE_VALIDATOR.errors)
+    exposures = validate_rows(create_rows(benchmark.generate_splits(2000)), quiet_mode=True, report=report)
+    rejected = {error for error, count in report.rejected.items() if count > 0}
+    assert rejected == {"Class ID not numeric", "Invalid class field", "Location is not alphanumeric", 
+                        "invalid length"}
+    assert 100 < 2000 - len(exposures) < 300
+
+def test_results_are_json(capsys):
+    results = benchmark.run_benchmarks(["records", "cases", "directory"], sizes=[50])
+    stages = {(r["suite"], r["stage"]) for r in json.loads(json.dumps(results))["results"]}
+    assert {("records", "total"), ("cases", "iter_strong_text"), ("directory", "geocode_from_outlines")} <= stages
+    assert all(r["size"] == 50 and r["seconds"] >= 0 for r in results["results"])
+    assert set(results["meta"]) >= {"commit", "python", "numpy"}
+
+    with pytest.raises(ValueError):
+        benchmark.run_benchmarks(["records", "unknown"], sizes=[50])
+
+def test_compare_results_reports_slower_stages(capsys):
+    def run(*seconds):
+        return {"meta": {"commit": None}, "results": [benchmark.make_result("records", stage, 10, s) 
+                                                      for stage, s in zip(("create_rows", "validate_rows"), seconds)]}
+    assert benchmark.compare_results(run(1.0, 1.0), run(1.1, 2.0), threshold=1.2) == \
+        [("records", "validate_rows", 10, 2.0)]
@@ -0,0 +1,68 @@
+import pickle
+
+from parser import create_csv, validate_csv
+from exposure import create_rows, validate_rows, exposures_to_csv, add_building_information, BuildingMap
+
+SPLITS = [
+    ["BUAD-304", "14725", "MW", "18:00", "19:50", "JFFLL101"],
+    ["CSCI-103", "29918", "H", "9:30", "10:50", "SGM123"],
+    ["WRIT-150", "64820", "HT", "09:30", "10:50", "taper 112"],
+    ["MATH-125", "39526", "mwf", "12:00", "12:50", "office"],
+    ["PHYS-151", "42617", "TTH", "9:05", "23:59", "null"],
+    ["CHEM-105", "10120", "null", "null", "null", "ZHS159"],
+    ["AHIS-120", "20142", "XYZ", "10:00", "10:50", "THH101"],
+    ["BISC-120", "13120", "TH", "8:00", "9:50", "NULL"],
+    ["BAD", "1", "M", "1:00", "2:00", "KAP"],
+    ["ITP-115", "31840", "Ts", "13:00", "14:50"],
+]
+
+# What create_csv and validate_csv of the original parser.py returned for SPLITS
+BASELINE_CREATED = (
+    "class_name,code,weekday,start_time,end_time,location\n"
+    "BUAD-304,14725,MW,18:00,19:50,JFFLL101\n"
+    "CSCI-103,29918,H,9:30,10:50,SGM123\n"
+    "WRIT-150,64820,HT,09:30,10:50,taper 112\n"
+    "MATH-125,39526,mwf,12:00,12:50,office\n"
+    "PHYS-151,42617,TTH,9:05,23:59,null\n"
+    "CHEM-105,10120,null,null,null,ZHS159\n"
+    "AHIS-120,20142,null,null,null,THH101\n"
+    "BISC-120,13120,TH,8:00,9:50,NULL\n"
+    "BAD,1,M,1:00,2:00,KAP\n"
+    "ITP-115,31840,Ts,13:00,14:50,null\n"
+)
+BASELINE_VALIDATED = BASELINE_CREATED.replace("BAD,1,M,1:00,2:00,KAP\n", "")
+
+NORMALIZED = (
+    "class_name,code,weekday,start_time,end_time,location\n"
+    "BUAD-304,14725,MW,18:00,19:50,JFFLL101\n"
+    "CSCI-103,29918,TH,09:30,10:50,SGM123\n"
+    "WRIT-150,64820,TTH,09:30,10:50,taper 112\n"
+    "MATH-125,39526,MWF,12:00,12:50,office\n"
+    "PHYS-151,42617,TTH,09:05,23:59,null\n"
+    "CHEM-105,10120,null,null,null,ZHS159\n"
+    "AHIS-120,20142,null,null,null,THH101\n"
+    "BISC-120,13120,TH,08:00,09:50,null\n"
+    "ITP-115,31840,TS,13:00,14:50,null\n"
+)
+
+def test_create_csv_matches_baseline():
+    assert create_csv(SPLITS) == BASELINE_CREATED
+
+def test_validate_csv_matches_baseline():
+    assert validate_csv(BASELINE_CREATED, quiet_mode=True) == BASELINE_VALIDATED
+
+def test_validate_csv_keeps_valid_csv_unchanged():
+    assert validate_csv(BASELINE_VALIDATED, quiet_mode=True) == BASELINE_VALIDATED
+
+def test_cells_are_only_normalized_on_request():
+    exposures = validate_rows(create_rows(SPLITS), quiet_mode=True)
+    assert exposures_to_csv(exposures) == BASELINE_VALIDATED
+    assert exposures_to_csv(exposures, normalize=True) == NORMALIZED
+
+def test_original_cells_survive_building_information_and_pickling():
+    exposures = validate_rows(create_rows(SPLITS), quiet_mode=True)
+    exposures = add_building_information(exposures, BuildingMap(("building_name",), {"SGM": ("Seeley Mudd",)}))
+    exposures = pickle.loads(pickle.dumps(exposures))
+    assert exposures[1].to_row() + exposures[1].building == ("CSCI-103", "29918", "H", "9:30", "10:50", "SGM123",
+                                                             "Seeley Mudd")
+    assert exposures[1].to_row(normalize=True)[2:4] == ("TH", "09:30")
@@ -0,0 +1,33 @@
+import pytest
+
+from exposure import get_row_error, validate_rows, create_rows, parse_time
+
+def row(start_time, end_time="10:50"):
+    return ["CSCI-103", "29918", "MW", start_time, end_time, "SGM123"]
+
+@pytest.mark.parametrize("time", ["9:30", "09:30", "9:5", "14:05", "0:0", "23:59", "null"])
+def test_valid_times(time):
+    assert get_row_error(row(time)) is None
+
+@pytest.mark.parametrize("time", ["24:00", "9:60", "9:", ":30", "9:305", "930", "9.30"])
+def test_invalid_times(time):
+    assert get_row_error(row(time)) == "Start time invalid"
+
+def test_single_digit_minutes_are_parsed():
+    exposure, = validate_rows([row("9:5", "10:0")], quiet_mode=True)
+    assert (exposure.start_minute, exposure.end_minute) == (9*60 + 5, 10*60)
+    assert exposure.to_row()[3:5] == ("9:5", "10:0")
+    assert exposure.to_row(normalize=True)[3:5] == ("09:05", "10:00")
+
+@pytest.mark.parametrize("time", ["24:00", "9:60", "9:305", "9.30", "null"])
+def test_invalid_times_are_not_parsed(time):
+    assert parse_time(time) is None
+
+def test_create_rows_uses_the_same_time_check():
+    assert parse_time("9:5") == 9*60 + 5
+    assert create_rows([["CSCI-103", "29918", "MW", "9:5", "10:50", "SGM123"],
+                        ["CSCI-103", "29918", "MW", "24:00", "25:00", "SGM123"],
+                        ["CSCI-103", "29918", "MW", "9:30", "10:50", "24:00"]]) == [
+        ["CSCI-103", "29918", "MW", "9:5", "10:50", "SGM123"],
+        ["CSCI-103", "29918", "null", "null", "null", "SGM123"],
+        ["CSCI-103", "29918", "MW", "9:30", "10:50", "24:00"]]
@@ -0,0 +1,60 @@
+from geocode_cache import GeocodeCache, geocode_queries, geocode_addresses
+
+class Location:
+    def __init__(self, latitude, longitude):
+        self.latitude = latitude
+        self.longitude = longitude
+
+class StandInGeocoder:
+    """Answers from a dict of known addresses, raises for the queries in failing"""
+
+    def __init__(self, known, failing=()):
+        self.known = known
+        self.failing = set(failing)
+        self.calls = []
+
+    def geocode(self, query):
+        self.calls.append(query)
+        if query in self.failing:
+            raise TimeoutError("timed out")
+        location = self.known.get(query)
+        return Location(*location) if location is not None else None
+
+def geocode(queries, geocoder, cache):
+    return geocode_queries(queries, geocoder, cache, max_workers=2, min_delay=0)
+
+def test_answers_are_cached():
+    cache = GeocodeCache(":memory:")
+    geocoder = StandInGeocoder({"a": (34.02, -118.28)})
+    assert geocode(["a", "b", "a"], geocoder, cache) == {"a": (34.02, -118.28), "b": None}
+    assert sorted(geocoder.calls) == ["a", "b"]
+
+    # Both the location and the address that was not found come from the cache
+    assert geocode(["a", "b"], geocoder, cache) == {"a": (34.02, -118.28), "b": None}
+    assert len(geocoder.calls) == 2
+    assert cache.get("A ") == (True, (34.02, -118.28))
+    assert cache.get("b") == (True, None)
+
+def test_errors_are_not_cached():
+    cache = GeocodeCache(":memory:")
+    geocoder = StandInGeocoder({"a": (34.02, -118.28)}, failing=["a"])
+    assert geocode(["a"], geocoder, cache) == {"a": None}
+    assert cache.get("a") == (False, None)
+
+    # The next run retries the lookup
+    geocoder.failing.clear()
+    assert geocode(["a"], geocoder, cache) == {"a": (34.02, -118.28)}
+    assert geocoder.calls == ["a", "a"]
+
+def test_expired_entries_are_looked_up_again():
+    cache = GeocodeCache(":memory:", ttl=-1)
+    geocoder = StandInGeocoder({})
+    geocode(["a"], geocoder, cache)
+    geocode(["a"], geocoder, cache)
+    assert geocoder.calls == ["a", "a"]
+
+def test_addresses_fall_back_to_out_of_la_lookup():
+    geocoder = StandInGeocoder({"1 Main St., Los Angeles, CA": (34.0, -118.2), "2 Elm St.": (40.7, -74.0)})
+    locations = geocode_addresses(["1 Main St.", "2 Elm St.", "3 Oak St."], geocoder, GeocodeCache(":memory:"), 
+                                  max_workers=1, min_delay=0)
+    assert locations == {"1 Main St.": (34.0, -118.2), "2 Elm St.": (40.7, -74.0), "3 Oak St.": None}
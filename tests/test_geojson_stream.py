@@ -0,0 +1,109 @@
+import json
+
+import pytest
+
+from geojson_stream import GeoJSONWriter, GeoJSONStreamError, iter_geojson_features, iter_positions
+from outlines import is_candidate_feature, load_outlines
+
+def feature(i):
+    return {"type": "Feature", "properties": {"building_code": f"B{i:02d}"},
+            "geometry": {"type": "Point", "coordinates": [-118.28 + i/1000, 34.02]}}
+
+FEATURES = [feature(i) for i in range(7)]
+
+def write_features(path, features, source="inputs", fail_after=None):
+    with GeoJSONWriter(path, resume=True, source=source, checkpoint_every=2) as writer:
+        for i, f in enumerate(features):
+            if i == fail_after:
+                raise KeyboardInterrupt
+            writer.write_feature(f, key=f["properties"]["building_code"])
+    return writer
+
+def test_writes_a_feature_collection(tmp_path):
+    path = tmp_path / "outlines.geojson"
+    write_features(path, FEATURES)
+    assert json.loads(path.read_text()) == {"type": "FeatureCollection", "features": FEATURES}
+    assert list(iter_geojson_features(path)) == FEATURES
+    assert not (tmp_path / "outlines.geojson.partial").exists()
+    assert not (tmp_path / "outlines.geojson.checkpoint").exists()
+
+def test_resume_after_interruption(tmp_path):
+    path = tmp_path / "outlines.geojson"
+    with pytest.raises(KeyboardInterrupt):
+        write_features(path, FEATURES, fail_after=5)
+    assert not path.exists()
+
+    writer = write_features(path, FEATURES)
+    assert writer.resumed == 5
+    assert writer.skipped == 5
+    assert json.loads(path.read_text())["features"] == FEATURES
+
+def test_resume_drops_features_written_after_the_checkpoint(tmp_path):
+    path = tmp_path / "outlines.geojson"
+    writer = GeoJSONWriter(path, resume=True, source="inputs", checkpoint_every=2)
+    for f in FEATURES[:3]:
+        writer.write_feature(f, key=f["properties"]["building_code"])
+    # Killed without closing: the third feature is after the last checkpoint
+    writer._file.close()
+
+    writer = write_features(path, FEATURES)
+    assert writer.resumed == 2
+    assert json.loads(path.read_text())["features"] == FEATURES
+
+def test_checkpoint_of_other_inputs_is_not_resumed(tmp_path):
+    path = tmp_path / "outlines.geojson"
+    with pytest.raises(KeyboardInterrupt):
+        write_features(path, FEATURES, fail_after=4)
+
+    writer = write_features(path, FEATURES[::-1], source="other inputs")
+    assert writer.resumed == 0
+    assert json.loads(path.read_text())["features"] == FEATURES[::-1]
+
+def collection(features):
+    """FeatureCollection text with members before and after the features"""
+    return json.dumps({"type": "FeatureCollection", "name": "campus \"outlines\" ü", 
+                       "bbox": [-118.3, 34.0, -118.2, 34.1], "features": features, 
+                       "crs": {"properties": {"name": "EPSG:4326"}}, "count": 1234567}, ensure_ascii=False)
+
+def polygon(name, lon, building="university", amenity=None):
+    ring = [[lon, 34.02], [lon + 0.0001, 34.02], [lon + 0.0001, 34.0201], [lon, 34.02]]
+    return {"type": "Feature", "properties": {"name": name, "building": building, "amenity": amenity},
+            "geometry": {"type": "Polygon", "coordinates": [ring]}}
+
+OUTLINES = [polygon("Taper Hall", -118.2846), polygon(None, -118.2850), polygon("Café", -118.2860, amenity="cafe"), 
+            polygon("Tommy's Place", -118.2854, building="yes"), polygon("Off campus", -118.3500)] + FEATURES
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1 << 16])
+def test_streamed_features_match_json_load(tmp_path, chunk_size):
+    path = tmp_path / "outlines.geojson"
+    path.write_text(collection(OUTLINES), encoding="utf8")
+    assert list(iter_geojson_features(path, chunk_size=chunk_size)) == OUTLINES
+    with open(path, encoding="utf8") as f:
+        assert list(iter_geojson_features(f, chunk_size=chunk_size)) == OUTLINES
+
+@pytest.mark.parametrize("text", ['{}', '{"type": "FeatureCollection"}', '{"features": [], "type": "x"}'])
+def test_collections_without_features(tmp_path, text):
+    path = tmp_path / "empty.geojson"
+    path.write_text(text)
+    assert list(iter_geojson_features(path, chunk_size=3)) == []
+
+@pytest.mark.parametrize("text", ['[]', '{"features": [{"type": "Feature"}', '{"features": [1 2]}'])
+def test_invalid_collections(tmp_path, text):
+    path = tmp_path / "invalid.geojson"
+    path.write_text(text)
+    with pytest.raises(GeoJSONStreamError):
+        list(iter_geojson_features(path, chunk_size=4))
+
+def test_features_are_filtered_while_reading(tmp_path):
+    path = tmp_path / "outlines.geojson"
+    path.write_text(collection(OUTLINES), encoding="utf8")
+    bbox = (-118.29, 34.0, -118.28, 34.03)
+    assert list(iter_geojson_features(path, keep=is_candidate_feature, bbox=bbox)) == OUTLINES[:1] + OUTLINES[3:4]
+    assert list(iter_geojson_features(path, bbox=bbox)) == \
+        [f for f in OUTLINES if any(bbox[0] <= x <= bbox[2] and bbox[1] <= y <= bbox[3] 
+                                    for x, y in iter_positions(f["geometry"]))]
+
+    outlines = load_outlines(path, bbox=bbox)
+    assert outlines.names == ["Taper Hall", "Tommy's Place"]
+    assert [outlines.get_feature(i) for i in range(len(outlines))] == [OUTLINES[0], OUTLINES[3]]
+    assert load_outlines(path, require_name=False, bbox=bbox).names == ["Taper Hall", None, "Tommy's Place"]
@@ -0,0 +1,43 @@
+from exposure import Exposure
+from history_store import HistoryStore
+from aggregate import read_history_columns, aggregate, table_rows
+
+ROWS = [
+    ["BUAD-304", "14725", "MW", "18:00", "19:50", "JFFLL101"],
+    ["CSCI-104", "30001", "TTH", "10:00", "11:50", "GFS116"],
+    ["CSCI-170", "30002", "F", "12:00", "13:50", "GFS118"],
+    ["WRIT-150", "66001", "MW", "09:00", "10:20", "ZHS159"],
+    ["WRIT-340", "66002", "TTH", "14:00", "15:20", "ZHS352"],
+    ["WRIT-340", "66003", "TTH", "16:00", "17:20", "ZHS352"],
+    ["MATH-125", "39001", "MWF", "08:00", "08:50", "office"],
+]
+
+def make_store(tmp_path):
+    store = HistoryStore(tmp_path / "history")
+    exposures = [Exposure.from_row(row) for row in ROWS]
+    store.ingest(exposures, "2022-01-31", "a")
+    store.ingest(exposures[1:], "2022-02-07", "b")
+    return store
+
+def count_by_building(columns):
+    table = aggregate(columns, ("building", "class"), drop_null=False)
+    return {(building, class_name): count for building, class_name, count in table_rows(table, header=False)}
+
+def test_filtered_read_matches_unfiltered(tmp_path):
+    store = make_store(tmp_path)
+    everything = count_by_building(read_history_columns(store))
+    assert everything[("ZHS", "WRIT-340")] == 4
+    assert everything[("GFS", "CSCI-104")] == 2
+    assert everything[("null", "MATH-125")] == 2
+
+    for buildings in (["ZHS", "GFS"], ["GFS", "ZHS"], ["ZHS", "GFS", "ZHS"], ["JFF", "ZHS"]):
+        filtered = count_by_building(read_history_columns(store, buildings=buildings))
+        assert filtered == {k: count for k, count in everything.items() if k[0] in buildings}
+
+def test_filtered_rows_keep_their_building(tmp_path):
+    store = make_store(tmp_path)
+    for chunk, arrays in store.iter_chunks(buildings=["ZHS", "JFF", "GFS"]):
+        locations = [l.decode("utf8") for l in arrays["location"]]
+        codes = [code for code, start, end in store.get_building_ranges(chunk, ["ZHS", "JFF", "GFS"]) 
+                 for _ in range(end - start)]
+        assert [l[:3] for l in locations] == codes
@@ -0,0 +1,62 @@
+import json
+
+from instrumentation import Metrics
+
+def test_disabled_metrics_record_nothing():
+    metrics = Metrics()
+    with metrics.stage("parse"):
+        metrics.count("rows_parsed", 10)
+    metrics.add_stage("page", 1.0)
+    assert metrics.to_dict() == {"stages": {}, "counters": []}
+
+def test_stages_and_counters():
+    metrics = Metrics(enabled=True, trace_memory=True)
+    for _ in range(2):
+        with metrics.stage("parse"):
+            with metrics.stage("validate"):
+                data = [0]*100000
+            del data
+    metrics.count("rows_rejected", 2, reason="invalid length")
+    metrics.count("rows_rejected", reason="invalid length")
+    metrics.count("rows_rejected", reason="Start time invalid")
+
+    assert metrics.stages["parse"]["calls"] == metrics.stages["validate"]["calls"] == 2
+    assert metrics.stages["parse"]["seconds"] >= metrics.stages["validate"]["seconds"] > 0
+    # The peak of a nested stage also counts for the stages around it
+    assert metrics.stages["parse"]["peak_memory"] >= metrics.stages["validate"]["peak_memory"] >= 800000
+    assert metrics.get_count("rows_rejected", reason="invalid length") == 3
+    assert metrics.get_count("rows_rejected") == 0
+
+def test_worker_metrics_are_merged():
+    main, worker = Metrics(enabled=True), Metrics(enabled=True)
+    main.add_stage("page", 1.0, 100)
+    main.count("pages", result="parsed")
+    worker.add_stage("page", 2.0, 300)
+    worker.count("pages", 2, result="parsed")
+    worker.count("pages", result="failed")
+    main.merge(json.loads(json.dumps(worker.pop())))
+
+    assert worker.to_dict() == {"stages": {}, "counters": []}
+    assert main.stages["page"] == {"calls": 2, "seconds": 3.0, "peak_memory": 300}
+    assert (main.get_count("pages", result="parsed"), main.get_count("pages", result="failed")) == (3, 1)
+
+def test_prometheus_text_format():
+    metrics = Metrics(enabled=True)
+    metrics.add_stage("parse html", 1.5, 2048)
+    metrics.count("rows_rejected", 4, reason='Class "ID"\\not\nnumeric')
+    lines = metrics.to_prometheus(prefix="test").splitlines()
+
+    assert "# TYPE test_stage_seconds_total counter" in lines
+    assert 'test_stage_seconds_total{stage="parse html"} 1.5' in lines
+    assert 'test_stage_peak_memory_bytes{stage="parse html"} 2048' in lines
+    assert "# TYPE test_rows_rejected_total counter" in lines
+    assert 'test_rows_rejected_total{reason="Class \\"ID\\"\\\\not\\nnumeric"} 4' in lines
+
+def test_write_run(tmp_path):
+    assert Metrics().write_run("parser", tmp_path) == []
+    metrics = Metrics(enabled=True)
+    metrics.count("pages", result="parsed")
+    json_path, prom_path = metrics.write_run("parser", tmp_path / "metrics")
+    assert json.loads(json_path.read_text())["counters"] == [{"name": "pages", "labels": {"result": "parsed"}, 
+                                                              "value": 1}]
+    assert 'usc_covid_pages_total{result="parsed"} 1' in prom_path.read_text().splitlines()
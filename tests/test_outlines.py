@@ -0,0 +1,226 @@
+import copy
+
+import numpy as np
+import pytest
+
+from constants import OUTLINE_MATCH_DISTANCE
+from map_building_code_to_outline import create_output_geojson, create_output_geojson_global
+from outlines import (OutlineSet, GridIndex, get_search_radius, score_buildings, get_candidate_pairs, 
+                      geocode_from_outlines, get_radial_distance)
+from similarity import NameSimilarity
+from benchmark import generate_building_map, generate_outlines
+
+BUILDING_MAP_HEADER = "building_code,building_name,building_address,lat,lon\n"
+
+def outline(name, lat, lon, size=0.0002):
+    ring = [[lon - size, lat - size], [lon + size, lat - size], [lon + size, lat + size], [lon - size, lat + size],
+            [lon - size, lat - size]]
+    return {"type": "Feature", "properties": {"name": name, "building": "university"},
+            "geometry": {"type": "Polygon", "coordinates": [ring]}}
+
+def building_map(*rows):
+    return BUILDING_MAP_HEADER + "".join(",".join(str(c) for c in row) + "\n" for row in rows)
+
+def matches(geojson):
+    """building code -> name of the matched outline"""
+    return {f["properties"]["building_code"]: f["properties"]["name"] for f in geojson["features"]}
+
+def test_abbreviated_names_are_matched():
+    # "LVL" shares too few trigrams with "Leavey Library" to make the trigram shortlist
+    geojson = {"type": "FeatureCollection", "features": [outline("LVL", 34.0219, -118.2828)]}
+    csv = building_map(("LVL", "Leavey Library", "651 W 35th St.", 34.0220, -118.2829))
+    assert NameSimilarity(["Leavey Library"], ["LVL"], cache_folder=None).get_similarities("Leavey Library")[0] == 0
+    assert matches(create_output_geojson(geojson, csv, similarity_cache_folder=None)) == {"LVL": "LVL"}
+
+def test_matches_are_the_same_as_comparing_every_name():
+    csv = generate_building_map(80, seed=3)
+    geojson = generate_outlines(200, csv, seed=3)
+    # No spatial index and names compared on the fly: every building is checked against every outline
+    dense = create_output_geojson_global(OutlineSet(geojson), csv)
+    assert len(dense["features"]) > 0
+    assert create_output_geojson(geojson, csv, similarity_cache_folder=None) == dense
+
+def test_candidate_pairs_are_the_same_for_any_number_of_jobs():
+    csv = generate_building_map(60, seed=5)
+    outlines = OutlineSet(generate_outlines(150, csv, seed=5))
+    rows = [line.split(",") for line in csv.splitlines()[1:] if "null" not in line]
+    args = (outlines, [float(r[3]) for r in rows], [float(r[4]) for r in rows], [r[1] for r in rows], True,
+            GridIndex(outlines, get_search_radius()), NameSimilarity([r[1] for r in rows], outlines.names, 
+                                                                     threshold=None, cache_folder=None))
+    one = get_candidate_pairs(*args, jobs=1)
+    two = get_candidate_pairs(*args, jobs=2, block_rows=16)
+    assert len(one[0]) > 0
+    assert all((a == b).all() for a, b in zip(one, two))
+
+def test_output_is_the_same_for_any_number_of_jobs():
+    csv = generate_building_map(80, seed=7)
+    geojson = generate_outlines(200, csv, seed=7)
+    one = create_output_geojson(geojson, csv, similarity_cache_folder=None, jobs=1)
+    assert len(one["features"]) > 0
+    assert create_output_geojson(geojson, csv, similarity_cache_folder=None, jobs=2) == one
+
+def brute_force_candidates(outlines, lat, lon, radius):
+    return [f for f in range(len(outlines)) if outlines.get_distance(f, lat, lon) < radius]
+
+@pytest.mark.parametrize("weight_location_on_name", [True, False])
+def test_grid_index_finds_every_feature_in_the_search_radius(weight_location_on_name):
+    radius = get_search_radius(weight_location_on_name)
+    assert radius == (2*OUTLINE_MATCH_DISTANCE if weight_location_on_name else OUTLINE_MATCH_DISTANCE)
+    # Building just below a cell border, outlines just inside the radius on both sides of it and one just outside
+    border = 2128*radius
+    lat, lon = border - 1e-7, -118.2851
+    features = [outline("Above", border + radius - 1e-4 - 0.0002, lon, 0.0002),
+                outline("Below", lat - radius + 1e-4 + 0.0002, lon, 0.0002),
+                outline("Diagonal", lat + 0.7*radius, lon + 0.7*radius, 0.0001),
+                outline("Far", lat + radius + 1e-4 + 0.0002, lon, 0.0002)]
+    outlines = OutlineSet({"type": "FeatureCollection", "features": features})
+    index = GridIndex(outlines, radius)
+    assert index.get_cell(lat, lon)[0] != index.get_cell(lat + 2e-7, lon)[0]
+    expected = brute_force_candidates(outlines, lat, lon, radius)
+    assert [outlines.names[f] for f in expected] == ["Above", "Below", "Diagonal"]
+    assert set(expected) <= set(index.get_candidates(lat, lon))
+
+@pytest.mark.parametrize("weight_location_on_name", [True, False])
+def test_grid_index_scores_the_same_pairs_as_a_brute_force_scan(weight_location_on_name):
+    csv = generate_building_map(80, seed=11)
+    outlines = OutlineSet(generate_outlines(200, csv, seed=11), require_name=weight_location_on_name)
+    rows = [line.split(",") for line in csv.splitlines()[1:] if "null" not in line]
+    lats, lons, names = [float(r[3]) for r in rows], [float(r[4]) for r in rows], [r[1] for r in rows]
+    index = GridIndex(outlines, get_search_radius(weight_location_on_name))
+    for lat, lon in zip(lats, lons):
+        radius = get_search_radius(weight_location_on_name)
+        assert set(brute_force_candidates(outlines, lat, lon, radius)) <= set(index.get_candidates(lat, lon))
+
+    grid = score_buildings(outlines, lats, lons, names, weight_location_on_name, index)
+    brute_force = score_buildings(outlines, lats, lons, names, weight_location_on_name, None)
+    assert len(grid[0]) > 0
+    assert all((a == b).all() for a, b in zip(grid[:3], brute_force[:3]))
+    assert grid[3] < brute_force[3]
+
+def match_distances(geojson):
+    """building code -> (name of the matched outline, match distance)"""
+    return {f["properties"]["building_code"]: (f["properties"]["name"], f["min_dist"]) for f in geojson["features"]}
+
+def test_competing_buildings_get_the_same_outline_in_global_and_blacklist_mode():
+    # Both buildings are closest to "Taper Hall", Taper Hall is closer to it so Waite Phillips falls back to its own
+    geojson = {"type": "FeatureCollection", "features": [outline("Taper Hall", 34.0220, -118.2840), 
+                                                         outline("Waite Phillips Hall", 34.0220, -118.2868)]}
+    csv = building_map(("THH", "Taper Hall", "3501 Trousdale Pkwy.", 34.0221, -118.2841),
+                       ("WPH", "Waite Phillips Hall", "3470 Trousdale Pkwy.", 34.0221, -118.2846))
+    results = {mode: create_output_geojson(geojson, csv, match_mode=mode, similarity_cache_folder=None, 
+                                           weight_location_on_name=False)
+               for mode in ("global", "blacklist")}
+    assert matches(results["global"]) == {"THH": "Taper Hall", "WPH": "Waite Phillips Hall"}
+    assert match_distances(results["global"]) == match_distances(results["blacklist"])
+
+@pytest.mark.parametrize("weight_location_on_name", [True, False])
+def test_global_mode_matches_the_blacklist_mode(weight_location_on_name):
+    csv = generate_building_map(80, seed=13)
+    geojson = generate_outlines(200, csv, seed=13)
+    results = {mode: create_output_geojson(geojson, csv, weight_location_on_name=weight_location_on_name, 
+                                           match_mode=mode, similarity_cache_folder=None)
+               for mode in ("global", "blacklist")}
+    assert len(results["global"]["features"]) > 0
+    assert match_distances(results["global"]) == match_distances(results["blacklist"])
+
+def feature_collection(*features):
+    return {"type": "FeatureCollection", "features": list(features)}
+
+def test_geocode_from_outlines():
+    outlines = OutlineSet(feature_collection(outline("Leavey Library", 34.0219, -118.2828),
+                                             outline("Leavey Library", 34.0300, -118.2900),
+                                             outline("Taper Hall", 34.0222, -118.2846)))
+    locations = geocode_from_outlines(["Leavey Libary", "Taper Hall", "Doheny Library", None, "Taper Hall"], outlines)
+    assert locations["Leavey Libary"] == pytest.approx((34.0219, -118.2828))
+    assert locations["Taper Hall"] == pytest.approx((34.0222, -118.2846))
+    assert locations["Doheny Library"] is None
+    assert locations[None] is None
+
+def test_geocode_from_outlines_only_keeps_the_most_similar_building():
+    outlines = OutlineSet(feature_collection(outline("Flower Street Structure", 34.0186, -118.2810)))
+    # Similar enough on its own...
+    assert geocode_from_outlines(["Royal Street Structure"], outlines, min_similarity=0.75) == \
+        {"Royal Street Structure": pytest.approx((34.0186, -118.2810))}
+    # ...but the outline belongs to the building with the same name
+    locations = geocode_from_outlines(["Royal Street Structure", "Flower Street Structure"], outlines, 
+                                      min_similarity=0.75)
+    assert locations["Royal Street Structure"] is None
+    assert locations["Flower Street Structure"] == pytest.approx((34.0186, -118.2810))
+
+def mixed_outlines():
+    """Features of every geometry type, with their geojson"""
+    polygon = outline("Taper Hall", 34.0222, -118.2846)
+    with_hole = outline("Leavey Library", 34.0219, -118.2828, 0.0004)
+    with_hole["geometry"]["coordinates"].append(outline("", 34.0219, -118.2828, 0.0001)["geometry"]["coordinates"][0])
+    multi = outline("Fertitta Hall", 34.0188, -118.2822)
+    multi["geometry"] = {"type": "MultiPolygon", "coordinates": [polygon["geometry"]["coordinates"], 
+                                                                 multi["geometry"]["coordinates"]]}
+    point = outline("Tommy Trojan", 34.0206, -118.2854)
+    point["geometry"] = {"type": "Point", "coordinates": [-118.2854, 34.0206]}
+    line = outline("Trousdale Pkwy", 0, 0)
+    line["geometry"] = {"type": "LineString", "coordinates": [[-118.2851, 34.0190], [-118.2851, 34.0240]]}
+    geojson = feature_collection(polygon, with_hole, multi, point, line)
+    return OutlineSet(geojson), geojson
+
+def loop_distance(feature, lat, lon):
+    """Distance to the closest vertex with a python loop over every vertex"""
+    positions = []
+    def walk(coordinates):
+        if not isinstance(coordinates[0], list):
+            positions.append(coordinates)
+        else:
+            for c in coordinates:
+                walk(c)
+    walk(feature["geometry"]["coordinates"])
+    return min(float(get_radial_distance(p[1], p[0], lat, lon)) for p in positions)
+
+def test_distances_match_a_loop_over_every_vertex():
+    outlines, geojson = mixed_outlines()
+    points = [(34.0210, -118.2840), (34.0188, -118.2822), (34.0300, -118.2700)]
+    expected = [[loop_distance(f, lat, lon) for f in geojson["features"]] for lat, lon in points]
+
+    for (lat, lon), row in zip(points, expected):
+        assert outlines.get_distances(lat, lon) == pytest.approx(row)
+        assert outlines.get_distances(lat, lon, [3, 0, 3]) == pytest.approx([row[3], row[0], row[3]])
+        assert outlines.get_distance(4, lat, lon) == pytest.approx(row[4])
+    lats, lons = zip(*points)
+    assert outlines.get_distance_matrix(lats, lons, chunk_size=2) == pytest.approx(np.array(expected))
+
+def test_features_are_rebuilt_from_the_vertex_arrays():
+    outlines, geojson = mixed_outlines()
+    assert outlines.names == [f["properties"]["name"] for f in geojson["features"]]
+    for feature_num, feature in enumerate(geojson["features"]):
+        assert outlines.get_feature(feature_num) == feature
+
+@pytest.mark.parametrize("match_mode", ["global", "blacklist"])
+def test_outlines_can_be_matched_again(match_mode):
+    csv = generate_building_map(40, seed=17)
+    geojson = generate_outlines(100, csv, seed=17)
+    source = copy.deepcopy(geojson)
+    def match(building_outline):
+        return create_output_geojson(building_outline, csv, match_mode=match_mode, similarity_cache_folder=None, 
+                                     jobs=1)
+
+    first = match(geojson)
+    assert len(first["features"]) > 0
+    assert geojson == source
+
+    outlines = OutlineSet(geojson)
+    reused = [match(outlines) for _ in range(2)]
+    assert reused[0] == first
+    # Output features are copies, changing them does not change the next run
+    for feature in reused[0]["features"]:
+        feature["properties"]["name"] = "changed"
+        feature["geometry"]["coordinates"][0][0][0] = 0.0
+    assert match(outlines) == reused[1]
+
+def test_closest_building_keeps_the_feature():
+    geojson = feature_collection(outline("Taper Hall", 34.0220, -118.2840))
+    csv = building_map(("THX", "Taper Hall", "3501 Trousdale Pkwy.", 34.0224, -118.2844),
+                       ("THH", "Taper Hall", "3501 Trousdale Pkwy.", 34.0221, -118.2841))
+    output = create_output_geojson(geojson, csv, match_mode="blacklist", similarity_cache_folder=None, jobs=1)
+    feature, = output["features"]
+    assert feature["properties"]["building_code"] == "THH"
+    assert feature["properties"]["building"] == "university"
+    assert feature["properties"]["min_dist"] == feature["min_dist"]
+    assert "building_code" not in geojson["features"][0]["properties"]
@@ -0,0 +1,80 @@
+import pytest
+
+import parser
+from exposure import BuildingMap
+from snapshot_cache import SnapshotCache
+from history_store import HistoryStore
+
+PAGE = """<html><body>
+<p><strong>BUAD-304 14725 MW || 18:00 || 19:50 || JFFLL101</strong></p>
+<p><strong>CSCI-103 29918 TTH || 9:30 || 10:50 || SGM123</strong></p>
+</body></html>
+"""
+
+BUILDING_MAP = BuildingMap(("building_name",), {"JFF": ("Fertitta Hall",)})
+
+@pytest.fixture
+def page(tmp_path):
+    path = tmp_path / "page-2022-01-31.html"
+    path.write_text(PAGE)
+    return path
+
+@pytest.fixture
+def cache(tmp_path):
+    return SnapshotCache(tmp_path / "cache", building_map_path=None)
+
+@pytest.mark.parametrize("building_map", [None, BUILDING_MAP], ids=["validated", "enriched"])
+def test_every_page_is_looked_up_once(tmp_path, page, cache, building_map):
+    parser.init_batch_worker(building_map, cache)
+    first = parser.parse_batch_page(page, tmp_path / "first.csv")
+    assert (first["error"], first["cache_hit"], first["valid_rows"]) == (None, False, 2)
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    second = parser.parse_batch_page(page, tmp_path / "second.csv")
+    assert (second["error"], second["cache_hit"], second["valid_rows"]) == (None, True, 2)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert (tmp_path / "first.csv").read_text() == (tmp_path / "second.csv").read_text()
+
+def test_pages_with_the_same_name_are_rejected_before_parsing(tmp_path):
+    html = tmp_path / "html"
+    html.mkdir()
+    for name in ("page.html", "page.htm", "other.html"):
+        (html / name).write_text(PAGE)
+    with pytest.raises(ValueError, match="page.htm"):
+        parser.run_batch(html, tmp_path / "output", jobs=1, building_map_path=None, use_cache=False, 
+                         history_folder=None)
+    assert not (tmp_path / "output").exists()
+
+def test_batch_outputs_are_named_after_the_pages(tmp_path):
+    pages = [tmp_path / "page-2022-01-31.html", tmp_path / "page-2022-02-07.htm"]
+    assert parser.get_batch_outputs(pages, tmp_path / "output", "csv.gz") == \
+        [tmp_path / "output" / "page-2022-01-31.csv.gz", tmp_path / "output" / "page-2022-02-07.csv.gz"]
+    with pytest.raises(ValueError):
+        parser.get_batch_outputs([tmp_path / "Page.html", tmp_path / "page.HTM"], tmp_path / "output")
+
+def test_plain_runs_keep_the_enriched_entries(tmp_path, page):
+    building_map_path = tmp_path / "building_code_map.csv"
+    building_map_path.write_text("building_code,building_name\nJFF,Fertitta Hall\n")
+    folder = tmp_path / "cache"
+    SnapshotCache(folder, building_map_path=building_map_path).put("hash", [], enriched=True)
+
+    SnapshotCache(folder, building_map_path=None)
+    cache = SnapshotCache(folder, building_map_path=building_map_path)
+    assert cache.get("hash", enriched=True) == []
+
+    building_map_path.write_text("building_code,building_name\nJFF,Fertitta Hall\nSGM,Seeley Mudd\n")
+    assert SnapshotCache(folder, building_map_path=building_map_path).get("hash", enriched=True) is None
+
+def test_pages_with_the_same_content_write_one_history_chunk(tmp_path):
+    html = tmp_path / "html"
+    html.mkdir()
+    # Same content and date (the chunk names would collide) and same content on another date
+    for name in ("copy-2022-01-31.html", "page-2022-01-31.html", "page-2022-02-07.html"):
+        (html / name).write_text(PAGE)
+    history_folder = tmp_path / "history"
+    for _ in range(2):
+        parser.run_batch(html, tmp_path / "output", jobs=2, building_map_path=None, use_cache=False, 
+                         history_folder=history_folder)
+        store = HistoryStore(history_folder)
+        assert [(c["date"], c["rows"]) for c in store.get_chunks()] == [("2022-01-31", 2)]
+        assert [p.name for p in store.chunk_folder.iterdir()] == [store.get_chunks()[0]["name"]]
@@ -0,0 +1,47 @@
+import pytest
+from bs4 import BeautifulSoup
+
+from parser import HEADING_TAGS, iter_strong_text, parse_page_strong_text
+
+PAGE = """<!DOCTYPE html>
+<html><head><title>Covid &amp; classes</title></head><body>
+<h2>Posted <em>January</em>&nbsp;31,
+2022</h2>
+<p><strong>BUAD-304 14725 MW || 18:00 || 19:50 || JFFLL101</strong></p>
+<p><strong>CSCI-103   29918 TTH||9:30||10:50||SGM&nbsp;123<br>second line</strong></p>
+<div><span><strong>WRIT-150 64820 F || 09:30 || 10:50 || Taper &amp; Hall 112<em>(moved)</em></strong></span></div>
+<p><strong>MATH-125 39526 &#77;WF || 12:00 || || KAP&#x20;156</strong><br/></p>
+<h3>Posted February 7, 2022</h3>
+<ul><li><strong>Notice: </strong>classes below were <b>not</b> verified</li>
+<li><strong>PHYS-151 42617 TTH || 9:05 || 23:59 || </strong></li>
+<li><strong>
+  CHEM-105 10120 null || null || null || ZHS159
+</strong></li></ul>
+<p><b><strong>AHIS-120 20142 TH || 10:00 || 10:50 || THH&lt;101&gt;</strong></b></p>
+</body></html>
+"""
+
+@pytest.fixture
+def page(tmp_path):
+    path = tmp_path / "page-2022-01-31.html"
+    path.write_text(PAGE, encoding="utf8")
+    return path
+
+def soup_strongs(path):
+    with open(path, encoding="utf8") as f:
+        return BeautifulSoup(f, "html.parser").find_all("strong")
+
+@pytest.mark.parametrize("chunk_size", [7, 64*1024])
+def test_streaming_text_matches_beautifulsoup(page, chunk_size):
+    assert list(iter_strong_text(page, chunk_size=chunk_size)) == [str(s.contents[0]) for s in soup_strongs(page)]
+
+def test_streaming_rows_match_beautifulsoup(page):
+    rows = parse_page_strong_text(iter_strong_text(page))
+    assert len(rows) == 7
+    assert rows == parse_page_strong_text(soup_strongs(page))
+
+def test_headings(page):
+    headings = [heading for heading, _ in iter_strong_text(page, with_headings=True, chunk_size=5)]
+    expected = [" ".join(s.find_previous(HEADING_TAGS).get_text().split()) for s in soup_strongs(page)]
+    assert headings == expected
+    assert headings[0] == "Posted January 31, 2022"
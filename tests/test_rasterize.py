@@ -0,0 +1,90 @@
+import json
+
+import numpy as np
+import pytest
+
+from aggregate import read_exposure_columns
+from exposure import read_building_map
+from rasterize import HeatmapGrid, blur, get_gaussian_kernel, rasterize, write_heatmap
+
+HEADER = "class_name,code,weekday,start_time,end_time,location\n"
+
+BUILDING_MAP = read_building_map(
+    "building_code,building_name,building_address,lat,lon\n"
+    "JFF,Fertitta Hall,3670 Trousdale Pkwy.,34.0185,-118.2825\n"
+    "SGM,Seeley Mudd,3620 McClintock Ave.,34.0215,-118.2895\n"
+    "KAP,Kaprielian Hall,3620 Vermont Ave.,null,null\n"
+)
+
+# Fertitta Hall is in cell (8, 7) and Seeley Mudd in cell (11, 0)
+GRID = HeatmapGrid(min_lat=34.01, min_lon=-118.29, cell_size=0.001, rows=20, cols=10)
+
+PAGES = {
+    "output-2022-01-31.csv": ["BUAD-304,14725,MW,18:00,19:50,JFFLL101", "BUAD-305,14726,F,18:00,19:50,JFF236",
+                              "CSCI-103,29918,TTH,9:30,10:50,SGM123", "MATH-125,39526,MWF,12:00,12:50,KAP156",
+                              "WRIT-150,64820,MW,9:00,10:20,office"],
+    "output-2022-02-02.csv": ["CSCI-104,30001,TTH,10:00,11:50,SGM101"],
+}
+
+@pytest.fixture
+def columns(tmp_path):
+    paths = []
+    for name, rows in PAGES.items():
+        paths.append(tmp_path / name)
+        paths[-1].write_text(HEADER + "".join(row + "\n" for row in rows))
+    return read_exposure_columns(paths)
+
+def test_exposures_are_binned_per_day(columns):
+    heatmap = rasterize(columns, BUILDING_MAP, GRID, period="day", sigma=0)
+    assert heatmap.labels == ["2022-01-31", "2022-02-01", "2022-02-02"]
+    assert heatmap.frames.shape == (3, 20, 10)
+    expected = np.zeros((3, 20, 10), dtype=np.float32)
+    expected[0, 8, 7] = 2
+    expected[0, 11, 0] = 1
+    expected[2, 11, 0] = 1
+    assert np.array_equal(heatmap.frames, expected)
+    # Kaprielian Hall has no location and "office" is not a building
+    assert heatmap.exposures == 4
+
+def test_exposures_are_binned_per_week(columns):
+    heatmap = rasterize(columns, BUILDING_MAP, GRID, period="week", sigma=0)
+    assert heatmap.labels == ["2022-W05"]
+    assert (heatmap.frames[0, 8, 7], heatmap.frames[0, 11, 0], heatmap.frames.sum()) == (2, 2, 4)
+
+def test_grid_is_fit_to_the_buildings(columns):
+    heatmap = rasterize(columns, BUILDING_MAP, period="day", sigma=0)
+    min_lon, min_lat, max_lon, max_lat = heatmap.grid.bbox
+    assert min_lat < 34.0185 < 34.0215 < max_lat and min_lon < -118.2895 < -118.2825 < max_lon
+    assert heatmap.frames.sum() == heatmap.exposures == 4
+
+def test_blur_matches_a_loop_over_every_cell():
+    rng = np.random.default_rng(0)
+    frames = np.zeros((2, 12, 15), dtype=np.float32)
+    frames[:, 3:9, 4:11] = rng.integers(0, 5, (2, 6, 7))
+    kernel = get_gaussian_kernel(1.0).astype(np.float64)
+    radius = len(kernel)//2
+
+    expected = np.zeros(frames.shape)
+    for f, r, c in zip(*np.nonzero(frames)):
+        for i, wi in enumerate(kernel):
+            for j, wj in enumerate(kernel):
+                rr, cc = r + i - radius, c + j - radius
+                if 0 <= rr < frames.shape[1] and 0 <= cc < frames.shape[2]:
+                    expected[f, rr, cc] += frames[f, r, c]*wi*wj
+    blurred = blur(frames, 1.0)
+    assert blurred == pytest.approx(expected, abs=1e-5)
+    # Nothing is close enough to the edges to be lost
+    assert blurred.sum(axis=(1, 2)) == pytest.approx(frames.sum(axis=(1, 2)), rel=1e-5)
+    assert blur(frames, 0) is frames
+
+def test_write_heatmap(tmp_path, columns):
+    heatmap = rasterize(columns, BUILDING_MAP, GRID, period="day", sigma=1.0)
+    paths = write_heatmap(heatmap, tmp_path / "heatmap")
+    assert [p.name for p in paths] == ["heatmap.npy", "heatmap.json", "heatmap-2022-01-31.png", 
+                                       "heatmap-2022-02-01.png", "heatmap-2022-02-02.png"]
+    assert np.array_equal(np.load(paths[0]), heatmap.frames)
+    assert json.loads(paths[1].read_text())["labels"] == heatmap.labels
+    png = paths[2].read_bytes()
+    assert png.startswith(b"\x89PNG\r\n\x1a\n")
+    # IHDR width and height
+    assert (int.from_bytes(png[16:20], "big"), int.from_bytes(png[20:24], "big")) == (10, 20)
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+from record_io import RecordWriter, RECORD_FORMATS, get_record_format, get_record_path, open_record_writer, iter_records
+
+HEADER = ("class_name", "code", "weekday", "start_time", "end_time", "location", "building_address")
+
+ROWS = [
+    ("BUAD-304", "14725", "MW", "18:00", "19:50", "JFFLL101", "3670 Trousdale Pkwy, Los Angeles"),
+    ("CSCI-103", "29918", "TTH", "09:30", "10:50", "SGM123", 'The "Mudd" Hall'),
+    ("MATH-125", "39526", "null", "null", "null", "KAP", "null"),
+]
+
+TEXT_FORMATS = ["csv", "csv.gz", "ndjson", "ndjson.gz"]
+
+def write(path, rows=ROWS, chunk_rows=2):
+    with open_record_writer(path, HEADER, chunk_rows=chunk_rows) as writer:
+        writer.write_rows(rows)
+    return writer.rows
+
+@pytest.mark.parametrize("record_format", TEXT_FORMATS)
+def test_round_trip(tmp_path, record_format):
+    path = get_record_path(tmp_path, "page", record_format)
+    assert write(path) == len(ROWS)
+    header, *rows = iter_records(path)
+    assert tuple(header) == HEADER
+    assert [tuple(row) for row in rows] == ROWS
+
+@pytest.mark.parametrize("record_format", ["parquet", "arrow"])
+def test_columnar_round_trip(tmp_path, record_format):
+    pytest.importorskip("pyarrow")
+    path = get_record_path(tmp_path, "page", record_format)
+    write(path)
+    header, *rows = iter_records(path, columns=("class_name", "location"))
+    assert header == ["class_name", "location"]
+    assert [tuple(row) for row in rows] == [(row[0], row[5]) for row in ROWS]
+
+def test_csv_quotes_cells_with_commas_and_quotes(tmp_path):
+    path = tmp_path / "page.csv"
+    write(path)
+    lines = path.read_text().splitlines()
+    assert lines[1].endswith(',"3670 Trousdale Pkwy, Los Angeles"')
+    assert lines[2].endswith(',"The ""Mudd"" Hall"')
+
+@pytest.mark.parametrize("rows", [0, 1, 4, 5])
+def test_every_chunk_is_written(tmp_path, rows):
+    path = tmp_path / "page.csv.gz"
+    assert write(path, (ROWS[i % len(ROWS)] for i in range(rows)), chunk_rows=2) == rows
+    assert len(list(iter_records(path))) == rows + 1
+
+def test_get_record_format():
+    assert get_record_format("page.csv.gz") == "csv.gz"
+    assert get_record_format("PAGE.NDJSON") == "ndjson"
+    assert get_record_format("page.txt") is None
+    assert {get_record_format(f"page{extension}") for extension in RECORD_FORMATS.values()} == set(RECORD_FORMATS)
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        open_record_writer(tmp_path / "page.csv", HEADER, record_format="xlsx")
+
+def write_ndjson(path, records):
+    path.write_text("".join(json.dumps(record) + "\n" for record in records))
+
+def test_ndjson_header_has_the_keys_of_every_record(tmp_path):
+    path = tmp_path / "page.ndjson"
+    write_ndjson(path, [{"class_name": "BUAD-304", "location": "JFFLL101"}, 
+                        {"class_name": "CSCI-103", "weekday": "TTH"}])
+    assert list(iter_records(path)) == [["class_name", "location", "weekday"], 
+                                        ["BUAD-304", "JFFLL101", None], ["CSCI-103", None, "TTH"]]
+
+def test_ndjson_requested_columns_are_always_returned(tmp_path):
+    path = tmp_path / "page.ndjson"
+    write_ndjson(path, [{"class_name": "BUAD-304"}, {"class_name": "CSCI-103", "location": "SGM123"}])
+    assert list(iter_records(path, columns=("location", "class_name"))) == \
+        [["location", "class_name"], [None, "BUAD-304"], ["SGM123", "CSCI-103"]]
+
+def test_empty_ndjson_still_has_a_header(tmp_path):
+    path = tmp_path / "page.ndjson"
+    assert write(path, []) == 0
+    assert list(iter_records(path, columns=HEADER)) == [list(HEADER)]
+
+def test_writers_must_implement_every_method(tmp_path):
+    class ChunkOnlyWriter(RecordWriter):
+        def _write_chunk(self, chunk):
+            pass
+
+    with pytest.raises(TypeError, match="_close"):
+        ChunkOnlyWriter(tmp_path / "page.txt", HEADER)
@@ -0,0 +1,77 @@
+import csv
+
+import numpy as np
+import pytest
+
+import similarity
+from similarity import (NameSimilarity, compare_strings, compute_similarity_matrix, get_similarity_cache_path, 
+                        get_top_k_similarities, write_similarity_csv, write_similarity_npy)
+
+CSV_NAMES = ["Taper Hall", "Leavey Library", "Fertitta Hall", None, "Taper Hall"]
+FEATURE_NAMES = ["Fertitta Hall", "Taper Hall of Humanities", None, "Leavey Library", "Fertitta Hall"]
+
+def expected_similarities(csv_name):
+    return [0.0 if f is None else compare_strings(csv_name, f) for f in FEATURE_NAMES]
+
+def test_every_pair_is_compared(tmp_path):
+    name_similarity = NameSimilarity(CSV_NAMES, FEATURE_NAMES, threshold=None, cache_folder=tmp_path)
+    for name in ("Taper Hall", "Leavey Library", "Fertitta Hall", "Doheny Library"):
+        assert name_similarity.get_similarities(name) == pytest.approx(expected_similarities(name))
+    assert name_similarity.get_similarities("Taper Hall", [3, 1, 3]) == \
+        pytest.approx([expected_similarities("Taper Hall")[i] for i in (3, 1, 3)])
+
+def test_matrix_is_loaded_from_the_cache(tmp_path, monkeypatch):
+    first = NameSimilarity(CSV_NAMES, FEATURE_NAMES, threshold=None, cache_folder=tmp_path)
+    path = get_similarity_cache_path(["Fertitta Hall", "Leavey Library", "Taper Hall"], 
+                                     ["Fertitta Hall", "Leavey Library", "Taper Hall of Humanities"], None, tmp_path)
+    assert path.exists()
+
+    def compute_similarity_matrix(*args, **kwargs):
+        raise AssertionError("the cached matrix should be used")
+    monkeypatch.setattr(similarity, "compute_similarity_matrix", compute_similarity_matrix)
+    second = NameSimilarity(list(reversed(CSV_NAMES)), FEATURE_NAMES, threshold=None, cache_folder=tmp_path)
+    assert np.array_equal(second.matrix, first.matrix)
+
+    # Other names or another threshold are another matrix
+    with pytest.raises(AssertionError):
+        NameSimilarity(CSV_NAMES, FEATURE_NAMES, threshold=0.2, cache_folder=tmp_path)
+    with pytest.raises(AssertionError):
+        NameSimilarity(CSV_NAMES + ["Doheny Library"], FEATURE_NAMES, threshold=None, cache_folder=tmp_path)
+
+def test_damaged_cache_files_are_computed_again(tmp_path):
+    path = get_similarity_cache_path(["Taper Hall"], ["Fertitta Hall", "Taper Hall"], None, tmp_path)
+    path.write_bytes(b"not a npy file")
+    name_similarity = NameSimilarity(["Taper Hall"], ["Taper Hall", "Fertitta Hall"], threshold=None, 
+                                     cache_folder=tmp_path)
+    assert name_similarity.get_similarities("Taper Hall").tolist() == \
+        [1.0, compare_strings("Taper Hall", "Fertitta Hall")]
+    assert np.load(path).shape == (1, 2)
+
+ROW_NAMES = ["Taper Hall", "Leavey Library", "Fertitta Hall", "Doheny Library", "Seeley Mudd", "Taper Hall"]
+COL_NAMES = ["Fertitta Hall", "Taper Hall of Humanities", "Leavey Library", "Doheny Memorial Library", "Mudd Hall"]
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_blocked_outputs_match_the_full_matrix(tmp_path, jobs):
+    matrix = compute_similarity_matrix(ROW_NAMES, COL_NAMES)
+    assert matrix.tolist() == [[compare_strings(r, c) for c in COL_NAMES] for r in ROW_NAMES]
+
+    write_similarity_npy(ROW_NAMES, COL_NAMES, tmp_path / "matrix.npy", jobs=jobs, block_rows=4)
+    assert np.array_equal(np.load(tmp_path / "matrix.npy", mmap_mode="r"), matrix)
+
+    write_similarity_csv(ROW_NAMES, COL_NAMES, tmp_path / "matrix.csv", jobs=jobs, block_rows=4)
+    with open(tmp_path / "matrix.csv", newline="") as f:
+        header, *rows = csv.reader(f)
+    assert header == [""] + COL_NAMES
+    assert [row[0] for row in rows] == ROW_NAMES
+    assert np.array_equal(np.array([row[1:] for row in rows], dtype=np.float64), matrix)
+
+@pytest.mark.parametrize("k", [0, 2, 10])
+def test_top_k_keeps_the_most_similar_columns(k):
+    matrix = compute_similarity_matrix(ROW_NAMES, COL_NAMES)
+    top_cols, top_scores = get_top_k_similarities(ROW_NAMES, COL_NAMES, k, jobs=1, block_rows=4)
+    k = min(k, len(COL_NAMES))
+    assert top_cols.shape == top_scores.shape == (len(ROW_NAMES), k)
+    for row, cols, scores in zip(matrix, top_cols.tolist(), top_scores.tolist()):
+        expected = sorted(range(len(COL_NAMES)), key=lambda c: (-row[c], c))[:k]
+        assert cols == expected
+        assert scores == [row[c] for c in expected]
@@ -0,0 +1,43 @@
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from benchmark import STARTUP_BUDGET, STARTUP_COMMANDS
+
+CLI_PATH = Path(__file__).parents[1] / "src" / "cli.py"
+
+# Starts of every command, the fastest one is compared against the budget so a busy machine does not fail the test
+STARTS = 5
+
+# Libraries that are slow to import and must only be loaded once a command actually runs
+HEAVY_MODULES = ("numpy", "bs4", "geopy", "sqlite3", "exposure", "snapshot_cache", "geocode_cache")
+
+LIGHT_COMMANDS = [args for args, is_light in STARTUP_COMMANDS if is_light]
+
+def best_start(args):
+    best = None
+    for _ in range(STARTS):
+        start_time = time.perf_counter()
+        subprocess.run([sys.executable, *args], stdout=subprocess.DEVNULL, check=True)
+        seconds = time.perf_counter() - start_time
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+@pytest.fixture(scope="module")
+def python_start():
+    return best_start(["-c", "pass"])
+
+@pytest.mark.parametrize("args", LIGHT_COMMANDS, ids=" ".join)
+def test_light_commands_start_within_budget(args, python_start):
+    seconds = best_start([str(CLI_PATH), *args]) - python_start
+    assert seconds <= STARTUP_BUDGET, f"cli.py {' '.join(args)} takes {seconds*1000:.0f} ms to start"
+
+@pytest.mark.parametrize("args", LIGHT_COMMANDS, ids=" ".join)
+def test_light_commands_do_not_import_heavy_modules(args):
+    result = subprocess.run([sys.executable, "-X", "importtime", str(CLI_PATH), *args],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    imported = {line.split("|")[-1].strip() for line in result.stderr.splitlines() if line.startswith("import time:")}
+    assert imported.isdisjoint(HEAVY_MODULES), sorted(imported.intersection(HEAVY_MODULES))
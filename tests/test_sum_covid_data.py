@@ -0,0 +1,45 @@
+import pytest
+
+import sum_covid_data
+
+OUTPUT_CSV = (
+    "class_name,code,weekday,start_time,end_time,location\n"
+    "BUAD-304,14725,MW,18:00,19:50,JFFLL101\n"
+    "BUAD-305,14726,F,18:00,19:50,JFF236\n"
+    "CSCI-103,29918,TTH,9:30,10:50,SGM123\n"
+    "MATH-125,39526,MWF,12:00,12:50,office\n"
+    "PHYS-151,42617,TTH,9:05,23:59,null\n"
+)
+
+def run(tmp_path, *args):
+    path = tmp_path / "output-2022-01-31.csv"
+    path.write_text(OUTPUT_CSV)
+    output = tmp_path / "summed_covid_data.csv"
+    sum_covid_data.main([str(path), "--output", str(output), *args])
+    return sorted(output.read_text().splitlines())
+
+def test_counts_by_building_without_header(tmp_path):
+    assert run(tmp_path) == ["JFF,2", "SGM,1"]
+
+def test_header(tmp_path):
+    lines = run(tmp_path, "--header")
+    assert "building,count" in lines
+    assert len(lines) == 3
+
+def test_office_and_null_locations_have_no_building(tmp_path):
+    assert run(tmp_path, "--keep-null") == ["JFF,2", "SGM,1", "null,2"]
+
+def test_ndjson_records_without_some_keys(tmp_path):
+    path = tmp_path / "output-2022-01-31.ndjson"
+    path.write_text('{"class_name": "BUAD-304", "weekday": "MW", "location": "JFFLL101"}\n'
+                    '{"class_name": "CSCI-103", "location": "SGM123", "building_name": "Seeley Mudd"}\n')
+    output = tmp_path / "summed_covid_data.csv"
+    sum_covid_data.main([str(path), "--output", str(output), "--by", "building,weekday", "--keep-null"])
+    assert sorted(output.read_text().splitlines()) == ["JFF,M,1", "JFF,W,1", "SGM,null,1"]
+
+@pytest.mark.parametrize("bucket", ["0", "-30"])
+def test_bucket_must_be_positive(tmp_path, capsys, bucket):
+    with pytest.raises(SystemExit):
+        run(tmp_path, "--by", "time", "--bucket", bucket)
+    assert "--bucket must be a positive number of minutes" in capsys.readouterr().err
+    assert not (tmp_path / "summed_covid_data.csv").exists()